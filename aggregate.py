@@ -0,0 +1,138 @@
+"""
+Aggregate mode (@@AGGREGATE): a reference file against the spread of a whole set of others.
+
+For systematics sweeps, where a baseline gets compared with 50-100 FITOPTs, overlaying every file is
+unreadable and holding all their tables at once doesn't fit in memory. Instead, each file in the set is
+read, cut and binned on its own (in parallel with @@JOBS), and all that's kept of it is its counts and
+binned medians, which are a few numbers per bin. So the memory used doesn't depend on how many files
+there are. With @@STREAM, each file is also read a chunk at a time (see streaming.py).
+
+The plot shows the reference as usual, with the spread of the set around it: the range from the lowest
+to the highest file in each bin, the @@ENVELOPE percentiles across the files, and their median. For
+histograms that's the counts (normalised to the reference, as usual), for 2D plots the binned medians of
+y, and with @@DIFF ALL the reference's binned medians minus each file's (the same way round as @@DIFF ALL
+on its own).
+"""
+import glob
+import warnings
+import numpy as np
+
+import loader
+import streaming
+import histograms
+import plots
+import profiling
+
+ENVELOPE = [16., 84.] #Percentiles across the files shaded around the reference
+
+
+def expand(patterns, exclude=()):
+    """The files matching the glob patterns, in order and only once each, leaving out those in exclude."""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            print("Nothing matches", pattern)
+        files += [l for l in matches if l not in files and l not in exclude]
+    return files
+
+
+def binned_result(k, plotdic, bins, name=None):
+    """{'n': rows, 'counts': per bin, 'median': median y per bin (2D plots)} of a loaded file or StreamSummary."""
+    with profiling.stage('binning', name):
+        binned = streaming.binned(k, bins)
+        out = {'n': streaming.count(k), 'counts': binned.hist_counts()}
+        if len(plotdic) == 2: out['median'] = binned.binned_median()
+    return out
+
+
+def _load(filename, plotdic, CUT=None, STREAM=0, ACCURACY=streaming.sketches.ACCURACY, YRANGE=None, NROWS=0, GZTHREADS=0, bins=None, **cacheargs):
+    """filename as a compact.PlotData, or with STREAM a StreamSummary (which needs the bins, and YRANGE for 2D plots)."""
+    if STREAM:
+        return streaming.summarise(filename, plotdic, bins, NPOINTS=0, ACCURACY=ACCURACY, YRANGE=YRANGE, CUT=CUT, NROWS=NROWS, CHUNKSIZE=STREAM,
+                                   GZTHREADS=GZTHREADS)
+    return loader.load_fitres(filename, plotdic, CUT, None, NROWS, GZTHREADS=GZTHREADS, COMPACT=True, **cacheargs)
+
+
+def file_result(filename, plotdic, bins, **kwargs):
+    """
+    binned_result of filename, or None if it couldn't be read. Nothing else of the file is kept. kwargs are
+    the options of aggregate().
+    """
+    try:
+        k = _load(filename, plotdic, bins=bins, **kwargs)
+    except (OSError, ValueError, AttributeError) as e: #One broken FITOPT shouldn't sink the whole sweep
+        print("Leaving out", filename.split("/")[-1]+":", e)
+        return None
+    return binned_result(k, plotdic, bins, filename)
+
+
+def aggregate(reference, files, plotdic, boundsdic, JOBS=1, ENVELOPE=ENVELOPE, **kwargs):
+    """
+    The binned results of reference and of every file in files. Returns a dictionary of the bins, the
+    reference's result, and for 'counts' (normalised to the reference) and in 2D 'median', the results of
+    the files that could be read as a 2D array ('values', one row per file) and their envelope: 'min',
+    'max', 'low' and 'high' (the ENVELOPE percentiles) and 'median'.
+    kwargs are CUT, STREAM, ACCURACY, NROWS, GZTHREADS, and the cache options, SAMPLE, SEED and THREADS of loader.load_fitres.
+    Loose bounds come from the reference, and its range gets added to boundsdic. With STREAM, so does the range of y
+    for the sketches of every file, so they all have the same buckets.
+    """
+    STREAM = kwargs.get('STREAM', 0)
+    k = None
+    if STREAM and ('x' not in boundsdic or len(plotdic) == 2):
+        ranges = streaming.scan_ranges(reference, plotdic, CUT=kwargs.get('CUT'), NROWS=kwargs.get('NROWS', 0), CHUNKSIZE=STREAM,
+                                       GZTHREADS=kwargs.get('GZTHREADS', 0))
+        if 'x' not in boundsdic: boundsdic['ref_min'], boundsdic['ref_max'] = ranges['x']
+        if len(plotdic) == 2: kwargs['YRANGE'] = ranges.get('y', [0., 1.])
+    elif 'x' not in boundsdic:
+        k = _load(reference, plotdic, **kwargs)
+        boundsdic['ref_min'], boundsdic['ref_max'] = np.amin(k.x), np.amax(k.x)
+    bins = plots.get_bins(boundsdic)
+    ref = binned_result(k if k is not None else _load(reference, plotdic, bins=bins, **kwargs), plotdic, bins, reference)
+    del k
+    results = [r for r in loader.run_parallel(file_result, [(l, plotdic, bins) for l in files], JOBS, **kwargs) if r is not None]
+    out = {'bins': bins, 'reference': ref, 'nfiles': len(results)}
+    for key in ['counts'] + (['median'] if len(plotdic) == 2 else []):
+        values = np.array([r[key] for r in results]).reshape(len(results), len(bins) - 1)
+        if key == 'counts': #Same normalisation as the histograms of plotter_func
+            total = values.sum(axis=1, keepdims=True)
+            values = np.where(total > 0, values*ref['counts'].sum()/np.maximum(total, 1), np.nan)
+        out[key] = envelope(values, ENVELOPE)
+    return out
+
+
+def envelope(values, ENVELOPE=ENVELOPE):
+    """values (one row per file) and their 'min', 'max', 'low' and 'high' (the ENVELOPE percentiles) and 'median' in each bin."""
+    spread = values if len(values) else np.full((1, values.shape[1]), np.nan)
+    with warnings.catch_warnings(): #Bins that are empty in every file are just NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanpercentile(spread, ENVELOPE, axis=0)
+        return {'values': values, 'min': np.nanmin(spread, axis=0), 'max': np.nanmax(spread, axis=0),
+                'low': low, 'high': high, 'median': np.nanmedian(spread, axis=0)}
+
+
+def draw(result, plotdic, refname, CUT=None, DIFF=None, ENVELOPE=ENVELOPE):
+    """Draws the reference and the envelope of the set from aggregate() on the current figure."""
+    import matplotlib.pyplot as plt
+    bins = result['bins']
+    centres = (bins[1:] + bins[:-1])/2.
+    ref = result['reference']
+    n = result['nfiles']
+    if len(plotdic) == 1:
+        env = result['counts']
+        errl, erru = histograms.poisson_interval(ref['counts'])
+        plt.errorbar(centres, ref['counts'], yerr=[ref['counts']-errl, erru-ref['counts']], label=refname, fmt='o', color='k', zorder=10)
+    elif DIFF == 'ALL': #Reference minus each file, the same way round as DIFF ALL in plotter_func
+        env = envelope(ref['median'] - result['median']['values'], ENVELOPE)
+        plt.axhline(0, color='k', label=refname)
+    else:
+        env = result['median']
+        plt.scatter(centres, ref['median'], label=refname+" median", marker="^", color='k', zorder=10)
+    plt.fill_between(centres, env['min'], env['max'], alpha=0.15, color='C0', label="%d files min-max" % n)
+    plt.fill_between(centres, env['low'], env['high'], alpha=0.35, color='C0', label="%g-%g%%" % tuple(ENVELOPE))
+    plt.plot(centres, env['median'], color='C0', ls='--', label="Median of the %d files" % n)
+    plt.xlabel(plotdic['x'])
+    if len(plotdic) == 2:
+        plt.ylabel(plotdic['y'] + (" diff" if DIFF == 'ALL' else " median"))
+    plt.legend()
+    if CUT: plt.title(CUT)
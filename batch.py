@@ -0,0 +1,182 @@
+"""
+Batch mode (@@BATCH): many plots from one run, each FITRES file read only once.
+
+The spec file has one plot per line, written with the same @@ options as the command line, eg,
+
+    # z vs Tripp residual, and the stretch distribution of the low-z surveys
+    @@VARIABLE df.zHD:df.mB - 3.1*df.c + 0.16*df.x1 - df.MU @@SAVE hubble.png
+    @@VARIABLE df.x1 @@CUT "df.loc[df.IDSURVEY < 15]" @@SAVE x1_lowz.pdf
+
+Anything a line doesn't set is taken from the command line, so @@FITRES (and @@ALPHA, @@BOUNDS, ...)
+can be given once for every plot. Each file is read with the union of the columns all its plots need,
+without any cut. Then every plot applies its own cut and evaluates its own expressions on that table, and
+is drawn with the non-interactive Agg backend straight to its @@SAVE file. With @@JOBS the plots are
+drawn that many at a time in worker processes, which get the tables by forking rather than copying them.
+"""
+import copy
+import multiprocessing
+import shlex
+
+import matplotlib.pyplot as plt
+
+import loader
+import expressions
+import plots
+import profiling
+import rowindex
+import stats
+
+_TABLES = {} #filename: dataframe of everything the plots need from it. Module level so forked workers see it
+_SPECS = []
+
+
+def _join(value):
+    return ''.join([str(elem) for elem in value]) if value else value
+
+
+def parse_spec(argv, parser, args):
+    """The options for one plot from a list of @@ arguments, as an argparse namespace. Defaults come from args."""
+    spec = parser.parse_args(argv, namespace=copy.copy(args))
+    spec.BATCH = None
+    spec.VARIABLE = _join(spec.VARIABLE)
+    spec.CUT = _join(spec.CUT)
+    if spec.DIFF: spec.DIFF = spec.DIFF.strip()
+    return spec
+
+
+def read_specs(specfile, parser, args):
+    """The options for every plot in specfile, as argparse namespaces. Defaults come from args."""
+    specs = []
+    with open(specfile) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                spec = parse_spec(shlex.split(line), parser, args)
+            except SystemExit: #argparse has already said what's wrong with it
+                print("Skipping this line of", specfile+":", line)
+                continue
+            if spec.SAVE == 'None' and not spec.STATS: #@@STATS without @@SAVE get printed
+                spec.SAVE = 'plot'+str(len(specs))+'.png'
+            specs.append(spec)
+    return specs
+
+
+def check(spec):
+    """Parses and compiles the expressions and @@BOUNDS of spec, raising expressions.ExpressionError if they're not allowed."""
+    if not spec.VARIABLE or not spec.FITRES:
+        raise expressions.ExpressionError("Every plot needs @@FITRES and @@VARIABLE")
+    for VAR in plots.parse_variable(spec.VARIABLE).values(): expressions.compile_expr(VAR)
+    if spec.CUT: expressions.compile_cut(spec.CUT)
+    try:
+        plots.parse_bounds(spec.BOUNDS)
+    except ValueError as e:
+        raise expressions.ExpressionError(str(e))
+
+
+def load_tables(specs, args):
+    """Reads every file the specs use once, with all the columns any of them needs. Returns {filename: dataframe}."""
+    needs = {}
+    for spec in specs:
+        for l in spec.FITRES:
+            exprs, diffs = needs.setdefault(l, ([], set()))
+            exprs += list(plots.parse_variable(spec.VARIABLE).values()) + [spec.CUT]
+            diffs.add(spec.DIFF)
+    filenames = list(needs)
+    DIFFS = [('CID' if 'CID' in needs[l][1] else 'ALL' if any(needs[l][1]) else None) for l in filenames]
+    tables = loader.run_parallel(loader.read_table, [(l, needs[l][0], None, DIFF) for l, DIFF in zip(filenames, DIFFS)],
+                                 args.JOBS, NROWS=args.NROWS, USECACHE=not args.NOCACHE, CACHEDIR=args.CACHEDIR,
+                                 CACHESIZE=args.CACHESIZE, GZTHREADS=args.GZTHREADS, COMPACT=args.COMPACT, THREADS=args.THREADS)
+    return {l: df for l, (df, cutdone) in zip(filenames, tables)}
+
+
+def render(spec, tables=_TABLES, out=None, text=None):
+    """
+    Draws the plot for one spec from tables ({filename: dataframe}) and saves it to out, a filename or file
+    object (spec.SAVE by default). Returns an error message, or None if it worked.
+    With @@STATS nothing is drawn, and the statistics (see stats.py) go to text, a file object, or by
+    default to the spec.SAVE file if there is one, and stdout if not.
+    """
+    plotdic = plots.parse_variable(spec.VARIABLE)
+    boundsdic = plots.parse_bounds(spec.BOUNDS)
+    MASTERLIST = {}
+    try:
+        for keyname, l in zip(plots.get_keynames(spec.FITRES), spec.FITRES):
+            df = tables[l]
+            if spec.NROWS != 0: df = df.head(spec.NROWS)
+            if spec.SAMPLE: df = df.take(rowindex.sample_rows(len(df), spec.SAMPLE, spec.SEED))
+            df = loader.plot_values(df, plotdic, spec.CUT, keyname, spec.COMPACT, spec.DIFF)
+            if not spec.COMPACT: df['name'] = keyname
+            MASTERLIST[keyname] = df
+            if 'x' not in boundsdic:
+                boundsdic[keyname+"_min"] = df['x_plot_val'].min()
+                boundsdic[keyname+"_max"] = df['x_plot_val'].max()
+        if spec.STATS:
+            with profiling.stage('stats'):
+                if text is None and spec.SAVE != 'None':
+                    with open(spec.SAVE, 'w') as f:
+                        stats.report(MASTERLIST, plotdic, boundsdic, spec.CUT, spec.STATS, file=f, ERRORS=spec.ERRORS, SEED=spec.SEED)
+                else:
+                    stats.report(MASTERLIST, plotdic, boundsdic, spec.CUT, spec.STATS, file=text, ERRORS=spec.ERRORS, SEED=spec.SEED)
+            return None
+        fig = plt.figure()
+        try:
+            plots.plotter_func(MASTERLIST, spec.DIFF, plotdic, boundsdic, spec.CUT, spec.ALPHA, spec.BANDS, spec.RASTER, spec.CONTOUR,
+                                spec.ERRORS, spec.SEED)
+            with profiling.stage('savefig', spec.SAVE):
+                fig.savefig(spec.SAVE if out is None else out, bbox_inches="tight", format=spec.SAVE.split(".")[-1])
+        finally:
+            plt.close(fig)
+    except AttributeError:
+        return "One of the things you are trying to plot is not present in one or more of the files!"
+    except SystemExit: #plotter_func quits on options that don't go together
+        return "Those options don't work together."
+    except Exception as e: #One bad line shouldn't stop the plots after it
+        return "Something went wrong: " + repr(e)
+    return None
+
+
+def _render(i, profile=None):
+    """Draws plot i, in a worker process if profile isn't None, in which case its @@PROFILE stages get sent back too."""
+    if profile is None:
+        return _SPECS[i].SAVE, render(_SPECS[i]), []
+    profiling.start(**profile)
+    try:
+        error = render(_SPECS[i])
+    finally:
+        records = profiling.stop()
+    return _SPECS[i].SAVE, error, records
+
+
+def run(specfile, parser, args):
+    """Makes every plot in specfile. args is the parsed command line, which fills in whatever a line leaves out."""
+    plt.switch_backend('Agg') #Nothing gets shown, so there's no need for a display
+    specs = []
+    for n, spec in enumerate(read_specs(specfile, parser, args)):
+        try:
+            check(spec)
+            specs.append(spec)
+        except expressions.ExpressionError as e:
+            print("Skipping plot", n, "in", specfile, "- couldn't process this command!", e)
+    if not specs:
+        print("Nothing to plot in", specfile)
+        return
+    if any(spec.STREAM for spec in specs):
+        print("@@STREAM doesn't work with @@BATCH, reading the files whole.")
+    _TABLES.update(load_tables(specs, args))
+    print("Done loading all files! Plotting", len(specs), "plots now.")
+
+    _SPECS[:] = specs
+    if args.JOBS > 1 and len(specs) > 1:
+        profile = dict(memory=profiling.MEMORY) if profiling.ENABLED else None
+        with multiprocessing.get_context('fork').Pool(min(args.JOBS, len(specs))) as pool:
+            results = pool.starmap(_render, [(i, profile) for i in range(len(specs))])
+    else:
+        results = [_render(i) for i in range(len(specs))]
+    for SAVE, error, records in results:
+        profiling.add(records)
+        if error:
+            print("Couldn't make", (SAVE if SAVE != 'None' else "the statistics")+":", error)
+        elif SAVE != 'None':
+            print("Saved", SAVE)
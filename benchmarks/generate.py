@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Makes synthetic FITRES files for the benchmarks.
+
+The files look like the output of a SALT2 fit: a short header with NVAR and VARNAMES, then one SN: row
+per supernova with the usual columns (CID, IDSURVEY, zHD, mB, x1, c, MU, their errors, ...). The
+values are drawn to look roughly right, eg, mB follows a flat LCDM distance modulus plus the Tripp
+terms and some scatter, so cuts and medians behave like they would on real fits.
+
+A 'variant' file has the same supernovae as the normal one with the same seed, minus about 10% of
+them and with slightly shifted mB, c and x1, like a second FITOPT. That's what @@DIFF CID gets
+benchmarked on. A 'mixed' file has a FIELD of 10 (a number) in its first 80% of rows and the survey's
+field name after that, for checking columns with both numbers and text in them.
+
+    python benchmarks/generate.py 1e6 out.FITRES
+    python benchmarks/generate.py 1e7 out.FITRES.gz --variant --seed 3
+"""
+import os
+import gzip
+import argparse
+import numpy as np
+import pandas as pd
+
+#Column name and how it's written out
+COLUMNS = [('CID', '%d'), ('IDSURVEY', '%d'), ('TYPE', '%d'), ('FIELD', '%s'), ('zHD', '%.5f'), ('zHDERR', '%.6f'),
+           ('PKMJD', '%.3f'), ('x1', '%.4f'), ('x1ERR', '%.4f'), ('c', '%.4f'), ('cERR', '%.4f'), ('mB', '%.4f'),
+           ('mBERR', '%.4f'), ('MU', '%.4f'), ('MUERR', '%.4f'), ('HOST_LOGMASS', '%.3f'), ('FITPROB', '%.4f')]
+SURVEYS = np.array([1, 4, 5, 10, 15, 150]) #SDSS, SNLS, CSP, DES, PS1, Foundation
+WEIGHTS = np.array([0.15, 0.15, 0.05, 0.4, 0.2, 0.05])
+FIELDS = np.array(['NONE', 'C3', 'X3', 'E2', 'S1', 'MDF01'])
+CHUNK = 1000000 #Rows generated and written at a time
+
+
+def distmod(z, H0=70., Om=0.3):
+    """Flat LCDM distance modulus, from a table of the comoving distance."""
+    grid = np.linspace(0, max(np.max(z), 1e-3)*1.01, 2000)
+    inv = 1/np.sqrt(Om*(1 + grid)**3 + 1 - Om)
+    dc = np.concatenate([[0], np.cumsum((inv[1:] + inv[:-1])/2*np.diff(grid))])*299792.458/H0
+    return 5*np.log10((1 + z)*np.interp(z, grid, dc)) + 25
+
+
+def chunk(rng, start, n, variant=None):
+    """A dataframe of n supernovae, with CIDs starting at start. variant is a second generator for the shifted copy."""
+    cid = start + rng.permutation(n)
+    survey = rng.choice(SURVEYS, size=n, p=WEIGHTS)
+    z = np.clip(rng.gamma(2.5, 0.16, n), 0.01, 2.3)
+    x1 = rng.normal(0, 1, n)
+    c = rng.normal(-0.02, 0.09, n)
+    mu = distmod(z)
+    mb = mu - 19.36 - 0.14*x1 + 3.1*c + rng.normal(0, 0.12, n)
+    df = pd.DataFrame({
+        'CID': cid, 'IDSURVEY': survey, 'TYPE': np.where(rng.random(n) < 0.9, 1, 120),
+        'FIELD': FIELDS[np.searchsorted(SURVEYS, survey)], 'zHD': z, 'zHDERR': rng.uniform(1e-5, 1e-3, n),
+        'PKMJD': rng.uniform(53000, 59000, n), 'x1': x1, 'x1ERR': rng.gamma(2, 0.08, n), 'c': c, 'cERR': rng.gamma(2, 0.015, n),
+        'mB': mb, 'mBERR': rng.gamma(2, 0.02, n), 'MU': mu + rng.normal(0, 0.15, n), 'MUERR': rng.gamma(3, 0.05, n),
+        'HOST_LOGMASS': rng.normal(10, 0.7, n), 'FITPROB': rng.random(n)})
+    if variant is not None:
+        df = df[variant.random(n) > 0.1].copy()
+        df['mB'] += variant.normal(0.01, 0.02, len(df))
+        df['c'] += variant.normal(0, 0.005, len(df))
+        df['x1'] += variant.normal(0, 0.05, len(df))
+    return df
+
+
+def rows(df):
+    """The SN: lines for df. %-formatting whole rows is a few times quicker than df.to_csv."""
+    fmt = 'SN: ' + ' '.join(f for name, f in COLUMNS) + '\n'
+    return ''.join(map(fmt.__mod__, zip(*[df[name].tolist() for name, f in COLUMNS])))
+
+
+def generate(filename, nrows, seed=0, variant=False, compresslevel=1, mixed=False):
+    """Writes a FITRES with nrows supernovae (fewer for a variant) to filename, gzipped if it ends in .gz."""
+    rng = np.random.default_rng(seed)
+    other = np.random.default_rng(seed + 1000) if variant else None
+    opener = (lambda f: gzip.open(f, 'wt', compresslevel=compresslevel)) if filename.endswith('.gz') else (lambda f: open(f, 'w'))
+    tmp = filename + '.tmp'
+    with opener(tmp) as fp:
+        fp.write("# Synthetic FITRES made by benchmarks/generate.py\n")
+        fp.write("NVAR: %d\n" % len(COLUMNS))
+        fp.write("VARNAMES: " + " ".join(name for name, f in COLUMNS) + "\n")
+        for start in range(0, int(nrows), CHUNK):
+            df = chunk(rng, 1000000 + start, min(CHUNK, int(nrows) - start), other)
+            if mixed: df['FIELD'] = np.where(start + np.arange(len(df)) < 0.8*nrows, '10', df['FIELD'])
+            fp.write(rows(df))
+    os.replace(tmp, filename)
+    return filename
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('nrows', type=float, help="Number of supernovae, eg, 1e6")
+    parser.add_argument('filename', help="Where to write it. Ending it in .gz gzips it.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--variant', action='store_true', help="Make the shifted copy (second FITOPT) of the file with this seed")
+    parser.add_argument('--mixed', action='store_true', help="Make FIELD a number in most rows and text in the rest")
+    args = parser.parse_args()
+    generate(args.filename, int(args.nrows), args.seed, args.variant, mixed=args.mixed)
+    print("Wrote", args.filename)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Times each stage of making a plot, on synthetic FITRES files, and records the results.
+
+    python benchmarks/run.py                          #1e4, 1e5 and 1e6 rows, plain and gzipped
+    python benchmarks/run.py --sizes 1e7 1e8 --repeat 1 --nogz
+    python benchmarks/run.py --compare a0eb0bd HEAD   #Stage by stage, the latest results of two commits
+    python benchmarks/run.py --check                  #Just check the parser gives the same dataframes as pd.read_csv (mixed types too)
+
+The files (and a 'variant' of each for @@DIFF CID, see generate.py) are made the first time they're
+needed, in benchmarks/data. Every run adds a line per file to benchmarks/data/results.jsonl with the commit,
+the machine, the library versions and the best time of each stage out of --repeat, so results can be
+compared across commits later on, without having to check anything out again.
+
+The stages follow what plotter-class.py does with each file, for a z vs Hubble residual plot with a cut:
+    header         open_fitres: work out the compression and read the header up to the first row
+    parse          read_body of just the columns the plot needs
+    parse_all      read_body of every column
+    parse_threads  read_body of the same columns in --threads threads (checked against parse)
+    cache_store    putting the parsed columns in the FITRES cache
+    cache_load     getting them back out of it
+    cut            the @@CUT
+    expr           the @@VARIABLE x and y
+    join           matching CIDs (and surveys) with the variant file, for @@DIFF CID
+    binning        counts, Poisson errors, binned medians and 16/84% bands
+    render         plotter_func and savefig to a png
+"""
+import os
+import io
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import generate
+import fitres_reader
+import fitres_cache
+import expressions
+import cidjoin
+import histograms
+import plots
+
+VARIABLE = "df.zHD:df.mB - 3.1*df.c + 0.14*df.x1 - df.MU"
+CUT = "df.loc[(df.IDSURVEY != 150) & (df.FITPROB > 0.01)]"
+MIXED_CUT = "df.loc[(df.FIELD.astype('str') == '10') & (df.FITPROB > 0.01)]" #For the mixed file, where FIELD is 10 in some rows and text in others
+MIXED_ROWS = 100000 #Several of pandas' pieces, so FIELD comes out as ints in some rows and strings in others
+STAGES = ['header', 'parse', 'parse_all', 'parse_threads', 'cache_store', 'cache_load', 'cut', 'expr', 'join', 'binning', 'render']
+SIZES = [1e4, 1e5, 1e6]
+DATA = os.path.join(HERE, 'data')
+RESULTS = os.path.join(DATA, 'results.jsonl') #Next to the files, out of git
+
+
+def git(*args):
+    try:
+        return subprocess.run(['git'] + list(args), cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def datafile(data, nrows, gz, variant=False, mixed=False):
+    """The synthetic file with nrows rows, made if it isn't there yet."""
+    name = "bench_%d%s.FITRES%s" % (nrows, "_variant" if variant else "_mixed" if mixed else "", ".gz" if gz else "")
+    filename = os.path.join(data, name)
+    if not os.path.exists(filename):
+        os.makedirs(data, exist_ok=True)
+        print("Generating", name, "...")
+        generate.generate(filename, nrows, seed=0, variant=variant, mixed=mixed)
+    return filename
+
+
+def timed(func, repeat):
+    """Best time of func() out of repeat, and what it returned the last time."""
+    best = np.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        out = func()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def header(filename):
+    names, body = fitres_reader.open_fitres(filename)
+    body.close()
+    return names
+
+
+def original(filename, names, columns=None):
+    """filename parsed the way plotter-class.py always did, with one pd.read_csv of the whole file."""
+    with fitres_reader.open_raw(filename) as fp:
+        skip = next(i for i, line in enumerate(fp) if line.startswith(fitres_reader.DATA_PREFIXES))
+    return pd.read_csv(filename, header=None, skiprows=skip, names=names, usecols=columns, sep=r"\s+", skip_blank_lines=True, comment='#')
+
+
+def check_threads(filename, workers, CUT=CUT):
+    """
+    Raises AssertionError unless parsing filename in workers threads (and in one, with the cut) gives exactly
+    the same dataframe (values, types and row numbers) as the original pd.read_csv, for every column and the
+    plotted ones, with and without the cut. Small blocks as well as the default ones, so even small files get split up.
+    """
+    names = header(filename)
+    plotted = expressions.project(expressions.referenced_columns([VARIABLE, CUT, 'df.CID']), names, ('IDSURVEY',))
+    for columns in (None, plotted):
+        whole = original(filename, names, columns)
+        for cut in (None, CUT):
+            expected = expressions.compile_cut(cut)(whole) if cut else whole
+            got = fitres_reader.read_body(fitres_reader.open_fitres(filename)[1], names, columns, cut)
+            pd.testing.assert_frame_equal(got, expected, check_exact=True, check_index_type=True)
+            for blocksize in (fitres_reader.BLOCKSIZE, 1 << 16):
+                got = fitres_reader.read_parallel(fitres_reader.open_fitres(filename)[1], names, columns, cut, workers, blocksize)
+                pd.testing.assert_frame_equal(got, expected, check_exact=True, check_index_type=True)
+
+
+def render(frame, boundsdic, plotdic):
+    import matplotlib.pyplot as plt
+    fig = plt.figure()
+    plots.plotter_func({'bench': frame}, None, plotdic, boundsdic, CUT, 0.3, BANDS=True)
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close(fig)
+
+
+def bench(filename, variant, repeat=3, stages=STAGES, workers=fitres_reader.WORKERS):
+    """Time of each of the stages on filename, in seconds. variant is the file the CIDs are matched against."""
+    plotdic = plots.parse_variable(VARIABLE)
+    times = {}
+    names = header(filename)
+    columns = expressions.project(expressions.referenced_columns(list(plotdic.values()) + [CUT, 'df.CID']), names, ('IDSURVEY',))
+    parse = lambda cols, workers=1: fitres_reader.read_body(fitres_reader.open_fitres(filename)[1], names, cols, workers=workers)
+
+    if 'header' in stages: times['header'], names = timed(lambda: header(filename), repeat)
+    t, df = timed(lambda: parse(columns), repeat)
+    if 'parse' in stages: times['parse'] = t
+    if 'parse_all' in stages: times['parse_all'], _ = timed(lambda: parse(None), repeat)
+    if 'parse_threads' in stages:
+        times['parse_threads'], threaded = timed(lambda: parse(columns, workers), repeat)
+        pd.testing.assert_frame_equal(threaded, df, check_exact=True) #Only quicker if it's the same
+    if 'cache_store' in stages or 'cache_load' in stages:
+        cachedir = tempfile.mkdtemp(prefix='benchcache')
+        try:
+            def store():
+                fitres_cache.clear(cachedir)
+                fitres_cache.store(filename, df, names, cachedir)
+            times['cache_store'], _ = timed(store, repeat)
+            load = lambda: fitres_cache.load_cached(filename, cachedir, columns).copy() #copy so the columns actually get read
+            times['cache_load'], _ = timed(load, repeat)
+        finally:
+            shutil.rmtree(cachedir, ignore_errors=True)
+    t, cut = timed(lambda: expressions.compile_cut(CUT)(df), repeat)
+    if 'cut' in stages: times['cut'] = t
+    exprs = lambda: [np.asarray(expressions.compile_expr(plotdic[k])(cut)) for k in ('x', 'y')]
+    t, (x, y) = timed(exprs, repeat)
+    if 'expr' in stages: times['expr'] = t
+    if 'join' in stages:
+        other = fitres_reader.read_fitres(variant, ['CID', 'IDSURVEY'])[1]
+        times['join'], _ = timed(lambda: cidjoin.CIDJoin(df['CID'], df['IDSURVEY']).match(other['CID'], other['IDSURVEY']), repeat)
+    boundsdic = {'bench_min': np.amin(x), 'bench_max': np.amax(x)}
+    bins = plots.get_bins(boundsdic)
+    def binning():
+        binned = histograms.BinnedData(x, bins, y)
+        histograms.poisson_interval(binned.hist_counts())
+        return binned.binned_median(), binned.binned_quantile(0.16), binned.binned_quantile(0.84)
+    if 'binning' in stages: times['binning'], _ = timed(binning, repeat)
+    if 'render' in stages:
+        frame = pd.DataFrame({'x_plot_val': x, 'y_plot_val': y})
+        times['render'], _ = timed(lambda: render(frame, boundsdic, plotdic), repeat)
+    return times
+
+
+def record(results, filename, nrows, gz, times):
+    entry = {'commit': git('rev-parse', '--short', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+             'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'host': socket.gethostname(), 'cpus': os.cpu_count(),
+             'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+             'rows': int(nrows), 'gzip': gz, 'bytes': os.path.getsize(filename), 'stages': times}
+    os.makedirs(os.path.dirname(os.path.abspath(results)), exist_ok=True)
+    with open(results, 'a') as fp:
+        fp.write(json.dumps(entry) + "\n")
+
+
+def compare(results, old, new):
+    """Prints the latest results of commits old and new side by side."""
+    old, new = git('rev-parse', '--short', old) or old, git('rev-parse', '--short', new) or new
+    latest = {}
+    with open(results) as fp:
+        for line in fp:
+            entry = json.loads(line)
+            for commit in (old, new):
+                if entry['commit'].startswith(commit) or commit.startswith(entry['commit']):
+                    latest[(commit, entry['rows'], entry['gzip'])] = entry
+    print("%-12s %-6s %-14s %10s %10s %8s" % ('rows', 'gzip', 'stage', old, new, 'new/old'))
+    for rows, gz in sorted({(r, g) for c, r, g in latest}):
+        a, b = latest.get((old, rows, gz)), latest.get((new, rows, gz))
+        if a is None or b is None:
+            continue
+        for stage in STAGES:
+            if stage in a['stages'] and stage in b['stages']:
+                ta, tb = a['stages'][stage], b['stages'][stage]
+                print("%-12d %-6s %-14s %10.4f %10.4f %8.2f" % (rows, gz, stage, ta, tb, tb/ta if ta else np.nan))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=SIZES, help="Numbers of rows, eg, 1e4 1e6 1e8")
+    parser.add_argument('--nogz', action='store_true', help="Only the plain files")
+    parser.add_argument('--onlygz', action='store_true', help="Only the gzipped files")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs of each stage, the best one is kept")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--data', default=DATA, help="Where the synthetic files go")
+    parser.add_argument('--results', default=RESULTS, help="File the results get added to")
+    parser.add_argument('--threads', type=int, default=fitres_reader.WORKERS, help="Threads for parse_threads, default is the number of cores")
+    parser.add_argument('--check', action='store_true', help="Only check the threaded parser gives the same dataframes as pandas, don't time anything")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare the recorded results of two commits instead of running")
+    args = parser.parse_args()
+    if args.compare:
+        compare(args.results, *args.compare)
+        sys.exit(0)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    compressions = [False] if args.nogz else [True] if args.onlygz else [False, True]
+    if args.check: #A column with numbers in some blocks and text in others, which the synthetic files don't have otherwise
+        filename = datafile(args.data, MIXED_ROWS, False, mixed=True)
+        print("Checking", os.path.basename(filename), "with", max(2, args.threads), "threads ...")
+        check_threads(filename, max(2, args.threads), MIXED_CUT)
+    for nrows in args.sizes:
+        for gz in compressions:
+            filename = datafile(args.data, int(nrows), gz)
+            variant = datafile(args.data, int(nrows), gz, variant=True)
+            if args.check:
+                print("Checking", os.path.basename(filename), "with", max(2, args.threads), "threads ...")
+                check_threads(filename, max(2, args.threads))
+                continue
+            print("Benchmarking", os.path.basename(filename), "...")
+            times = bench(filename, variant, args.repeat, args.stages, args.threads)
+            for stage in STAGES:
+                if stage in times: print("    %-14s %9.4f s" % (stage, times[stage]))
+            record(args.results, filename, nrows, gz, times)
+    print("All the same." if args.check else "Results added to " + args.results)
@@ -0,0 +1,99 @@
+"""
+Matching up the same supernovae in different FITRES files, for @@DIFF CID.
+
+The reference (first) file's CIDs are turned into integer keys and hashed once. Every other file
+is then looked up in that, which gives the row numbers of the pairs, and only the plotted x and y
+values are ever pulled out with them. That's much quicker than a pandas
+join, which rebuilds an index and drags every column along for each file.
+
+CIDs that are all whole numbers are used as they are. Anything else (names like '2011fe') is
+factorized, using the reference file's list of names for all the other files too. CIDs are only
+unique within a survey, so when both files have IDSURVEY, a match needs both to be the same.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _integer(values):
+    """values as int64 if they're all whole numbers, otherwise None."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int64)
+    if values.dtype.kind == 'f' and np.all(np.isfinite(values)) and np.all(values == np.round(values)):
+        return values.astype(np.int64)
+    if values.dtype.kind in 'OUS':
+        try:
+            return _integer(pd.to_numeric(values))
+        except (ValueError, TypeError):
+            return None
+    return None
+
+
+class CIDJoin:
+    """The sorted keys of the reference file. match() pairs up the rows of any other file with it."""
+    def __init__(self, cid, survey=None):
+        self.cid = np.asarray(cid)
+        self.survey = np.asarray(survey) if survey is not None else None
+        self._build(_integer(self.cid))
+
+    def _build(self, keys):
+        self.names = None
+        if keys is None:
+            keys, names = pd.factorize(self.cid.astype(str))
+            keys = keys.astype(np.int64)
+            self.names = pd.Index(names)
+        self.surveys = None
+        if self.survey is not None:
+            codes, surveys = pd.factorize(self.survey)
+            self.surveys = pd.Index(surveys)
+            keys = keys*len(self.surveys) + codes
+        self.index = pd.Index(keys) #Hash table of the keys
+        self.unique = self.index.is_unique
+        self.sorted = None
+        if not self.unique: #Repeated CIDs need every combination, which is easier from sorted keys
+            self.order = np.argsort(keys, kind='stable')
+            self.sorted = keys[self.order]
+
+    def keys(self, cid, survey=None):
+        """The keys for another file's CIDs (and surveys), and which of them could match at all."""
+        good = np.ones(len(cid), dtype=bool)
+        keys = _integer(cid) if self.names is None else None
+        if keys is None:
+            if self.names is None: #This file's CIDs aren't numbers but the reference's were, so compare them all as text
+                self._build(None)
+            keys = self.names.get_indexer(np.asarray(cid).astype(str)).astype(np.int64)
+            good &= keys >= 0
+        if self.surveys is not None:
+            if survey is None:
+                raise ValueError("Both files need IDSURVEY to match CIDs by survey")
+            codes = self.surveys.get_indexer(np.asarray(survey))
+            good &= codes >= 0
+            keys = keys*len(self.surveys) + codes
+        return keys, good
+
+    def match(self, cid, survey=None):
+        """
+        Row numbers (reference, other) of every pair with the same CID. Like an inner join, the pairs are
+        in the order of the reference file, and a CID that appears more than once gives every combination.
+        """
+        keys, good = self.keys(cid, survey)
+        if self.unique:
+            ref = self.index.get_indexer(keys)
+            ref[~good] = -1
+            other = np.nonzero(ref >= 0)[0]
+            ref = ref[other]
+            if len(ref) and np.bincount(ref).max() == 1: #One to one, so the pairs can be put in order without sorting
+                pos = np.full(len(self.index), -1)
+                pos[ref] = other
+                ref = np.nonzero(pos >= 0)[0]
+                return ref, pos[ref]
+            order = np.argsort(ref, kind='stable')
+            return ref[order], other[order]
+        lo = np.searchsorted(self.sorted, keys, side='left')
+        hi = np.searchsorted(self.sorted, keys, side='right')
+        n = np.where(good, hi - lo, 0)
+        other = np.repeat(np.arange(len(keys)), n)
+        offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        ref = self.order[np.repeat(lo, n) + offset]
+        order = np.lexsort((other, ref))
+        return ref[order], other[order]
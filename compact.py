@@ -0,0 +1,172 @@
+"""
+Compact in-memory storage of loaded files (@@COMPACT).
+
+Normally every loaded file is a dataframe holding all the columns the cut and expressions needed, as
+float64 or int64, plus x_plot_val, y_plot_val and a 'name' column with the file's label in every row.
+Once the cut and the expressions are done, the plot only ever needs x and y (and the CIDs for @@DIFF),
+so with @@COMPACT each file is boiled down to a PlotData: the plotted values as plain arrays, the CID and
+IDSURVEY columns if they're needed, and the label as an attribute.
+
+Tables that are kept around to make more plots from (@@BATCH and the plot server) are held as a
+CompactTable instead, where each column is stored in the smallest type that gives back exactly the same
+values:
+    - integers in the smallest integer type their range fits in,
+    - floats that were written out with a fixed number of decimals (which is most of a FITRES) as integers
+      of value*10**decimals, which turn back into the exact same float64 when divided back down (-0.0
+      does come back as 0.0, which is equal to it),
+    - text (names as CIDs, FIELD, ...) as categoricals.
+Anything else stays as it is. Columns are turned back into their original types when they're used, so
+the cut and expressions give the same answers as without @@COMPACT.
+"""
+import numpy as np
+import pandas as pd
+
+MAXDECIMALS = 9 #Floats with more decimals than this are left as float64
+SAMPLE = 1000 #Values looked at to guess the decimals, before checking them all
+
+
+def smallest_int(lo, hi):
+    """The smallest integer type that holds lo to hi."""
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= lo and hi <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _decimals(values):
+    """The number of decimals values were written with, if they can all be stored as integers, otherwise None."""
+    if not len(values) or not np.all(np.isfinite(values)):
+        return None
+    biggest = np.abs(values).max()
+    sample = values[:: max(1, len(values)//SAMPLE)]
+    for d in range(MAXDECIMALS + 1):
+        scale = 10.**d
+        if biggest*scale >= 2**53: #Past this the integers themselves aren't exact any more
+            return None
+        if np.array_equal(np.round(sample*scale)/scale, sample):
+            return d if np.array_equal(np.round(values*scale)/scale, values) else None
+    return None
+
+
+class Column:
+    """One column of a CompactTable. values() gives back the original array."""
+    def __init__(self, values):
+        values = np.asarray(values) if not isinstance(values, pd.api.extensions.ExtensionArray) else values
+        self.dtype = values.dtype
+        self.scale = None
+        kind = getattr(values.dtype, 'kind', 'O')
+        decimals = _decimals(values) if kind == 'f' else None
+        if kind in 'iu' and len(values):
+            self.data = values.astype(smallest_int(values.min(), values.max()))
+        elif decimals is not None:
+            self.scale = 10.**decimals
+            codes = np.round(values*self.scale)
+            self.data = codes.astype(smallest_int(codes.min(), codes.max()))
+        elif kind in 'OUS' or isinstance(values.dtype, pd.StringDtype):
+            self.data = pd.Categorical(values)
+        else:
+            self.data = values
+
+    def values(self):
+        if self.scale is not None:
+            return self.data/self.scale
+        if isinstance(self.data, pd.Categorical):
+            return np.asarray(self.data.astype(object)) if self.dtype == object else self.data.astype(self.dtype)
+        return self.data.astype(self.dtype, copy=False)
+
+    def take(self, rows):
+        out = Column.__new__(Column)
+        out.dtype, out.scale, out.data = self.dtype, self.scale, self.data[rows]
+        return out
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+class CompactTable:
+    """A dataframe with every column stored as a Column. frame() gives back a dataframe of the columns asked for."""
+    def __init__(self, df):
+        self.columns = df.columns
+        self.index = None if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1 else Column(df.index.to_numpy())
+        self.data = {c: Column(df[c].array if isinstance(df[c].dtype, pd.api.extensions.ExtensionDtype) else df[c].to_numpy()) for c in df.columns}
+        self.nrows = len(df)
+
+    def __len__(self):
+        return self.nrows
+
+    def head(self, n):
+        return self.take(slice(0, n))
+
+    def take(self, rows):
+        """The rows at the positions in rows (an array or a slice), keeping their row numbers, like DataFrame.take."""
+        out = CompactTable.__new__(CompactTable)
+        positions = np.arange(self.nrows)[rows]
+        out.columns, out.nrows = self.columns, len(positions)
+        if self.index is not None:
+            out.index = self.index.take(rows)
+        else: #Row numbers only stay a plain range for the top rows
+            out.index = None if isinstance(rows, slice) and (rows.start or 0) == 0 else Column(positions)
+        out.data = {c: col.take(rows) for c, col in self.data.items()}
+        return out
+
+    def frame(self, columns=None):
+        """A dataframe of columns (all of them for None), with their original types. Columns that aren't there are left out."""
+        names = [c for c in self.columns if columns is None or c in columns]
+        index = self.index.values() if self.index is not None else pd.RangeIndex(self.nrows)
+        return pd.DataFrame({c: self.data[c].values() for c in names}, index=index, columns=names)
+
+    def memory_usage(self):
+        """Bytes used by the columns."""
+        return sum(col.nbytes for col in self.data.values()) + (self.index.nbytes if self.index is not None else 0)
+
+
+class PlotData:
+    """
+    What one file needs for plotting after the cut: x_plot_val and y_plot_val, and the CID columns in keep.
+    Looks enough like the dataframe it came from for plotter_func and the rest.
+    """
+    def __init__(self, df, name=None, keep=()):
+        self.name = name
+        self.x = np.asarray(df['x_plot_val'], dtype=float)
+        self.y = np.asarray(df['y_plot_val'], dtype=float) if 'y_plot_val' in df.columns else None
+        index = df.index
+        self.index = None if isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1 else Column(index.to_numpy())
+        self.keep = {c: Column(df[c].to_numpy()) for c in keep if c in df.columns}
+
+    @property
+    def columns(self):
+        return pd.Index(['x_plot_val'] + (['y_plot_val'] if self.y is not None else []) + list(self.keep))
+
+    def _index(self):
+        return self.index.values() if self.index is not None else pd.RangeIndex(len(self.x))
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, column):
+        if column == 'x_plot_val': values = self.x
+        elif column == 'y_plot_val' and self.y is not None: values = self.y
+        elif column in self.keep: values = self.keep[column].values()
+        else: raise KeyError(column)
+        return pd.Series(values, index=self._index(), name=column, copy=False)
+
+    @property
+    def x_plot_val(self):
+        return self['x_plot_val']
+
+    @property
+    def y_plot_val(self):
+        return self['y_plot_val']
+
+    def memory_usage(self):
+        """Bytes used by the values."""
+        return self.x.nbytes + (self.y.nbytes if self.y is not None else 0) + sum(col.nbytes for col in self.keep.values()) + \
+            (self.index.nbytes if self.index is not None else 0)
+
+
+def memory_usage(table):
+    """Bytes used by a dataframe, CompactTable or PlotData."""
+    if isinstance(table, pd.DataFrame):
+        return table.memory_usage(deep=True).sum()
+    return table.memory_usage()
@@ -0,0 +1,151 @@
+"""
+Corner plots (@@CORNER): every variable against every other, for all the files, from one read of each.
+
+Rather than running the plotter once per pair (zHD:x1, zHD:c, x1:c, ...), each file is read once with all
+the columns that any of the variables and the @@CUT need (in parallel with @@JOBS), the cut is applied once,
+and each variable is worked out once. All that's kept of a file is those values. Then every panel is binned:
+the histogram of each variable on the diagonal, and below it, for each pair, the density of points and the
+binned medians of the row's variable. The binning runs in a pool of threads (np.bincount, np.histogram2d
+and the sorting for the medians let go of the GIL), and only the drawing is done one panel at a time.
+"""
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+import loader
+import expressions
+import histograms
+import rendering
+import plots
+import profiling
+
+NBINS = 30 #Bin edges for variables with loose bounds, like plots.get_bins
+PANEL_SIZE = 2.5 #Inches
+
+
+def parse_variables(CORNER):
+    """The expressions from the @@CORNER arguments: colon separated like @@VARIABLE, or else one per argument."""
+    joined = ' '.join(str(elem) for elem in CORNER)
+    if ':' in joined:
+        return [VAR.strip() for VAR in joined.split(':') if VAR.strip()]
+    return [str(elem) for elem in CORNER]
+
+
+def parse_bounds(BOUNDS, nvars):
+    """[min, max, binsize] (or None for loose bounds) for each of the variables, from the colon separated @@BOUNDS."""
+    if BOUNDS == 'loose' or BOUNDS == ['loose']:
+        return [None]*nvars
+    BOUNDS = ' '.join(str(elem) for elem in BOUNDS)
+    given = [[float(i) for i in BND.split()] if BND.strip() != 'loose' else None for BND in BOUNDS.split(':')]
+    if len(given) > nvars or any(b is not None and len(b) != 3 for b in given):
+        raise ValueError("@@BOUNDS needs min max binsize (or loose) for each @@CORNER variable, colon separated")
+    return given + [None]*(nvars - len(given))
+
+
+def load(filename, variables, CUT=None, NROWS=0, **readargs):
+    """
+    The values of each of the variables in filename after the cut, as a 2D array with a column for each.
+    readargs are the cache, SAMPLE, SEED and thread options of loader.read_table.
+    """
+    df, cutdone = loader.read_table(filename, variables, CUT, None, NROWS, **readargs)
+    with profiling.stage('cut', filename):
+        df = expressions.compile_cut(CUT)(df) if CUT and not cutdone else df
+    with profiling.stage('expr', filename):
+        values = np.column_stack([np.broadcast_to(np.asarray(expressions.compile_expr(VAR)(df), dtype=float), len(df))
+                                  for VAR in variables]) if len(df) else np.zeros((0, len(variables)))
+    print("Done loading", filename.split("/")[-1])
+    return values
+
+
+def get_bins(values, bounds):
+    """Bin edges for each variable: its @@BOUNDS, or NBINS edges from the lowest to the highest value in any file."""
+    edges = []
+    for i, b in enumerate(bounds):
+        if b is not None:
+            edges.append(plots.get_bins({'x': b}))
+            continue
+        col = np.concatenate([v[:, i] for v in values])
+        col = col[np.isfinite(col)]
+        lo, hi = (col.min(), col.max()) if len(col) else (0., 1.)
+        edges.append(np.linspace(lo, hi if hi > lo else lo + 1., NBINS))
+    return edges
+
+
+def _panel(values, i, j, edges, RASTER):
+    """
+    What's drawn in the panel of row i, column j, for each file: the counts in the bins of variable i on the
+    diagonal, otherwise the binned medians of i in the bins of j, with the density grid of the points if there
+    are too many of them to scatter.
+    """
+    if i == j:
+        return histograms.hist_counts_all([v[:, i] for v in values], edges[i])
+    out = []
+    extent = [edges[j][0], edges[j][-1], edges[i][0], edges[i][-1]]
+    for v in values:
+        grid = (rendering.density(v[:, j], v[:, i], extent), extent) if 0 <= RASTER < len(v) else None
+        out.append((histograms.BinnedData(v[:, j], edges[j], v[:, i]).binned_median(), grid))
+    return out
+
+
+def panels(values, edges, THREADS=1, RASTER=rendering.RASTER):
+    """_panel for every panel on and below the diagonal, THREADS at a time. Returns {(i, j): panel}."""
+    keys = [(i, j) for i in range(len(edges)) for j in range(i + 1)]
+    with ThreadPoolExecutor(max(1, THREADS)) as pool:
+        done = pool.map(lambda key: _panel(values, key[0], key[1], edges, RASTER), keys)
+        return dict(zip(keys, done))
+
+
+def draw(values, names, variables, edges, binned, CUT=None, ALPHA=0.3, RASTER=rendering.RASTER, CONTOUR=False):
+    """Draws the corner plot from panels() on a new figure, and returns it."""
+    import matplotlib.pyplot as plt
+    n = len(variables)
+    fig, axes = plt.subplots(n, n, figsize=(PANEL_SIZE*n, PANEL_SIZE*n), squeeze=False)
+    fig.subplots_adjust(hspace=0.08, wspace=0.08)
+    for i in range(n):
+        for j in range(n):
+            ax = axes[i, j]
+            if j > i:
+                ax.axis('off')
+                continue
+            plt.sca(ax)
+            centres = (edges[j][1:] + edges[j][:-1])/2.
+            if i == j:
+                counts = binned[(i, i)]
+                for k, name in enumerate(names): #Normalised to the first file, like the histograms of plotter_func
+                    c = counts[k]*counts[0].sum()/counts[k].sum() if counts[k].sum() else counts[k]
+                    errl, erru = histograms.poisson_interval(c)
+                    plt.errorbar(centres, c, yerr=[c - errl, erru - c], fmt='o', ms=3, label=name)
+                ax.set_yticks([])
+            else:
+                for k, name in enumerate(names):
+                    median, grid = binned[(i, j)][k]
+                    points = rendering.points(values[k][:, j], values[k][:, i], name, ALPHA, RASTER, CONTOUR, s=2, zorder=0,
+                                              **({'grid': grid, 'n': len(values[k])} if grid is not None else {}))
+                    plt.scatter(centres, median, marker="^", s=15, color=points.get_facecolor()[0][:3], edgecolors='k', linewidths=0.5, zorder=10)
+                plt.ylim(edges[i][0], edges[i][-1])
+            plt.xlim(edges[j][0], edges[j][-1])
+            if i == n - 1: ax.set_xlabel(variables[j])
+            else: ax.set_xticklabels([])
+            if j == 0 and i > 0: ax.set_ylabel(variables[i])
+            elif j > 0: ax.set_yticklabels([])
+    handles, labels = axes[0, 0].get_legend_handles_labels()
+    fig.legend(handles, labels, loc='upper right')
+    if CUT: fig.suptitle(CUT)
+    return fig
+
+
+def run(filenames, keynames, variables, BOUNDS='loose', CUT=None, ALPHA=0.3, RASTER=rendering.RASTER, CONTOUR=False, JOBS=1, THREADS=1,
+        **readargs):
+    """
+    Reads every file once and draws the corner plot of variables. readargs go to load(). Returns the figure.
+    The panels are binned in THREADS*JOBS threads, since that's how many cores the loading was using.
+    """
+    bounds = parse_bounds(BOUNDS, len(variables))
+    values = loader.run_parallel(load, [(l, variables) for l in filenames], JOBS, CUT=CUT, THREADS=THREADS, **readargs)
+    for name, v in zip(keynames, values):
+        print(name + ":", len(v), "rows")
+    print("Done loading all files! Binning", len(variables)*(len(variables) + 1)//2, "panels now.")
+    edges = get_bins(values, bounds)
+    with profiling.stage('binning'): #Per panel stages wouldn't work from the threads
+        binned = panels(values, edges, THREADS*max(1, JOBS), RASTER)
+    with profiling.stage('draw'):
+        return draw(values, keynames, variables, edges, binned, CUT, ALPHA, RASTER, CONTOUR)
@@ -0,0 +1,411 @@
+"""
+Looks inside the @@VARIABLE and @@CUT strings, and compiles them into something that can be run.
+
+Everything is written in terms of a dataframe called df, eg, 'df.mB.values - 3.1*df.c.values' or
+"df.loc[df.IDSURVEY < 15]". By walking the syntax tree of those strings we can work out which FITRES
+columns are needed, so the reader only has to parse those, and whether a cut only ever looks at one
+row at a time, in which case it can be applied chunk by chunk while the file is being read.
+"""
+import ast
+import functools
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+#Things you can do to df that don't depend on which columns were read in
+FRAME_ATTRS = {'loc', 'values', 'to_numpy'}
+
+#Methods that work on each row independently of all the others
+ROWWISE_METHODS = {'isin', 'between', 'abs', 'isna', 'notna', 'isnull', 'notnull', 'astype', 'str',
+                   'contains', 'startswith', 'endswith', 'values', 'to_numpy', 'loc'}
+ROWWISE_FUNCS = {'abs', 'absolute', 'sqrt', 'exp', 'log', 'log10', 'log2', 'power', 'sin', 'cos', 'tan',
+                 'arcsin', 'arccos', 'arctan', 'arctan2', 'isfinite', 'isnan', 'isinf', 'logical_and',
+                 'logical_or', 'logical_not', 'sign', 'floor', 'ceil', 'around', 'round', 'minimum', 'maximum'}
+
+
+def parse(expr):
+    """Returns the syntax tree of expr, or None if it isn't valid python."""
+    try:
+        return ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return None
+
+
+def _parents(tree):
+    parents = {}
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node):
+            parents[child] = node
+    return parents
+
+
+def referenced_columns(exprs):
+    """
+    Set of column names used by the expressions in exprs, which all refer to the table as df.
+    That's df.NAME and df['NAME'], of df or of rows picked out of it (df.loc[mask].NAME), and the names
+    in df[['NAME', ...]] and df.loc[mask, 'NAME'] or df.loc[mask, ['NAME', ...]].
+    Returns None if we can't be sure, eg, df gets passed into a function or df.loc picks columns by
+    anything other than their names, in which case every column needs to be read.
+    """
+    columns = set()
+    for expr in exprs:
+        if not expr:
+            continue
+        tree = parse(expr)
+        if tree is None:
+            return None
+        parents = _parents(tree)
+        for node in ast.walk(tree):
+            if _is_df(node):
+                parent = parents.get(node)
+                if not (isinstance(parent, ast.Attribute) or (isinstance(parent, ast.Subscript) and parent.value is node)):
+                    return None
+            elif isinstance(node, ast.Attribute) and _is_frame(node.value):
+                if node.attr not in FRAME_ATTRS:
+                    columns.add(node.attr)
+            elif isinstance(node, ast.Subscript) and _is_loc(node.value):
+                if not isinstance(node.slice, ast.Tuple):
+                    continue #Just rows
+                if len(node.slice.elts) != 2:
+                    return None
+                key = node.slice.elts[1]
+                if isinstance(key, ast.Slice) and key.lower is None and key.upper is None and key.step is None:
+                    continue #df.loc[mask, :], every column there is
+                names = _names(key)
+                if names is None:
+                    return None
+                columns |= names
+            elif isinstance(node, ast.Subscript) and _is_frame(node.value):
+                if not isinstance(node.slice, (ast.Constant, ast.List, ast.Tuple)):
+                    continue #A mask picking out rows, whose own columns get picked up separately
+                names = _names(node.slice)
+                if names is None:
+                    return None #Positional lookups depend on every column being there
+                columns |= names
+    return columns
+
+
+def project(columns, header, optional=()):
+    """
+    Which columns out of header to actually read, given the output of referenced_columns.
+    Anything we don't recognise (a method of df, say) means we play it safe and read everything.
+    Columns in optional get read if the file has them, and don't matter if it doesn't.
+    """
+    if columns is None or not set(columns) <= set(header):
+        return list(header)
+    return [c for c in header if (c in columns) or (c in optional)]
+
+
+def is_rowwise(expr):
+    """
+    True if expr only ever compares or combines values within the same row, so applying it to
+    chunks of a file and sticking the results back together is the same as applying it to the
+    whole thing. Anything like df.mB < df.mB.median() is not, and has to wait for the full table.
+    """
+    tree = parse(expr)
+    if tree is None:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            func = node.func
+            if not isinstance(func, ast.Attribute):
+                return False
+            if isinstance(func.value, ast.Name) and func.value.id in ('np', 'numpy'):
+                if func.attr not in ROWWISE_FUNCS:
+                    return False
+            elif func.attr not in ROWWISE_METHODS:
+                return False
+        elif isinstance(node, ast.Attribute):
+            if isinstance(node.value, ast.Name) and node.value.id in ('df', 'np', 'numpy'):
+                continue
+            if node.attr not in ROWWISE_METHODS:
+                return False
+        elif isinstance(node, ast.Subscript):
+            value = node.value
+            if isinstance(value, ast.Name) and value.id == 'df':
+                continue
+            if isinstance(value, ast.Attribute) and value.attr == 'loc' and isinstance(value.value, ast.Name) and value.value.id == 'df':
+                continue
+            return False #eg, df.mB.values[0] would pick out the first row of every chunk
+        elif isinstance(node, (ast.Lambda, ast.comprehension, ast.NamedExpr)):
+            return False
+    return True
+
+
+#Everything from here down is the expression engine that replaces a bare eval() of @@VARIABLE and @@CUT.
+#Each string is parsed once, checked against what's allowed, and compiled into something that can be
+#called on any number of dataframes. Where possible it works on the raw numpy columns instead of
+#pandas series, and if numexpr is installed, plain arithmetic gets handed to it so the whole thing is
+#done in one multithreaded pass without any temporary arrays.
+
+NUMPY_FUNCS = ROWWISE_FUNCS | {'where', 'isin', 'clip', 'log1p', 'expm1', 'hypot', 'sinh', 'cosh', 'tanh', 'deg2rad',
+                               'rad2deg', 'mean', 'median', 'std', 'min', 'max', 'sum', 'nanmean', 'nanmedian',
+                               'nanstd', 'nanmin', 'nanmax', 'quantile', 'percentile', 'pi', 'nan', 'inf', 'e'}
+SERIES_METHODS = ROWWISE_METHODS | {'median', 'mean', 'std', 'min', 'max', 'sum', 'quantile', 'clip', 'round'}
+ALLOWED_NAMES = {'df', 'np', 'numpy', 'abs'}
+ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.Call, ast.keyword, ast.Attribute,
+                 ast.Subscript, ast.Name, ast.Constant, ast.List, ast.Tuple, ast.Slice, ast.Load, ast.operator,
+                 ast.unaryop, ast.boolop, ast.cmpop)
+
+#What the series methods turn into when we're working on plain numpy arrays. Same answers as pandas.
+NUMPY_METHODS = {
+    'isin': lambda a, values: np.isin(a, values),
+    'between': lambda a, left, right: (a >= left) & (a <= right),
+    'abs': np.abs,
+    'isna': pd.isna, 'isnull': pd.isna,
+    'notna': pd.notna, 'notnull': pd.notna,
+    'astype': lambda a, dtype: a.astype(dtype),
+    'median': np.nanmedian, 'mean': np.nanmean, 'min': np.nanmin, 'max': np.nanmax, 'sum': np.nansum,
+    'std': lambda a, ddof=1: np.nanstd(a, ddof=ddof),
+    'quantile': lambda a, q=0.5: np.nanquantile(a, q),
+    'clip': lambda a, lower=None, upper=None: a if lower is None and upper is None else np.clip(a, lower, upper),
+    'round': lambda a, decimals=0: np.round(a, decimals),
+}
+#The pandas keywords each of them takes. Any other keyword (eg, skipna=, inclusive=) leaves the expression to pandas
+NUMPY_KEYWORDS = {'isin': {'values'}, 'clip': {'lower', 'upper'}, 'astype': {'dtype'}, 'std': {'ddof'}, 'quantile': {'q'}, 'round': {'decimals'}}
+
+#Functions numexpr knows about
+NUMEXPR_FUNCS = {'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2', 'sinh', 'cosh', 'tanh', 'sqrt', 'exp',
+                 'expm1', 'log', 'log10', 'log1p', 'abs', 'where'}
+
+
+class ExpressionError(ValueError):
+    """An @@VARIABLE or @@CUT string that isn't allowed."""
+
+
+def _is_df(node):
+    return isinstance(node, ast.Name) and node.id == 'df'
+
+
+def _is_str(node):
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+
+def _names(node):
+    """The column names in 'NAME' or ['NAME', ...], or None if node isn't one of those."""
+    if _is_str(node):
+        return {node.value}
+    if isinstance(node, (ast.List, ast.Tuple)) and all(_is_str(e) for e in node.elts):
+        return {e.value for e in node.elts}
+    return None
+
+
+def _is_loc(node):
+    """True for df.loc, or the .loc of rows picked out of df."""
+    return isinstance(node, ast.Attribute) and node.attr == 'loc' and _is_frame(node.value)
+
+
+def _is_frame(node):
+    """True for df itself, or rows or columns picked out of it like df.loc[mask], df[mask], df[['mB', 'c']] or df.loc[mask, ['mB', 'c']]."""
+    if _is_df(node):
+        return True
+    if not isinstance(node, ast.Subscript) or _is_str(node.slice):
+        return False
+    if _is_loc(node.value):
+        key = node.slice
+        return not (isinstance(key, ast.Tuple) and len(key.elts) == 2 and _is_str(key.elts[1])) #df.loc[mask, 'mB'] is a column
+    return _is_frame(node.value)
+
+
+def _column(node):
+    """The column name if node is df.name or df['name'], otherwise None."""
+    if isinstance(node, ast.Attribute) and _is_df(node.value) and node.attr not in FRAME_ATTRS:
+        return node.attr
+    if isinstance(node, ast.Subscript) and _is_df(node.value) and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+        return node.slice.value
+    return None
+
+
+def validate(tree, expr=''):
+    """
+    Raises ExpressionError unless tree only uses df columns, arithmetic, comparisons, numpy functions,
+    a short list of series methods and df.loc[] masks. No other names, no dunders, no lambdas, etc.
+    """
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ExpressionError("%s isn't allowed in %r" % (type(node).__name__, expr))
+        if isinstance(node, ast.Name) and node.id not in ALLOWED_NAMES:
+            raise ExpressionError("%r isn't allowed in %r. Refer to the columns as df.NAME" % (node.id, expr))
+        if isinstance(node, ast.Attribute):
+            if node.attr.startswith('_'):
+                raise ExpressionError("%r isn't allowed in %r" % (node.attr, expr))
+            if isinstance(node.value, ast.Name) and node.value.id in ('np', 'numpy'):
+                if node.attr not in NUMPY_FUNCS:
+                    raise ExpressionError("np.%s isn't allowed in %r" % (node.attr, expr))
+            elif _is_frame(node.value):
+                if node.attr not in FRAME_ATTRS and hasattr(pd.DataFrame, node.attr):
+                    raise ExpressionError("df.%s isn't allowed in %r. Use df['%s'] if it's a column" % (node.attr, expr, node.attr))
+            elif node.attr not in SERIES_METHODS:
+                raise ExpressionError(".%s isn't allowed in %r" % (node.attr, expr))
+        if isinstance(node, ast.Call) and not isinstance(node.func, (ast.Attribute, ast.Name)):
+            raise ExpressionError("Only numpy functions and column methods can be called in %r" % expr)
+
+
+class _ToNumpy(ast.NodeTransformer):
+    """
+    Rewrites a validated tree to work on a dict of numpy columns called _cols, instead of on df.
+    Raises _NotNumpy for anything that needs the real dataframe, eg, df.loc[].
+    """
+    def visit_Attribute(self, node):
+        col = _column(node)
+        if col is not None:
+            return ast.Subscript(value=ast.Name(id='_cols', ctx=ast.Load()), slice=ast.Constant(value=col), ctx=ast.Load())
+        if node.attr == 'values':
+            return self.visit(node.value)
+        if isinstance(node.value, ast.Name) and node.value.id in ('np', 'numpy'):
+            return node
+        raise _NotNumpy()
+
+    def visit_Subscript(self, node):
+        col = _column(node)
+        if col is None:
+            raise _NotNumpy()
+        return ast.Subscript(value=ast.Name(id='_cols', ctx=ast.Load()), slice=ast.Constant(value=col), ctx=ast.Load())
+
+    def visit_Call(self, node):
+        func = node.func
+        args = [self.visit(a) for a in node.args]
+        keywords = [ast.keyword(arg=k.arg, value=self.visit(k.value)) for k in node.keywords]
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id in ('np', 'numpy'):
+            return ast.Call(func=func, args=args, keywords=keywords)
+        if isinstance(func, ast.Attribute) and func.attr == 'to_numpy' and not node.args:
+            return self.visit(func.value)
+        if isinstance(func, ast.Attribute) and func.attr in NUMPY_METHODS:
+            if any(k.arg not in NUMPY_KEYWORDS.get(func.attr, ()) for k in node.keywords):
+                raise _NotNumpy()
+            return ast.Call(func=ast.Name(id='_m_'+func.attr, ctx=ast.Load()), args=[self.visit(func.value)] + args, keywords=keywords)
+        if isinstance(func, ast.Name) and func.id == 'abs' and not node.keywords:
+            return ast.Call(func=ast.Name(id='_m_abs', ctx=ast.Load()), args=args, keywords=keywords)
+        raise _NotNumpy()
+
+    def visit_Name(self, node):
+        if node.id == 'df':
+            raise _NotNumpy()
+        return node
+
+
+class _NotNumpy(Exception):
+    pass
+
+
+def _numexpr_string(tree):
+    """The expression in numexpr syntax with columns as _c0, _c1..., or None if numexpr can't do it."""
+    cols = []
+    class Rename(ast.NodeTransformer):
+        def visit_Subscript(self, node):
+            if cols is not None and node.slice.value not in cols: cols.append(node.slice.value)
+            return ast.Name(id='_c%d' % cols.index(node.slice.value), ctx=ast.Load())
+        def visit_Call(self, node):
+            if not (isinstance(node.func, ast.Attribute) and node.func.attr in NUMEXPR_FUNCS) or node.keywords:
+                raise _NotNumpy()
+            node.args = [self.visit(a) for a in node.args]
+            node.func = ast.Name(id=node.func.attr, ctx=ast.Load())
+            return node
+        def visit_Attribute(self, node): #np.pi and np.e go in as their values. numexpr has no nan or inf, so they stay with numpy
+            value = getattr(np, node.attr)
+            if not (isinstance(value, float) and np.isfinite(value)): raise _NotNumpy()
+            return ast.Constant(value=value)
+        def visit_Compare(self, node):
+            if len(node.ops) > 1: raise _NotNumpy() #numexpr doesn't do a < b < c
+            return self.generic_visit(node)
+        def visit_Constant(self, node):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool): raise _NotNumpy()
+            return node
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.BoolOp, ast.List, ast.Tuple, ast.Slice, ast.Attribute)) and not (
+                isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id in ('np', 'numpy')):
+            return None, None
+    try:
+        tree = Rename().visit(tree)
+    except _NotNumpy:
+        return None, None
+    return ast.unparse(tree), cols
+
+
+class Expression:
+    """
+    A compiled @@VARIABLE (or any expression in terms of df). Call it on a dataframe to get the values.
+    """
+    def __init__(self, expr):
+        self.text = expr
+        tree = parse(expr)
+        if tree is None:
+            raise ExpressionError("%r isn't a valid expression" % expr)
+        validate(tree, expr)
+        self.columns = set()
+        for node in ast.walk(tree):
+            col = _column(node)
+            if col is not None: self.columns.add(col)
+        self.mode = 'pandas'
+        self.code = compile(tree, '<%s>' % expr, 'eval')
+        try:
+            fast = ast.fix_missing_locations(_ToNumpy().visit(parse(expr)))
+        except _NotNumpy:
+            return
+        self.mode = 'numpy'
+        self.code = compile(fast, '<%s>' % expr, 'eval')
+        self.numexpr = None
+        if numexpr is not None:
+            self.numexpr, self.necols = _numexpr_string(fast.body)
+            if self.numexpr is not None: self.mode = 'numexpr'
+
+    def _columns(self, df):
+        cols = {}
+        for c in self.columns:
+            if c not in df.columns:
+                raise AttributeError("'DataFrame' object has no attribute %r" % c) #Same as you'd get from pandas
+            cols[c] = df[c].to_numpy()
+        return cols
+
+    def __call__(self, df):
+        if self.mode == 'pandas':
+            return eval(self.code, {'__builtins__': {}, 'np': np, 'numpy': np, 'abs': abs}, {'df': df})
+        cols = self._columns(df)
+        if self.mode == 'numexpr' and all(cols[c].dtype.kind in 'biuf' for c in self.necols):
+            return numexpr.evaluate(self.numexpr, local_dict={'_c%d' % i: cols[c] for i, c in enumerate(self.necols)})
+        namespace = {'__builtins__': {}, 'np': np, 'numpy': np, '_cols': cols}
+        namespace.update({'_m_'+m: f for m, f in NUMPY_METHODS.items()})
+        return eval(self.code, namespace)
+
+
+class Cut:
+    """
+    A compiled @@CUT. Call it on a dataframe to get the rows that pass.
+    The usual df.loc[mask] or df[mask] is done by working out the mask as an Expression and
+    indexing with it; anything fancier is evaluated as it is (after being checked).
+    """
+    def __init__(self, expr):
+        self.text = expr
+        tree = parse(expr)
+        if tree is None:
+            raise ExpressionError("%r isn't a valid cut" % expr)
+        validate(tree, expr)
+        body = tree.body
+        self.mask = None
+        if isinstance(body, ast.Subscript) and _column(body) is None and not isinstance(body.slice, (ast.Tuple, ast.Slice)):
+            value = body.value
+            if _is_df(value) or (isinstance(value, ast.Attribute) and value.attr == 'loc' and _is_df(value.value)):
+                self.mask = Expression(ast.unparse(body.slice))
+        if self.mask is None:
+            self.whole = Expression(expr)
+
+    def __call__(self, df):
+        if self.mask is not None:
+            return df.loc[self.mask(df)]
+        return self.whole(df)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_expr(expr):
+    """Expression(expr), only ever compiled once per process."""
+    return Expression(expr)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_cut(expr):
+    """Cut(expr), only ever compiled once per process."""
+    return Cut(expr)
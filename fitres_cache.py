@@ -0,0 +1,277 @@
+"""
+On-disk cache for parsed FITRES files.
+
+Parsing a multi-GB FITRES with pd.read_csv is by far the slowest part of making a plot, and we tend to
+plot the same files over and over again. So the first time a file gets parsed, each column that was read
+is dumped as its own .npy file in a cache directory. The next time around the columns are memory-mapped straight
+back in, and only the columns that actually get touched are ever read off the disk. When a row-wise @@CUT
+is being applied as the file is read, the columns are written out a chunk of rows at a time (see Writer),
+so the rows that fail the cut never have to be held in memory all at once either.
+
+Entries are keyed on the absolute path, size and modification time of the FITRES, so editing or
+regenerating a file automatically invalidates its entry. Columns are added to an entry as later plots
+need them. Each column's file is named after the column, and meta.json is read again just before it's
+replaced, so several runs adding different columns to the same entry at once never mix them up. At worst
+one of them doesn't get listed, and gets parsed and added again next time. The cache has a size cap (in
+GB), and the least recently used entries (and row indexes, see rowindex.py) get thrown out once it goes over.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.environ.get('MIDWAY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'midwayplotter'))
+CACHE_SIZE = 20. #GB
+
+
+def cache_key(filename):
+    """Hash of the path, size and mtime of filename. Any change to the file gives a new key."""
+    st = os.stat(filename)
+    tag = "%s:%d:%d" % (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    return hashlib.sha1(tag.encode()).hexdigest()
+
+
+def _read_meta(filename, cachedir):
+    try:
+        entry = os.path.join(cachedir, cache_key(filename))
+        with open(os.path.join(entry, 'meta.json')) as fp:
+            return entry, json.load(fp)
+    except (OSError, ValueError):
+        return None, None
+
+
+def column_file(column):
+    """Name of the file that column is stored in. Hashed, since column names can have anything in them (and mB and MB are the same file on some disks)."""
+    return hashlib.sha1(str(column).encode()).hexdigest()[:16] + '.npy'
+
+
+def _files(meta):
+    """Which file each cached column is in. Older entries named them by their position in the list of columns."""
+    return meta.get('files', {c: str(i) + '.npy' for i, c in enumerate(meta['columns'])})
+
+
+def cached_header(filename, cachedir=CACHE_DIR):
+    """The full list of column names in filename, if it has a cache entry. Saves scanning the header again."""
+    entry, meta = _read_meta(filename, cachedir)
+    if meta is None:
+        return None
+    return meta.get('header', meta['columns'])
+
+
+def load_cached(filename, cachedir=CACHE_DIR, columns=None):
+    """
+    Returns the cached dataframe for filename, or None if there isn't one.
+    The columns are memory-mapped, so nothing is read until it gets used (apart from columns of both numbers
+    and text, or of text with gaps, which are read in whole). If columns is given, only those columns are
+    put in the dataframe, and it only counts as a hit if all of them are cached.
+    """
+    entry, meta = _read_meta(filename, cachedir)
+    if meta is None:
+        return None
+    names = meta.get('header', meta['columns']) if columns is None else list(columns)
+    if any(c not in meta['columns'] for c in names):
+        return None
+    files = _files(meta)
+    objects = meta.get('objects', [])
+    data = {}
+    for c in names:
+        if c in objects:
+            data[c] = np.load(os.path.join(entry, files[c]), allow_pickle=True)
+        else:
+            data[c] = np.load(os.path.join(entry, files[c]), mmap_mode='r')
+    os.utime(os.path.join(entry, 'meta.json')) #Mark this entry as recently used for the LRU eviction
+    return pd.DataFrame(data, columns=names, copy=False)
+
+
+def _values(col):
+    """What gets saved of the column col."""
+    values = col.values
+    if values.dtype.kind in 'biuf':
+        return values
+    if pd.api.types.infer_dtype(col) == 'string' and not col.isna().any():
+        return np.asarray(col.astype(str), dtype=str) #Strings get stored as fixed width unicode so they can be mmapped too
+    return np.asarray(col, dtype=object) #Numbers and text, or text with gaps. Kept exactly as they are, which can't be mmapped
+
+
+def _one_type(dtypes):
+    """The type a column of parts with these types gets, the same as pandas would give it."""
+    if len(set(dtypes)) == 1:
+        return dtypes[0]
+    if all(d.kind in 'iuf' for d in dtypes):
+        return np.result_type(*dtypes)
+    if all(d.kind == 'U' for d in dtypes):
+        return max(dtypes, key=lambda d: d.itemsize)
+    return np.dtype(object)
+
+
+def store(filename, df, header=None, cachedir=CACHE_DIR, maxsize=CACHE_SIZE):
+    """
+    Writes the columns of df to the cache as the parsed version of filename, then trims the cache back
+    under maxsize GB. header is the full list of columns in the file, in case df only has some of them.
+    Columns that are already cached are left alone, so an entry fills up as different plots need
+    different columns. Every file is written under a temporary name and renamed into place, so a crash
+    halfway through never leaves a broken entry behind.
+    """
+    writer = Writer(filename, header if header is not None else df.columns, cachedir, maxsize)
+    writer.add(df)
+    writer.close()
+
+
+class Writer:
+    """
+    Writes a parsed file to the cache a chunk of rows at a time, like store, so the rows can be cut as they're
+    read and only the ones that pass kept in memory. Call add with each chunk in order, then close.
+    Each new column is saved a chunk at a time into a temporary file, which close turns into the column's .npy
+    with one type (the one pandas would give it, eg, float if it's ints in some chunks and floats in others).
+    If anything can't be written, what's been written so far is removed and the rest of the chunks are ignored.
+    """
+    def __init__(self, filename, header, cachedir=CACHE_DIR, maxsize=CACHE_SIZE):
+        self.filename = filename
+        self.header = [str(c) for c in header]
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.key = cache_key(filename)
+        self.entry = os.path.join(cachedir, self.key)
+        self.fresh = not os.path.isdir(self.entry)
+        self.tmp = '.tmp%d' % os.getpid()
+        self.new = None #Columns that aren't cached yet, worked out from the first chunk
+        self.parts = {} #Temporary file of each new column, and the type and length of each chunk in it
+        self.failed = False
+
+    def _path(self, c):
+        return os.path.join(self.entry, column_file(c))
+
+    def add(self, df):
+        """Saves the new columns of the next chunk of rows."""
+        if self.failed:
+            return
+        try:
+            if self.new is None:
+                _, meta = _read_meta(self.filename, self.cachedir)
+                self.new = [c for c in df.columns if meta is None or str(c) not in meta['columns']]
+                if self.new: os.makedirs(self.entry, exist_ok=True)
+                self.parts = {c: (open(self._path(c) + self.tmp + '.parts', 'wb'), []) for c in self.new}
+            for c in self.new:
+                values = _values(df[c])
+                fp, shapes = self.parts[c]
+                np.save(fp, values) #One after the other in the same file, and np.load reads them back in turn
+                shapes.append((values.dtype, len(values)))
+        except OSError as e:
+            self._fail(e)
+
+    def close(self):
+        """Turns the new columns into .npy files and lists them in meta.json, then trims the cache back under maxsize GB."""
+        if self.failed or not self.new:
+            return
+        objects = []
+        try:
+            for c in self.new:
+                fp, shapes = self.parts[c]
+                fp.close()
+                parts, colfile = self._path(c) + self.tmp + '.parts', self._path(c)
+                dtype = _one_type([d for d, n in shapes])
+                if dtype == object: objects.append(str(c))
+                if len(shapes) == 1: #Already the .npy of the whole column
+                    os.replace(parts, colfile)
+                    continue
+                with open(parts, 'rb') as fp:
+                    if dtype == object: #Can't be filled in bit by bit
+                        with open(colfile + self.tmp, 'wb') as out:
+                            np.save(out, np.concatenate([np.load(fp, allow_pickle=True).astype(object) for shape in shapes]))
+                    else:
+                        out = np.lib.format.open_memmap(colfile + self.tmp, mode='w+', dtype=dtype, shape=(sum(n for d, n in shapes),))
+                        start = 0
+                        for d, n in shapes:
+                            out[start:start + n] = np.load(fp)
+                            start += n
+                        out.flush()
+                        del out
+                os.replace(colfile + self.tmp, colfile)
+                os.remove(parts)
+            _, meta = _read_meta(self.filename, self.cachedir) #Another run may have added columns since we started
+            if meta is None:
+                meta = {'file': os.path.abspath(self.filename), 'header': self.header, 'columns': [], 'created': time.time()}
+            meta['files'] = _files(meta)
+            meta['objects'] = meta.get('objects', []) + [c for c in objects if c not in meta.get('objects', [])]
+            for c in self.new:
+                if str(c) not in meta['columns']:
+                    meta['columns'].append(str(c))
+                    meta['files'][str(c)] = column_file(c)
+            metafile = os.path.join(self.entry, 'meta.json')
+            with open(metafile + self.tmp, 'w') as fp:
+                json.dump(meta, fp)
+            os.replace(metafile + self.tmp, metafile)
+        except OSError as e:
+            self._fail(e)
+            return
+        evict(self.cachedir, self.maxsize, keep=self.key)
+
+    def _fail(self, e):
+        print("Couldn't write", self.filename.split("/")[-1], "to the cache:", e)
+        self.failed = True
+        for fp, shapes in self.parts.values():
+            fp.close()
+        if self.fresh: #Don't leave columns behind with no meta.json to say what they are
+            shutil.rmtree(self.entry, ignore_errors=True)
+        elif os.path.isdir(self.entry):
+            for f in os.listdir(self.entry):
+                if self.tmp in f: os.remove(os.path.join(self.entry, f))
+
+
+def entry_size(entry):
+    return sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+
+
+def evict(cachedir=CACHE_DIR, maxsize=CACHE_SIZE, keep=None):
+    """
+    Removes least recently used entries until the cache is below maxsize GB. The entry named keep is never removed.
+    The row indexes that rowindex.py keeps in the cache directory count too, each one on its own.
+    """
+    entries = []
+    for key in os.listdir(cachedir):
+        if key == 'rows':
+            for f in _listdir(os.path.join(cachedir, key)):
+                try: #Marked as used whenever rowindex reads one
+                    entries.append((os.path.getmtime(os.path.join(cachedir, key, f)), os.path.join(key, f), os.path.getsize(os.path.join(cachedir, key, f))))
+                except OSError:
+                    continue
+            continue
+        entry = os.path.join(cachedir, key)
+        metafile = os.path.join(entry, 'meta.json')
+        #Entries without a meta.json are left over from a run that died while writing them, or are being written right now
+        try:
+            entries.append((os.path.getmtime(metafile if os.path.isfile(metafile) else entry), key, entry_size(entry)))
+        except OSError: #Not a directory, or another run just removed it
+            continue
+    total = sum(e[2] for e in entries)
+    for used, key, size in sorted(entries):
+        if total <= maxsize*1e9:
+            break
+        if key == keep:
+            continue
+        path = os.path.join(cachedir, key)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+
+def clear(cachedir=CACHE_DIR):
+    """Deletes everything in the cache."""
+    if os.path.isdir(cachedir):
+        shutil.rmtree(cachedir)
+    print("Cleared the FITRES cache in", cachedir)
@@ -0,0 +1,275 @@
+"""
+Reading FITRES files into dataframes.
+
+Files are opened once: the compression is sniffed from the first couple of bytes, the header is read
+off the (decompressed) stream up to the first SN:/ROW:/GAL: row, and that same stream then carries
+straight on into the parser. Gzipped files are therefore only decompressed once, and never have to
+be opened in text mode just to find out that they're gzipped.
+
+With workers > 1, read_body splits the rows into blocks of about BLOCKSIZE bytes (ending at the end of a
+row) as they come off the stream, and parses the blocks in that many threads at once. pandas' C parser
+lets go of the GIL while it splits the rows up and turns them into numbers, so the threads really do run
+at the same time, and decompressing the next block carries on while they do. The blocks are put back
+together in order, and come out as the same dataframe as parsing the rows in one go.
+
+That includes columns with both numbers and text in them, eg, a FIELD of 10 in some rows and C3 in others.
+pandas turns the rows into numbers piece_rows at a time, and each piece gets its own type, so parsing the
+file in one go gives an object column with ints for the pieces that only had 10s and strings for the rest
+(and a DtypeWarning). Blocks always hold a whole number of those pieces, so they're split up the same way
+and give the same ints and strings, and a row-wise cut picks out the same rows in a block as in the whole
+file. Chunks read with a cut are a whole number of pieces too.
+"""
+import io
+import os
+import gzip
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+import expressions
+
+CHUNKSIZE = 500000 #Rows parsed at a time when a cut is being applied on the way in
+BUFSIZE = 1 << 20
+BLOCKSIZE = 1 << 23 #Bytes of rows parsed by each thread at a time
+WORKERS = os.cpu_count() or 1 #Threads for parsing, by default
+GZIP_MAGIC = b'\x1f\x8b'
+DATA_PREFIXES = (b'SN', b'ROW', b'GAL:')
+
+
+class _Body(io.RawIOBase):
+    """The rest of a FITRES stream, starting with the first data row which has already been read off it."""
+    def __init__(self, first, fp, proc=None):
+        self.first = first
+        self.fp = fp
+        self.proc = proc
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.first:
+            n = min(len(b), len(self.first))
+            b[:n] = self.first[:n]
+            self.first = self.first[n:]
+            return n
+        data = self.fp.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.fp.close()
+            if self.proc is not None:
+                self.proc.kill()
+                self.proc.wait()
+        super().close()
+
+
+def is_gzipped(filename):
+    with open(filename, 'rb') as fp:
+        return fp.read(2) == GZIP_MAGIC
+
+
+def _decompress(filename, threads=0):
+    """
+    Decompressed stream of a gzipped file. With threads > 0 the decompression is handed off to pigz
+    (if it's installed), which runs alongside the parser instead of in the same thread.
+    """
+    if threads > 0:
+        if shutil.which('pigz'):
+            proc = subprocess.Popen(['pigz', '-dc', '-p', str(threads), filename], stdout=subprocess.PIPE, bufsize=BUFSIZE)
+            return proc.stdout, proc
+        print("pigz isn't available, so decompressing", filename.split("/")[-1], "the normal way.")
+    return gzip.open(filename, 'rb'), None
+
+
+def open_raw(filename, threads=0):
+    """The whole of filename, header and all, as a binary stream (decompressed if it's gzipped)."""
+    if is_gzipped(filename):
+        fp, proc = _decompress(filename, threads)
+    else:
+        fp, proc = open(filename, 'rb', buffering=BUFSIZE), None
+    return io.BufferedReader(_Body(b'', fp, proc), BUFSIZE)
+
+
+def open_fitres(filename, threads=0):
+    """
+    Opens filename, gzipped or not, and reads through the header.
+    Returns the column names from VARNAMES and a binary stream of the data rows, ready for read_body.
+    """
+    if is_gzipped(filename):
+        fp, proc = _decompress(filename, threads)
+    else:
+        fp, proc = open(filename, 'rb', buffering=BUFSIZE), None
+    names = None
+    for line in fp:
+        if line.startswith(b'VARNAMES:'):
+            names = line.decode('utf-8', 'replace').replace(',', ' ').split()
+        elif line.startswith(DATA_PREFIXES):
+            break
+    else:
+        line = b'' #Header but no rows
+    if names is None:
+        _Body(b'', fp, proc).close()
+        raise ValueError("Couldn't find VARNAMES in " + filename)
+    return names, io.BufferedReader(_Body(line, fp, proc), BUFSIZE)
+
+
+def read_body(stream, names, columns=None, cut=None, nrows=0, chunksize=CHUNKSIZE, workers=1, each=None):
+    """
+    Parses the data rows from open_fitres into a dataframe, and closes the stream.
+
+    columns: only parse these columns. Default is all of them.
+    cut: a row-wise @@CUT string in terms of df. The file is then parsed chunksize rows at a time
+         and the cut applied to each chunk, so rows that fail the cut are never all held at once.
+    nrows: stop after this many rows. 0 reads the whole file.
+    workers: parse the file in blocks in this many threads at once (see the top of the file), and apply
+             the cut to each block. Only for whole files, nrows is always read in one thread.
+    each: with a cut, called with every chunk (or block), in order, before it gets cut. Eg, to cache every row.
+    """
+    if workers > 1 and nrows == 0:
+        return read_parallel(stream, names, columns, cut, workers, each=each)
+    if not cut:
+        with stream:
+            return pd.read_csv(stream, **_csv_kwargs(names, columns, nrows))
+    cut = expressions.compile_cut(cut)
+    chunks = []
+    heads = []
+    for df in iter_chunks(stream, names, columns, nrows, chunksize):
+        if each: each(df)
+        heads.append(df.iloc[:1])
+        chunks.append(cut(df))
+    if not chunks:
+        return pd.DataFrame(columns=columns if columns is not None else names)
+    return _join(chunks, heads)
+
+
+def piece_rows(names):
+    """How many rows pandas' C parser turns into numbers at a time, for a file with the columns in names. Each piece gets its own types."""
+    rows = 1
+    while rows*2 < 2**20//len(names):
+        rows *= 2
+    return rows
+
+
+def iter_chunks(stream, names, columns=None, nrows=0, chunksize=CHUNKSIZE):
+    """
+    Like read_body, but yields the rows chunksize at a time instead of all at once (rounded up to whole
+    pieces, see piece_rows). The index carries on from one chunk to the next, so it's always the row number in the file.
+    """
+    pieces = piece_rows(names)
+    chunksize = -(-chunksize//pieces)*pieces
+    with stream:
+        yield from pd.read_csv(stream, chunksize=chunksize, **_csv_kwargs(names, columns, nrows))
+
+
+def _row_ends(block):
+    """Where each row of block ends (just after its newline), leaving out the comments and blank lines that pandas skips."""
+    data = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord('\n')) + 1
+    starts = np.concatenate([[0], ends])[:-1]
+    first = data[np.minimum(starts, len(data) - 1)]
+    rows = (first != ord('#')) & (ends - starts > 1)
+    for i in np.flatnonzero(rows & np.isin(first, list(b' \t\r'))): #Only whitespace isn't a row either
+        rows[i] = bool(block[starts[i]:ends[i]].strip())
+    return ends[rows]
+
+
+def iter_blocks(stream, blocksize=BLOCKSIZE, rows=1):
+    """
+    Yields the stream about blocksize bytes at a time, always ending at the end of a row, and (apart from
+    the last block) after a multiple of rows rows.
+    """
+    carry = b''
+    size = blocksize
+    while True:
+        block = stream.read(size)
+        if not block:
+            if carry.strip(): yield carry #The last rows, maybe without a newline at the end
+            return
+        block = carry + block
+        ends = _row_ends(block)
+        n = len(ends)//rows*rows
+        if n == 0: #Not enough rows yet, so read as much again
+            carry = block
+            size = max(size, len(block))
+            continue
+        carry = block[ends[n-1]:]
+        size = blocksize
+        yield block[:ends[n-1]]
+
+
+def _parse_block(block, names, columns, cut=None, whole=False):
+    """
+    block parsed and cut, with the index counting from 0. Returns its number of rows, its first row (before the
+    cut) and the whole block too with whole, as well as what passed the cut. None if it's all comments.
+    """
+    try:
+        df = pd.read_csv(io.BytesIO(block), **_csv_kwargs(names, columns, 0))
+    except pd.errors.EmptyDataError:
+        return None
+    if len(df) == 0: #Its columns would all be object, which would turn the same columns of the other blocks into objects too
+        return None
+    return len(df), df.iloc[:1], df if whole else None, cut(df) if cut else df
+
+
+def _join(chunks, heads):
+    """
+    pd.concat of chunks that have been cut, with each column given the type it has in the whole file, which
+    the first rows of the chunks before the cut (heads) give. Eg, a column that's numbers in some chunks and
+    text in others is object, even if only the numbers got through the cut.
+    """
+    df = pd.concat(chunks)
+    mixed = [c for c in df.columns if len({h[c].dtype for h in heads}) > 1]
+    if mixed:
+        dtypes = pd.concat(heads).dtypes
+        df = df.astype({c: dtypes[c] for c in mixed})
+    return df
+
+
+def read_parallel(stream, names, columns=None, cut=None, workers=WORKERS, blocksize=BLOCKSIZE, rows=None, each=None):
+    """
+    read_body in workers threads, a block at a time. Closes the stream. Each block holds a multiple of rows
+    rows, piece_rows by default, see the top of the file.
+    """
+    cut = expressions.compile_cut(cut) if cut else None
+    pending = deque()
+    chunks = []
+    heads = []
+    start = 0
+    def collect(result):
+        nonlocal start
+        if result is None:
+            return
+        n, head, whole, df = result
+        if each: each(whole)
+        if cut: df.index = df.index + start #Row numbers in the file, like iter_chunks
+        start += n
+        heads.append(head)
+        chunks.append(df)
+    with stream, ThreadPoolExecutor(workers) as pool:
+        for block in iter_blocks(stream, blocksize, rows or piece_rows(names)):
+            pending.append(pool.submit(_parse_block, block, names, columns, cut, each is not None and bool(cut)))
+            while len(pending) > 2*workers: #Don't read ahead of the threads by more than a couple of blocks each
+                collect(pending.popleft().result())
+        while pending:
+            collect(pending.popleft().result())
+    if not chunks:
+        return pd.DataFrame(columns=columns if columns is not None else names)
+    return _join(chunks, heads) if cut else pd.concat(chunks, ignore_index=True)
+
+
+def _csv_kwargs(names, columns, nrows):
+    kwargs = dict(header=None, names=names, usecols=columns, sep=r"\s+", skip_blank_lines=True, comment='#')
+    if nrows != 0: kwargs['nrows'] = nrows
+    return kwargs
+
+
+def read_fitres(filename, columns=None, cut=None, nrows=0, threads=0, workers=1):
+    """Open and read filename in one go. Returns the column names in the file and the dataframe."""
+    names, stream = open_fitres(filename, threads)
+    if columns is not None: columns = [c for c in names if c in columns]
+    return names, read_body(stream, names, columns, cut, nrows, workers=workers)
@@ -0,0 +1,167 @@
+"""
+Everything that gets counted or averaged in the bins of a plot.
+
+Each file's x values are put into bins once (a binary search of the sorted edges), and the counts,
+binned medians and percentiles all come from that one split. For the medians, the y values are sorted
+once within each bin, so every median (and the 16/84% bands) is just a lookup. The bins follow the
+same rules as scipy's binned_statistic, including its tolerance for values on the last edge and
+taking the middle two sorted values (NaN last) for medians, so the numbers are the same as they've
+always been.
+
+Bootstrap errors on the binned medians (@@ERRORS) don't resample the rows at all. Once a bin is sorted, the
+median of a resample of it is just one (or the mean of two) of its sorted values, and which one follows the
+order statistics of uniform random numbers, which are Beta distributed. So each resample is a couple of
+random numbers per bin, drawn for every bin and resample at once, however many rows there are.
+
+Poisson intervals of whole-number counts come out of a table that's built once (and grown as needed),
+since the same small counts turn up in every bin of every plot. Normalised counts, which usually aren't
+whole numbers, still get worked out directly.
+"""
+import numpy as np
+
+TABLE_MAX = 2**20 #Counts past this get their Poisson interval worked out directly
+_TABLES = {} #alpha: (low, high) for counts 0, 1, 2, ...
+
+
+def bin_index(x, bins):
+    """
+    Which of the bins each x is in, -1 or len(bins)-1 if it's outside them (or NaN). The last bin includes
+    its right edge, like binned_statistic and np.histogram.
+    """
+    x = np.asarray(x)
+    edges = np.asarray(bins, x.dtype if np.issubdtype(x.dtype, np.floating) else float)
+    idx = np.searchsorted(edges, x, side='right') - 1
+    if len(edges) > 1:
+        decimal = int(-np.log10(np.diff(edges).min())) + 6 #binned_statistic's rounding for being on the last edge
+        idx[(x >= edges[-1]) & (np.around(x, decimal) == np.around(edges[-1], decimal))] -= 1
+    return idx
+
+
+def hist_counts_all(arrays, bins):
+    """Counts in the bins for each of the arrays, in a single np.bincount. Returns an array of shape (len(arrays), len(bins)-1)."""
+    nbins = len(bins) - 1
+    flat = []
+    for n, x in enumerate(arrays):
+        idx = bin_index(x, bins)
+        flat.append(idx[(idx >= 0) & (idx < nbins)] + n*nbins)
+    flat = np.concatenate(flat) if flat else np.zeros(0, dtype=int)
+    return np.bincount(flat, minlength=len(arrays)*nbins).reshape(len(arrays), nbins).astype(float)
+
+
+class BinnedData:
+    """The x (and y) values of one file split up into bins."""
+    def __init__(self, x, bins, y=None):
+        self.bins = np.asarray(bins)
+        self.nbins = len(bins) - 1
+        idx = bin_index(x, bins)
+        inside = (idx >= 0) & (idx < self.nbins)
+        self.idx = idx[inside]
+        self.counts = np.bincount(self.idx, minlength=self.nbins).astype(float)
+        self.y = np.asarray(y)[inside] if y is not None else None
+        self._sorted = None
+
+    def hist_counts(self):
+        return self.counts.copy()
+
+    def _groups(self):
+        """y sorted by bin, and by value within each bin (NaN last), with where each bin starts."""
+        if self._sorted is None:
+            ys = self.y[np.argsort(self.idx, kind='stable')]
+            starts = np.concatenate([[0], np.cumsum(self.counts.astype(int))])
+            for i in np.nonzero(self.counts)[0]: #Sorting each bin on its own is a lot quicker than one np.lexsort
+                ys[starts[i]:starts[i+1]].sort()
+            self._sorted = ys, starts
+        return self._sorted
+
+    def binned_median(self):
+        """The median y in each bin, NaN for empty ones."""
+        ys, starts = self._groups()
+        out = np.full(self.nbins, np.nan)
+        full = self.counts > 0
+        mid = starts[:-1][full] + (self.counts[full] - 1)/2
+        out[full] = (ys[np.floor(mid).astype(int)] + ys[np.ceil(mid).astype(int)])/2
+        return out
+
+    def binned_quantile(self, q):
+        """The q quantile (0 to 1) of y in each bin, NaN for empty ones."""
+        ys, starts = self._groups()
+        out = np.full(self.nbins, np.nan)
+        for i in np.nonzero(self.counts)[0]:
+            out[i] = np.quantile(ys[starts[i]:starts[i+1]], q)
+        return out
+
+    def bootstrap_median(self, nboot, seed=0):
+        """The medians of nboot bootstrap resamples of y in each bin, shape (nbins, nboot). NaN for empty bins."""
+        ys, starts = self._groups()
+        lo, hi, full = bootstrap_ranks(self.counts, nboot, seed)
+        if not len(ys):
+            return np.full(lo.shape, np.nan)
+        first = starts[:-1, None]
+        out = (ys[np.minimum(first + lo, len(ys) - 1)] + ys[np.minimum(first + hi, len(ys) - 1)])/2
+        out[~full] = np.nan
+        return out
+
+
+def bootstrap_ranks(counts, nboot, seed=0):
+    """
+    Where the middle two values of nboot bootstrap resamples of each bin fall in its sorted values, as arrays of
+    shape (len(counts), nboot), and which bins have any values. For an odd count both are the same. The k-th
+    smallest of n uniforms is Beta(k, n-k+1), and the next one up is that plus Beta(1, n-k) of what's left.
+    seed is anything np.random.default_rng takes, so a Generator carries on where it left off.
+    """
+    rng = np.random.default_rng(seed)
+    n = np.asarray(counts, dtype=int)
+    full = n > 0
+    n = np.where(full, n, 1)[:, None]
+    m = (n + 1)//2 #The lower middle one, counting from 1
+    u = rng.beta(m, n - m + 1, size=(len(n), nboot))
+    v = rng.beta(1, np.maximum(n - m, 1), size=(len(n), nboot))
+    lo = np.minimum(np.floor(n*u), n - 1).astype(int)
+    hi = np.where(n % 2 == 0, np.minimum(np.floor(n*(u + (1 - u)*v)), n - 1).astype(int), lo)
+    return lo, hi, full
+
+
+def bootstrap_band(draws, median, q=(16., 84.)):
+    """[below, above] median of the q percentiles of the bootstrap draws (one row per bin), for plt.errorbar."""
+    with np.errstate(invalid='ignore'):
+        low, high = np.percentile(draws, q, axis=1)
+        return [np.maximum(median - low, 0), np.maximum(high - median, 0)]
+
+
+def _table(alpha, n):
+    """Poisson intervals of the counts 0 to at least n."""
+    table = _TABLES.get(alpha)
+    if table is None or len(table[0]) <= n:
+        size = 4096
+        while size <= n: size *= 2
+        k = np.arange(size, dtype=float)
+        table = _interval(k, alpha)
+        _TABLES[alpha] = table
+    return table
+
+
+def _interval(k, alpha):
+    """chi2.ppf(q, 2k)/2 is gammaincinv(k, q), which comes from scipy.special without the second it takes to import scipy.stats."""
+    from scipy.special import gammaincinv
+    a = alpha
+    low, high = (gammaincinv(k, a/2), gammaincinv(k + 1, 1-a/2))
+    low[k == 0] = 0.0
+    return low, high
+
+
+def poisson_interval(k, alpha=0.32):
+    """
+    uses chisquared info to get the poisson interval. Uses scipy.special
+    (imports in function).
+    (http://stackoverflow.com/questions/14813530/poisson-confidence-interval-with-numpy)
+    Whole-number counts are looked up in a table instead.
+    """
+    k = np.asarray(k, dtype=float)
+    whole = (k >= 0) & (k < TABLE_MAX) & (k == np.round(k))
+    low, high = np.empty(k.shape), np.empty(k.shape)
+    if whole.any():
+        table = _table(alpha, int(k[whole].max()))
+        low[whole], high[whole] = table[0][k[whole].astype(int)], table[1][k[whole].astype(int)]
+    if not whole.all():
+        low[~whole], high[~whole] = _interval(k[~whole], alpha)
+    return low, high
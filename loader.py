@@ -0,0 +1,145 @@
+"""
+Loading one FITRES file all the way from disk to the values that get plotted.
+
+This is everything the plotter does to a single file before the files get compared: find it in the
+cache or parse it, apply the @@CUT, and evaluate the @@VARIABLE expressions into x_plot_val and
+y_plot_val. It lives out here rather than in plotter-class.py so that several files can be loaded by
+separate worker processes at once.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import fitres_cache
+import fitres_reader
+import expressions
+import profiling
+import compact
+import rowindex
+
+
+def load_fitres(filename, plotdic, CUT=None, DIFF=None, NROWS=0, USECACHE=True, CACHEDIR=fitres_cache.CACHE_DIR,
+                CACHESIZE=fitres_cache.CACHE_SIZE, GZTHREADS=0, COMPACT=False, SAMPLE=0, SEED=0, THREADS=1):
+    """
+    Returns the dataframe for filename after the cut, with x_plot_val (and y_plot_val for 2D plots) added,
+    or with COMPACT a compact.PlotData of just those (and the CIDs for DIFF). SAMPLE reads a random sample of
+    the rows instead of all of them, see read_table.
+    Raises FileNotFoundError/ValueError if the file can't be read, expressions.ExpressionError if the
+    cut or the plot expressions aren't allowed, and AttributeError if one of them refers to something
+    that isn't in the file.
+    """
+    df, cutdone = read_table(filename, list(plotdic.values()), CUT, DIFF, NROWS, USECACHE, CACHEDIR, CACHESIZE, GZTHREADS, SAMPLE=SAMPLE, SEED=SEED,
+                             THREADS=THREADS)
+    df = plot_values(df, plotdic, None if cutdone else CUT, filename, COMPACT, DIFF)
+    print("Done loading", filename.split("/")[-1])
+    return df
+
+
+def read_table(filename, exprs, CUT=None, DIFF=None, NROWS=0, USECACHE=True, CACHEDIR=fitres_cache.CACHE_DIR,
+               CACHESIZE=fitres_cache.CACHE_SIZE, GZTHREADS=0, COMPACT=False, SAMPLE=0, SEED=0, THREADS=1):
+    """
+    The columns of filename that the expressions in exprs and CUT need, from the cache or parsed. Returns the
+    dataframe (a compact.CompactTable with COMPACT) and whether CUT has already been applied, which happens
+    when the file gets parsed and the cut can be done while reading (the whole file still goes in the cache, a
+    chunk at a time). Give CUT=None to always get every row.
+    SAMPLE (a fraction, or a number of rows if it's 1 or more) only keeps a random sample of the rows, picked
+    with SEED. Files that aren't cached are then read with rowindex, which only parses the rows picked.
+    Whole files are parsed in THREADS threads, see fitres_reader.read_parallel.
+    """
+    print("Loading ", filename.split("/")[-1], "...") #Inform that we're loading the file.
+    wanted = expressions.referenced_columns(list(exprs) + [CUT])
+    if (wanted is not None) and DIFF: wanted.add('CID')
+    optional = ('IDSURVEY',) if DIFF == 'CID' else () #Same CID in different surveys isn't the same SN
+    rowcut = bool(CUT) and expressions.is_rowwise(CUT) #Can the cut be applied while the file is still being read?
+
+    Names1 = fitres_cache.cached_header(filename, CACHEDIR) if USECACHE else None
+    df = None
+    if Names1 is not None:
+        with profiling.stage('cache_load', filename):
+            df = fitres_cache.load_cached(filename, CACHEDIR, expressions.project(wanted, Names1, optional)) #Only read the columns the plot actually uses
+    pushdown = False
+    if df is not None:
+        print("Found", filename.split("/")[-1], "in the cache.")
+        if NROWS != 0: df = df.head(NROWS)
+        if SAMPLE: df = df.take(rowindex.sample_rows(len(df), SAMPLE, SEED)) #Same rows as reading the sample from the file
+    else:
+        with profiling.stage('header', filename):
+            Names1, body = fitres_reader.open_fitres(filename, GZTHREADS) #Get the column names and a stream of the rows
+        columns = expressions.project(wanted, Names1, optional)
+        if SAMPLE: #Only the rows picked get parsed. Samples don't go in the cache
+            body.close()
+            df = rowindex.read_sample(filename, Names1, columns, SAMPLE, SEED, NROWS, CACHEDIR, GZTHREADS)
+        elif USECACHE and (NROWS == 0): #Every row goes in the cache, but only the ones that pass a row-wise cut are kept
+            pushdown = rowcut
+            writer = fitres_cache.Writer(filename, Names1, CACHEDIR, CACHESIZE)
+            with profiling.stage('parse', filename): #Includes decompressing, and with the cut, writing each chunk to the cache
+                df = fitres_reader.read_body(body, Names1, columns, cut=CUT if rowcut else None, workers=THREADS,
+                                             each=writer.add if rowcut else None)
+            with profiling.stage('cache_store', filename):
+                if not rowcut: writer.add(df)
+                writer.close()
+        else:
+            pushdown = rowcut
+            with profiling.stage('parse', filename):
+                df = fitres_reader.read_body(body, Names1, columns, cut=CUT if rowcut else None, nrows=NROWS, workers=THREADS)
+    if 'CID' not in Names1:
+        print("No CIDs present in this file. Making note of that here.")
+    if COMPACT:
+        with profiling.stage('compact', filename):
+            df = compact.CompactTable(df)
+    return df, pushdown
+
+
+def plot_values(df, plotdic, CUT=None, name=None, COMPACT=False, DIFF=None):
+    """
+    Applies CUT to df and adds x_plot_val (and y_plot_val). df itself is left alone, so it can be reused for other plots.
+    df can also be a compact.CompactTable. With COMPACT, returns a compact.PlotData named name instead of the
+    dataframe, which only keeps the plotted values (and the CIDs for DIFF).
+    """
+    if isinstance(df, compact.CompactTable): #Only the columns the cut and expressions use get unpacked
+        wanted = expressions.referenced_columns(list(plotdic.values()) + [CUT])
+        df = df.frame(None if wanted is None else wanted | ({'CID', 'IDSURVEY'} if DIFF else set()))
+    with profiling.stage('cut', name):
+        df = expressions.compile_cut(CUT)(df) if CUT else df
+    with profiling.stage('expr', name):
+        df = df.copy(deep=False)
+        df['x_plot_val'] = expressions.compile_expr(plotdic['x'])(df)
+        if len(plotdic) == 2:
+            df['y_plot_val'] = expressions.compile_expr(plotdic['y'])(df)
+    if COMPACT:
+        return compact.PlotData(df, name, keep=('CID', 'IDSURVEY') if DIFF else ())
+    return df
+
+
+def _call(job):
+    """Runs one job in a worker process, and sends back its @@PROFILE stages along with what it returned."""
+    func, args, kwargs, profile = job
+    if not profile:
+        return func(*args, **kwargs), []
+    profiling.start(**profile)
+    try:
+        out = func(*args, **kwargs)
+    finally:
+        records = profiling.stop()
+    return out, records
+
+
+def run_parallel(func, arglist, JOBS=1, **kwargs):
+    """
+    func(*args, **kwargs) for every args in arglist, returned as a list in the same order.
+    With JOBS > 1 they're run in that many worker processes at once. They're always forked, whatever the
+    default start method is (spawn on macOS, and on Linux from python 3.14), since a spawned worker would
+    run plotter-class.py all over again when it imports it.
+    """
+    if JOBS <= 1 or len(arglist) == 1:
+        return [func(*args, **kwargs) for args in arglist]
+    profile = profiling.ENABLED and dict(memory=profiling.MEMORY) #Workers profile themselves the same way
+    with ProcessPoolExecutor(max_workers=min(JOBS, len(arglist)), mp_context=multiprocessing.get_context('fork')) as pool:
+        results = list(pool.map(_call, [(func, args, kwargs, profile) for args in arglist]))
+    for out, records in results:
+        profiling.add(records)
+    return [out for out, records in results]
+
+
+def load_all(filenames, plotdic, JOBS=1, **kwargs):
+    """load_fitres for every file in filenames, returned as a list in the same order."""
+    return run_parallel(load_fitres, [(l, plotdic) for l in filenames], JOBS, **kwargs)
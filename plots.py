@@ -0,0 +1,191 @@
+"""
+Turning the loaded FITRES files into a figure.
+
+plotter-class.py reads the command line, loads the files and calls plotter_func, but everything here
+works from the options alone, so the same plots can be made from elsewhere, eg, by batch.py for a whole
+list of plots that share the same files.
+"""
+import numpy as np
+
+import streaming
+import histograms
+import cidjoin
+import rendering
+import profiling
+
+
+def parse_variable(VARIABLE):
+    """{'x': ..., 'y': ...} from the colon separated @@VARIABLE. Histograms only have x."""
+    plotdic = {}
+    for n,VAR in enumerate(VARIABLE.split(":")):
+        if n == 0:
+            plotdic['x'] = str(VAR) 
+        else:
+            plotdic['y'] = str(VAR) 
+    return plotdic
+
+
+def parse_bounds(BOUNDS):
+    """{'x': [min, max, binsize], 'y': [min, max, ...]} from @@BOUNDS, or {} for loose bounds. ValueError if they don't make sense."""
+    boundsdic = {}
+    if (len(BOUNDS) != 5):
+        BOUNDS = ' '.join([str(elem) for elem in BOUNDS])         
+        if BOUNDS.strip() == 'loose':
+            return boundsdic
+        if all(BND.count(':') == 2 for BND in BOUNDS.split()): #min:max:binsize for each axis, like the README shows
+            BOUNDS = ':'.join(BND.replace(':', ' ') for BND in BOUNDS.split())
+        for n,BND in enumerate(BOUNDS.split(':')):           
+            if n == 0:     
+                boundsdic['x'] = [float(i) for i in BND.split()]            
+            else:                                                   
+                boundsdic['y'] = [float(i) for i in BND.split()]
+    if len(boundsdic.get('x', [0]*3)) != 3 or len(boundsdic.get('y', [0]*2)) < 2:
+        raise ValueError("@@BOUNDS needs min max binsize for x (and min max binsize for y after a colon), eg, @@BOUNDS -.4 .42 .02 or -.4:.42:.02")
+    return boundsdic
+
+
+def get_keynames(FILENAME):
+    """Labels for the files: the file name, with as many of the directories above it as it takes to tell them apart."""
+    keynames = []
+    for l in FILENAME:
+        keycount = -1
+        keyname = l.split("/")[keycount]
+        while keyname in keynames:
+            keycount -= 1
+            keyname = l.split("/")[keycount]
+        keynames.append(keyname)
+        #need to comb through existing keys in dictionary and make sure there are no overlaps
+    return keynames
+
+
+def get_bins(boundsdic):
+    if 'x' in boundsdic: #Custom bounds                       
+        return np.arange(boundsdic['x'][0],boundsdic['x'][1],boundsdic['x'][2])                                                           
+    else:                                   
+        return np.linspace(boundsdic[min(boundsdic, key=boundsdic.get)], boundsdic[max(boundsdic, key=boundsdic.get)], 30)            
+
+def plotter_func(dictionary, DIFF, plotdic, boundsdic, CUT, ALPHA, BANDS=False, RASTER=rendering.RASTER, CONTOUR=False, ERRORS=0, SEED=0):
+    """Draws the plot on the current figure. ERRORS is the number of bootstrap resamples for error bars on the medians, 0 for none."""
+    import matplotlib.pyplot as plt #Only imported once there's something to draw, see @@STATS
+    rng = np.random.default_rng(SEED) #One generator for all the bootstraps, so the same SEED gives the same plot
+    bins = get_bins(boundsdic)
+    custom_bounds = 'x' in boundsdic
+    xlim = boundsdic['x'][:2] if custom_bounds else None
+    ylim = boundsdic['y'][:2] if 'y' in boundsdic else None
+    if custom_bounds:                       
+        plt.xlim([boundsdic['x'][0], boundsdic['x'][1]])  
+    if len(plotdic) == 1:                           
+        if (DIFF == 'ALL') or (DIFF == 'CID'):
+            print("The DIFF feature does not work for histograms. Quitting to avoid confusion.")
+            quit()
+
+        with profiling.stage('binning'):
+            allcounts = streaming.hist_counts_all(dictionary, bins) #Every file's counts in one go
+        for n,name in enumerate(dictionary):           
+            k = dictionary[name]                       
+            print('The upper and lower bounds are:', np.around(bins[0],4), 'and', np.around(bins[-1],4), 'respectively')    
+            if n == 1:                              
+                sb = allcounts[n] #Get counts                                
+                errl,erru = histograms.poisson_interval(np.sum(db)*sb/np.sum(sb)) 
+                sb = np.sum(db)*sb/np.sum(sb)
+                plt.errorbar((bins[1:] + bins[:-1])/2., sb, yerr=[sb-errl, erru-sb], label=name, fmt='o')                    
+            else:                                   
+                db = allcounts[n] #Get counts                                
+                errl,erru = histograms.poisson_interval(db) #And error for those counts                                                
+                plt.errorbar((bins[1:] + bins[:-1])/2., db, label=name, yerr=[db-errl, erru-db], fmt='o')                 
+            mean, median, std = streaming.describe(k)
+            print("The Mean value for ", name, " is:", mean)                                                      
+            print("The Median value for ", name, " is:", median)                                                  
+            print("The standard deviation value for ", name, " is:", std)                                         
+        plt.xlabel(plotdic['x'])  #In this case, VAR = [string], so we're going to strip the list.                     
+        plt.legend()                                
+        if CUT: plt.title(CUT)
+    elif (DIFF == 'CID') or (DIFF == 'ALL'):
+        print("plotting DIFF option now")
+        if len(plotdic) == 2: 
+            try:         
+                plt.ylim([boundsdic['y'][0], boundsdic['y'][1]])            
+            except KeyError:     
+                pass  
+        keylist = list(dictionary.keys())
+        differator = dictionary[keylist[0]]
+        with profiling.stage('binning', keylist[0]):
+            binned_differator = streaming.binned(differator, bins)
+        if DIFF == 'CID':
+            bysurvey = all('IDSURVEY' in dictionary[name].columns for name in keylist)
+            with profiling.stage('join', keylist[0]):
+                cids = cidjoin.CIDJoin(differator['CID'], differator['IDSURVEY'] if bysurvey else None) #Only needs doing once for all the files
+        for name in keylist[1:]:
+            k = dictionary[name]
+            if DIFF == 'CID':
+                #need to do an inner join with each entry in dic, then plot the diff
+                with profiling.stage('join', name):
+                    ref, other = cids.match(k['CID'], k['IDSURVEY'] if bysurvey else None) #Thank you to Charlie for the original join
+                    xjoin = differator.x_plot_val.values[ref]
+                    ydiff = differator.y_plot_val.values[ref] - k.y_plot_val.values[other]
+                with profiling.stage('draw', name):
+                    rendering.points(xjoin, ydiff, 'Diff', ALPHA, RASTER, CONTOUR, xlim, ylim)
+                with profiling.stage('binning', name):
+                    binned_diff = histograms.BinnedData(xjoin, bins, ydiff)
+                    avgdiff = binned_diff.binned_median()                                     
+                plt.scatter((bins[1:] + bins[:-1])/2, avgdiff, label="Mean Difference", color='k')
+                if ERRORS:
+                    with profiling.stage('bootstrap', name):
+                        yerr = histograms.bootstrap_band(binned_diff.bootstrap_median(ERRORS, rng), avgdiff)
+                    plt.errorbar((bins[1:] + bins[:-1])/2, avgdiff, yerr=yerr, fmt='none', color='k')
+                if BANDS:
+                    with profiling.stage('binning', name):
+                        lo, hi = [binned_diff.binned_quantile(q) for q in (0.16, 0.84)]
+                    plt.fill_between((bins[1:] + bins[:-1])/2, lo, hi, color='k', alpha=0.2, label="16-84%")
+            elif (DIFF == 'ALL'):
+                try:
+                    if getattr(differator, 'complete', True) and getattr(k, 'complete', True): #Row by row only makes sense if we have every row
+                        with profiling.stage('draw', name):
+                            rendering.points(differator.x_plot_val, differator.y_plot_val - k.y_plot_val, keylist[0]+" - "+name, ALPHA, RASTER, CONTOUR, xlim, ylim)
+                except ValueError:
+                    pass
+                with profiling.stage('binning', name):
+                    median_differator = binned_differator.binned_median()
+                    binned = streaming.binned(k, bins)
+                    median = binned.binned_median()
+                points = plt.scatter((bins[1:] + bins[:-1])/2., median_differator - median, 
+                            label=keylist[0]+" - "+name+" median", marker="^", zorder=10)
+                if ERRORS: #The two files are resampled independently
+                    with profiling.stage('bootstrap', name):
+                        draws = binned_differator.bootstrap_median(ERRORS, rng) - binned.bootstrap_median(ERRORS, rng)
+                        yerr = histograms.bootstrap_band(draws, median_differator - median)
+                    plt.errorbar((bins[1:] + bins[:-1])/2., median_differator - median, yerr=yerr, fmt='none', color=points.get_facecolor()[0], zorder=10)
+            else:  
+                print("You gave "+str(DIFF))                               
+                print("That is not a valid DIFF option. Quitting.")               
+                quit()  
+            plt.xlabel(plotdic['x'])                    
+            plt.ylabel(plotdic['y']+" diff")                    
+            plt.legend()                                
+            if CUT: plt.title(CUT)       
+    else:    
+        try:
+            plt.ylim([boundsdic['y'][0], boundsdic['y'][1]]) 
+        except KeyError:
+            pass
+        for name in dictionary:                        
+            k = dictionary[name]                       
+            with profiling.stage('draw', name):
+                rendering.points(k.x_plot_val, k.y_plot_val, name, ALPHA, RASTER, CONTOUR, xlim, ylim, zorder=0, **streaming.raster(k))
+            with profiling.stage('binning', name):
+                binned = streaming.binned(k, bins) #Split into bins once for the median and the bands
+                median = binned.binned_median() #Get counts                
+            points = plt.scatter((bins[1:] + bins[:-1])/2., median, label=name+" median", marker="^", zorder=10)           
+            if ERRORS:
+                with profiling.stage('bootstrap', name):
+                    yerr = histograms.bootstrap_band(binned.bootstrap_median(ERRORS, rng), median)
+                plt.errorbar((bins[1:] + bins[:-1])/2., median, yerr=yerr, fmt='none', color=points.get_facecolor()[0], zorder=10)
+            if BANDS:
+                with profiling.stage('binning', name):
+                    lo, hi = [binned.binned_quantile(q) for q in (0.16, 0.84)]
+                plt.fill_between((bins[1:] + bins[:-1])/2., lo, hi, color=points.get_facecolor()[0], alpha=0.2, label=name+" 16-84%", zorder=5)
+        plt.xlabel(plotdic['x'])                    
+        plt.ylabel(plotdic['y'])                    
+        plt.legend()                                
+        if CUT: plt.title(CUT) 
+    return
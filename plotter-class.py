@@ -3,13 +3,24 @@ import os
 import pandas as pd
 import numpy as np
 import sys
-import matplotlib.pyplot as plt
 
 import argparse
 from argparse import RawTextHelpFormatter
 parser=argparse.ArgumentParser(formatter_class=RawTextHelpFormatter, prefix_chars='@')
-from scipy.stats import binned_statistic
-import distutils.util 
+import fitres_cache
+import fitres_reader
+import loader
+import streaming
+import expressions
+import rendering
+import plots
+import server
+import stats
+import profiling
+import compact
+import aggregate
+import watch
+import corner
 
 """
 How do I use this plotter? Well, first you're going to need to present your M0DIF/FITRES/HOSTLIB files!
@@ -56,8 +67,49 @@ CID will plot the per-CID difference.
 parser.add_argument('@@ALPHA', default=0.3, type=float, help='Alpha value for plotting. Set to 0 if you just want to see averages. If you set ALPHA = 0 and DIFF = True, you can compare the average difference between the two files even if there are no overlapping CIDS.')
 parser.add_argument("@@CUT", help="NEEDS TO BE GIVEN IN QUOTATION MARKS!!! SUPER IMPORTANT!!! This takes the form of a df.loc[] option, typically. Any sort of cuts you want to make.", nargs="+")
 parser.add_argument("@@NROWS", help="choose number of rows to read in for larger files", type=int, default=0)
+parser.add_argument("@@SAMPLE", help="""Read a uniform random sample of the rows instead of all of them: a fraction if it's less than 1, otherwise a number of rows. \n
+Unlike @@NROWS it isn't just the top of the file. Only the rows picked get parsed, using an index of where each row starts, which is made the first time and kept next to the file. @@SEED picks the rows.""", type=float, default=0)
+parser.add_argument("@@GZTHREADS", help="Decompress gzipped FITRES files with pigz using this many threads, alongside the parsing. Default (0) decompresses in python.", type=int, default=0)
+parser.add_argument("@@THREADS", help="""Threads for parsing each file the first time it's read (before it's in the cache). The rows are split into blocks that get parsed at the same time. \n
+Default is the number of cores divided by @@JOBS. 1 parses in one go, like before.""", type=int, default=None)
+parser.add_argument("@@JOBS", help="Number of files to load at the same time, each in its own process. Default is one at a time.", type=int, default=1)
+parser.add_argument("@@STREAM", help="""Read the files a chunk of rows at a time and only keep running totals, so files of any size fit in memory. \n
+Give a number to set the rows per chunk. The scatter plots show a random sample of @@NPOINTS rows. Replaces @@NROWS for big files.""", type=int, nargs='?', const=streaming.CHUNKSIZE, default=0)
+parser.add_argument("@@NPOINTS", help="Number of randomly chosen points drawn in scatter plots with @@STREAM.", type=int, default=streaming.NPOINTS)
+parser.add_argument("@@BANDS", help="Shade the 16th to 84th percentile of y in each bin around the medians of 2D and DIFF CID plots.", action='store_true')
+parser.add_argument("@@ACCURACY", help="Accuracy of the medians and percentiles worked out with @@STREAM and @@WATCH, as a fraction of the range of y. Default is 0.0001.", type=float, default=streaming.sketches.ACCURACY)
+parser.add_argument("@@RASTER", help="Files with more than this many points get drawn as a density image instead of a scatter plot in 2D and DIFF plots, which is much quicker and keeps @@SAVE files small. 0 always does, -1 never does.", type=int, default=rendering.RASTER)
+parser.add_argument("@@CONTOUR", help="Draw density contours instead of a density image for files past @@RASTER points.", action='store_true')
+parser.add_argument("@@ERRORS", help="""Bootstrap error bars (16th to 84th percentile) on the binned medians of 2D and DIFF plots, from this many resamples. Default is 1000. \n
+Quick enough for millions of rows, since each resample only needs a couple of random numbers per bin.""", type=int, nargs='?', const=1000, default=0)
+parser.add_argument("@@SEED", help="Random seed for @@ERRORS and @@SAMPLE, so the error bars and samples come out the same every time. Default is 0.", type=int, default=0)
+parser.add_argument("@@BATCH", help="""A file listing many plots to make in one go, one per line, written with the same @@ options as the command line. \n
+Options left out of a line are taken from the command line. Each FITRES file is only read once, and the plots are saved straight to their @@SAVE files without being shown. @@JOBS draws that many at once.""")
+parser.add_argument("@@SERVE", help="""Keep running as a plot server, holding the files in memory between plots, and draw whatever plotter-client.py asks for. \n
+Give a socket path, a port or host:port to listen on. Defaults to $MIDWAY_SOCKET, or a socket in the temp directory.""", nargs='?', const=server.ADDRESS, default=None)
+parser.add_argument("@@SERVERMEM", help="GB of FITRES tables the plot server keeps in memory. The least recently used ones get dropped past this.", type=float, default=server.MEMORY)
+parser.add_argument("@@STATS", help="""Just print the statistics of each file (rows, mean, median, standard deviation, counts and Poisson errors in each bin, binned medians for 2D plots) without plotting anything. \n
+Skips importing matplotlib, so it's quick. Give json to get them as one JSON object instead.""", nargs='?', const='text', choices=['text', 'json'])
+parser.add_argument("@@NOCACHE", help="Don't read from or write to the FITRES cache. By default parsed files are cached so they load much faster the next time.", action='store_true')
+parser.add_argument("@@CLEARCACHE", help="Empty the FITRES cache before loading anything.", action='store_true')
+parser.add_argument("@@CACHEDIR", help="Directory for the FITRES cache. Defaults to $MIDWAY_CACHE_DIR, or ~/.cache/midwayplotter if that isn't set.", default=fitres_cache.CACHE_DIR)
+parser.add_argument("@@CACHESIZE", help="Maximum size of the FITRES cache in GB. Least recently used files get removed first.", type=float, default=fitres_cache.CACHE_SIZE)
+parser.add_argument("@@AGGREGATE", help="""Compare the first @@FITRES file (the reference) with the spread of a whole set of files, eg, "sys/FITOPT*.FITRES" (in quotes). \n
+Each file is binned on its own and only its counts or binned medians are kept, so any number of files fit in memory. \n
+The plot shows the reference with the min-max range, the @@ENVELOPE percentiles and the median across the set. Works with @@JOBS, @@STREAM and @@DIFF ALL.""", nargs='+')
+parser.add_argument("@@ENVELOPE", help="Percentiles across the @@AGGREGATE files to shade around the reference. Default is 16 84.", type=float, nargs=2, default=aggregate.ENVELOPE)
+parser.add_argument("@@CORNER", help="""A corner plot of several variables instead of @@VARIABLE, eg, @@CORNER df.zHD:df.x1:df.c:df.mB - 3.1*df.c (colon separated, or one per argument). \n
+Histograms of each variable on the diagonal, and every pair below it as the density of points with binned medians, for all the files. \n
+Each file is read once. Give @@BOUNDS as min max binsize for each variable, colon separated, or loose.""", nargs='+')
+parser.add_argument("@@WATCH", help="""Keep watching the files while they're still being written, and redraw the plot (or rewrite the @@SAVE file) every this many seconds when they've grown. \n
+Only the new rows get read each time. Files that get rewritten or cut short are read again from the start. ^C stops it. Default is every 10 seconds.""", type=float, nargs='?', const=watch.INTERVAL, default=None)
+parser.add_argument("@@COMPACT", help="""Keep only the plotted values (and the CIDs for DIFF) of each file once it's loaded, rather than the whole table. \n
+With @@BATCH and @@SERVE, the tables that are kept are stored in the smallest types that hold their values exactly. Uses several times less memory.""", action='store_true')
+parser.add_argument("@@PROFILE", help="""Time each stage of the run (reading the header, parsing, the cache, the cut, the expressions, the CID join, binning, drawing, saving) for each file, \n
+along with the memory it allocated and the peak RSS, and print a table of them at the end. Give a filename to write them to as JSON instead.""", nargs='?', const='table', default=None)
 
 args = parser.parse_args()
+if args.THREADS is None: args.THREADS = max(1, fitres_reader.WORKERS//max(1, args.JOBS)) #Don't start more threads in all than there are cores
 VARIABLE = args.VARIABLE
 FILENAME = args.FITRES
 BOUNDS = args.BOUNDS
@@ -66,53 +118,78 @@ DIFF = args.DIFF
 ALPHA = args.ALPHA
 CUT = args.CUT
 NROWS = args.NROWS
+SAMPLE = args.SAMPLE
+GZTHREADS = args.GZTHREADS
+JOBS = args.JOBS
+THREADS = args.THREADS
+STREAM = args.STREAM
+NPOINTS = args.NPOINTS
+ACCURACY = args.ACCURACY
+BANDS = args.BANDS
+RASTER = args.RASTER
+CONTOUR = args.CONTOUR
+ERRORS = args.ERRORS
+SEED = args.SEED
+USECACHE = not args.NOCACHE
+CACHEDIR = args.CACHEDIR
+CACHESIZE = args.CACHESIZE
+COMPACT = args.COMPACT
+
+if args.CLEARCACHE: fitres_cache.clear(CACHEDIR)
+
+if args.SERVE:
+    server.serve(args.SERVE, parser, args)
+    quit()
+
+if args.PROFILE: profiling.start()
+
+if args.BATCH:
+    import batch
+    try:
+        batch.run(args.BATCH, parser, args)
+    except FileNotFoundError as e:
+        print('Could not find a FITRES file or the batch file you specified!')
+        print(e)
+    if args.PROFILE: profiling.report(profiling.stop(), args.PROFILE)
+    quit()
+
+STDOUT = sys.stdout
+if args.STATS == 'json': sys.stdout = sys.stderr #Keep everything else out of the way of the JSON
 
 if DIFF: DIFF = DIFF.strip()
 
-VARIABLE = ''.join([str(elem) for elem in VARIABLE])
 if CUT: CUT = ''.join([str(elem) for elem in CUT])
 
+if args.CORNER:
+    variables = corner.parse_variables(args.CORNER)
+    try:
+        for VAR in variables: expressions.compile_expr(VAR)
+        if CUT: expressions.compile_cut(CUT)
+        corner.parse_bounds(BOUNDS, len(variables))
+    except (expressions.ExpressionError, ValueError) as e:
+        print("Couldn't process this command!", e)
+        quit()
+    if DIFF or STREAM or args.STATS:
+        print("@@CORNER doesn't do @@DIFF, @@STREAM or @@STATS, just the plot of every pair of variables.")
+    try:
+        fig = corner.run(FILENAME, plots.get_keynames(FILENAME), variables, BOUNDS, CUT, ALPHA, RASTER, CONTOUR, JOBS, THREADS, NROWS=NROWS,
+                         USECACHE=USECACHE, CACHEDIR=CACHEDIR, CACHESIZE=CACHESIZE, GZTHREADS=GZTHREADS, SAMPLE=SAMPLE, SEED=SEED)
+    except FileNotFoundError as e:
+        print('Could not find the FITRES you specified!')
+        print(e)
+        quit()
+    except AttributeError:
+        print("Couldn't process this command! One of the things you are trying to plot is not present in one or more of the files!")
+        quit()
+    if FORMAT !="None":
+        with profiling.stage('savefig', FORMAT):
+            fig.savefig(FORMAT, bbox_inches="tight", format=FORMAT.split(".")[-1])
+    if args.PROFILE: profiling.report(profiling.stop(), args.PROFILE)
+    import matplotlib.pyplot as plt
+    plt.show()
+    quit()
 
-def NAndR(filename):
-    with open(filename) as fp:   
-        for i, line in enumerate(fp):     
-            if line.startswith('VARNAMES:'):         
-                line = line.replace(',',' ')   
-                line = line.replace('\n','')    
-                Names = line.split()     
-            elif (line.startswith('SN')) or (line.startswith('ROW')) or (line.startswith('GAL:')):     
-                Startrow = i 
-                break   
-    return Names, Startrow  
-
-
-def NAndRzip(filename):
-    import gzip
-    with gzip.open(filename) as fp:
-        for i, bline in enumerate(fp):
-            line = bline.decode("utf-8")
-            if line.startswith('VARNAMES:'):       
-                line = line.replace(',',' ')            
-                line = line.replace('\n','')         
-                Names = line.split()           
-            elif (line.startswith('SN')) or (line.startswith('ROW')) or (line.startswith('GAL:')):                
-                Startrow = i            
-                break       
-    return Names, Startrow  
-
-def poisson_interval(k, alpha=0.32):
-    """  
-    uses chisquared info to get the poisson interval. Uses scipy.stats                   
-    (imports in function).                                                               
-    (http://stackoverflow.com/questions/14813530/poisson-confidence-interval-with-numpy) 
-    """
-    from scipy.stats import chi2
-    a = alpha
-    low, high = (chi2.ppf(a/2, 2*k) / 2, chi2.ppf(1-a/2, 2*k + 2) / 2)
-    low[k == 0] = 0.0
-    #if k == 0:                                                                          
-    #    low = 0.0                                                                       
-    return low, high
+VARIABLE = ''.join([str(elem) for elem in VARIABLE])
 
 filenames = [l.split("/")[-1] for l in FILENAME]
 if (any(filenames.count(x) > 1 for x in filenames)):
@@ -120,136 +197,111 @@ if (any(filenames.count(x) > 1 for x in filenames)):
 
 MASTERLIST = {}
 
-def plotter_func(dictionary, DIFF, plotdic, boundsdic, CUT, ALPHA):
-    if custom_bounds:                       
-        bins = np.arange(boundsdic['x'][0],boundsdic['x'][1],boundsdic['x'][2])                                                           
-        plt.xlim([boundsdic['x'][0], boundsdic['x'][1]])  
-    else:                                   
-        bins = np.linspace(boundsdic[min(boundsdic, key=boundsdic.get)], boundsdic[max(boundsdic, key=boundsdic.get)], 30)            
-    if len(plotdic) == 1:                           
-        if (DIFF == 'ALL') or (DIFF == 'CID'):
-            print("The DIFF feature does not work for histograms. Quitting to avoid confusion.")
-            quit()
-
-        for n,k in enumerate(dictionary):           
-            k = dictionary[k]                       
-            print('The upper and lower bounds are:', np.around(bins[0],4), 'and', np.around(bins[-1],4), 'respectively')    
-            if n == 1:                              
-                sb = binned_statistic(k.x_plot_val, k.x_plot_val, bins=bins, statistic='count')[0] #Get counts                                
-                errl,erru = poisson_interval(np.sum(db)*sb/np.sum(sb)) 
-                sb = np.sum(db)*sb/np.sum(sb)
-                plt.errorbar((bins[1:] + bins[:-1])/2., sb, yerr=[sb-errl, erru-sb], label=k.name.values[0], fmt='o')                    
-            else:                                   
-                db = binned_statistic(k.x_plot_val, k.x_plot_val, bins=bins, statistic='count')[0] #Get counts                                
-                errl,erru = poisson_interval(db) #And error for those counts                                                
-                plt.errorbar((bins[1:] + bins[:-1])/2., db, label=k.name.values[0], yerr=[db-errl, erru-db], fmt='o')                 
-            print("The Mean value for ", k.name.values[0], " is:", np.mean(k.x_plot_val))                                                      
-            print("The Median value for ", k.name.values[0], " is:", np.median(k.x_plot_val))                                                  
-            print("The standard deviation value for ", k.name.values[0], " is:", np.std(k.x_plot_val))                                         
-        plt.xlabel(plotdic['x'])  #In this case, VAR = [string], so we're going to strip the list.                     
-        plt.legend()                                
-        if CUT: plt.title(CUT)
-    elif (DIFF == 'CID') or (DIFF == 'ALL'):
-        print("plotting DIFF option now")
-        if len(plotdic) == 2: 
-            try:         
-                plt.ylim([boundsdic['y'][0], boundsdic['y'][1]])            
-            except KeyError:     
-                pass  
-        keylist = list(dictionary.keys())
-        differator = dictionary[keylist[0]]
-        for k in keylist[1:]:
-            k = dictionary[k]
-            if DIFF == 'CID':
-                #need to do an inner join with each entry in dic, then plot the diff
-                join = differator.join(k.set_index('CID'), on='CID', how='inner', lsuffix='_1', rsuffix='_2') #Thank you to Charlie for this
-                plt.scatter(join.x_plot_val_1.values, join.y_plot_val_1.values - join.y_plot_val_2.values, alpha=ALPHA, label='Diff')
-                avgdiff = binned_statistic(join.x_plot_val_1.values, join.y_plot_val_1.values - join.y_plot_val_2.values, bins=bins, statistic='median')[0]                                     
-                plt.scatter((bins[1:] + bins[:-1])/2, avgdiff, label="Mean Difference", color='k')
-            elif (DIFF == 'ALL'):
-                try:
-                    plt.scatter(differator.x_plot_val, differator.y_plot_val - k.y_plot_val, label=differator.name.values[0]+" - "+k.name.values[0], alpha=ALPHA)
-                except ValueError:
-                    pass
-                median_differator = binned_statistic(differator.x_plot_val, differator.y_plot_val, bins=bins, statistic='median')[0]
-                median = binned_statistic(k.x_plot_val, k.y_plot_val, bins=bins, statistic='median')[0]
-                plt.scatter((bins[1:] + bins[:-1])/2., median_differator - median, 
-                            label=differator.name.values[0]+" - "+k.name.values[0]+" median", marker="^", zorder=10)
-            else:  
-                print("You gave "+str(DIFF))                               
-                print("That is not a valid DIFF option. Quitting.")               
-                quit()  
-            plt.xlabel(plotdic['x'])                    
-            plt.ylabel(plotdic['y']+" diff")                    
-            plt.legend()                                
-            if CUT: plt.title(CUT)       
-    else:    
-        try:
-            plt.ylim([boundsdic['y'][0], boundsdic['y'][1]]) 
-        except KeyError:
-            pass
-        for k in dictionary:                        
-            k = dictionary[k]                       
-            plt.scatter(k.x_plot_val, k.y_plot_val, alpha=ALPHA, label=k.name.values[0], zorder=0)            
-            median = binned_statistic(k.x_plot_val, k.y_plot_val, bins=bins, statistic='median')[0] #Get counts                
-            plt.scatter((bins[1:] + bins[:-1])/2., median, label=k.name.values[0]+" median", marker="^", zorder=10)           
-        plt.xlabel(plotdic['x'])                    
-        plt.ylabel(plotdic['y'])                    
-        plt.legend()                                
-        if CUT: plt.title(CUT) 
-    return 
-
-plotdic = {}
-boundsdic = {} 
-
-
-for n,VAR in enumerate(VARIABLE.split(":")):
-    if n == 0:
-        plotdic['x'] = str(VAR) 
-    else:
-        plotdic['y'] = str(VAR) 
+plotdic = plots.parse_variable(VARIABLE)
 
 
-for l in (FILENAME): 
-    print("Loading ",l.split("/")[-1], "...") #Inform that we're loading the first file.
-    try:
-        Names1, StartRow1 = NAndR(l) #Get info on where to start reading the file
-    except (FileNotFoundError, NameError, UnicodeDecodeError):
-        if UnicodeDecodeError:
-            Names1, StartRow1 = NAndRzip(l)
-        else:
-            print('Could not find the FITRES you specified!')
-            print("You were pointing to: ", FILENAME)
-            sys.stdout.flush() # "dad! dad! look what got caught in the snare!" "good work, timmy, its AttributeError for dinner tonight" -Ross
-            quit() #Quits if one or more files is missing
-    if NROWS != 0: df = pd.read_csv(l, header=None, skiprows=StartRow1,names=Names1, sep=r"\s+", skip_blank_lines=True, comment='#', nrows=NROWS)
-    else: df = pd.read_csv(l, header=None, skiprows=StartRow1,names=Names1, sep=r"\s+", skip_blank_lines=True,  comment='#')
+try: #Check and compile the expressions once before touching any files
+    for VAR in plotdic.values(): expressions.compile_expr(VAR)
+    if CUT: expressions.compile_cut(CUT)
+except expressions.ExpressionError as e:
+    print("Couldn't process this command!", e)
+    quit()
+
+try:
+    boundsdic = plots.parse_bounds(BOUNDS)
+except ValueError as e:
+    print("Couldn't process this command!", e)
+    quit()
+custom_bounds = 'x' in boundsdic
+
+keynames = plots.get_keynames(FILENAME)
+
+if STREAM and CUT and not expressions.is_rowwise(CUT):
+    print("Your CUT needs to see the whole file at once, so it can't be used with @@STREAM. Quitting...")
+    quit()
+
+if SAMPLE and (STREAM or args.WATCH):
+    print("@@SAMPLE doesn't work with @@STREAM or @@WATCH, reading every row.")
+
+if args.WATCH:
+    if len(plotdic) == 1 and DIFF in ('ALL', 'CID'):
+        print("The DIFF feature does not work for histograms. Quitting to avoid confusion.")
+        quit()
+    if STREAM: print("@@STREAM doesn't work with @@WATCH, reading the new rows as they come in.")
+    watch.run(FILENAME, keynames, plotdic, boundsdic, DIFF, CUT, ALPHA, BANDS, RASTER, CONTOUR, FORMAT, args.WATCH, ERRORS, SEED, ACCURACY)
+    quit()
+
+if args.AGGREGATE:
+    if DIFF == 'CID':
+        print("DIFF CID doesn't work with @@AGGREGATE, only DIFF ALL. Quitting to avoid confusion.")
+        quit()
+    files = aggregate.expand(args.AGGREGATE + FILENAME[1:], exclude=FILENAME[:1])
+    print("Comparing", keynames[0], "with", len(files), "files")
     try:
-        df['CID'] = df['CID'].astype(str)
-    except KeyError:
-        print("No CIDs present in this file. Making note of that here.")
-
-    if CUT: df = eval(CUT)
-    #Will need to do all the x and y assignments here if we use this setup 
-    keycount = -1
-    keyname = l.split("/")[keycount]
-    while keyname in list(MASTERLIST.keys()):
-        keycount -= 1
-        keyname = l.split("/")[keycount]
+        result = aggregate.aggregate(FILENAME[0], files, plotdic, boundsdic, JOBS, args.ENVELOPE, CUT=CUT, STREAM=STREAM, ACCURACY=ACCURACY,
+                                     NROWS=NROWS, GZTHREADS=GZTHREADS, USECACHE=USECACHE, CACHEDIR=CACHEDIR, CACHESIZE=CACHESIZE, SAMPLE=SAMPLE, SEED=SEED,
+                                     THREADS=THREADS)
+    except FileNotFoundError as e:
+        print('Could not find the FITRES you specified!')
+        print(e)
+        quit()
+    except AttributeError:
+        print("Couldn't process this command! One of the things you are trying to plot is not present in the reference file!")
+        quit()
+    print("Done binning all files! Plotting now!")
+    with profiling.stage('import', 'matplotlib'):
+        import matplotlib.pyplot as plt
+    plt.figure()
+    aggregate.draw(result, plotdic, keynames[0], CUT, DIFF, args.ENVELOPE)
+    if FORMAT !="None":
+        with profiling.stage('savefig', FORMAT):
+            plt.savefig(FORMAT, bbox_inches="tight", format=FORMAT.split(".")[-1])
+    if args.PROFILE: profiling.report(profiling.stop(), args.PROFILE)
+    plt.show()
+    quit()
 
+try:
+    if STREAM:
+        kwargs = dict(CUT=CUT, DIFF=DIFF, NROWS=NROWS, CHUNKSIZE=STREAM, GZTHREADS=GZTHREADS)
+        ybounds = 'y' in boundsdic and DIFF != 'ALL' #With DIFF ALL the y bounds are for the differences, not y
+        yrange = boundsdic['y'][:2] if ybounds else None #Where the sketches of y go, the same for every file
+        if not custom_bounds or (len(plotdic) == 2 and DIFF != 'CID' and not ybounds): #Need an extra pass to find where the bins go
+            ranges = loader.run_parallel(streaming.scan_ranges, [(l, plotdic) for l in FILENAME], JOBS, **kwargs)
+            if not custom_bounds:
+                for keyname, r in zip(keynames, ranges):
+                    boundsdic[keyname+"_min"], boundsdic[keyname+"_max"] = r['x']
+            if yrange is None and any('y' in r for r in ranges):
+                yrange = [min(r['y'][0] for r in ranges if 'y' in r), max(r['y'][1] for r in ranges if 'y' in r)]
+        if len(plotdic) == 2 and yrange is None: yrange = [0., 1.] #Nothing passed the cut, or DIFF CID, which doesn't use the sketches
+        extent = None #Density image of every point for 2D plots, which needs to know where y goes before reading
+        if len(plotdic) == 2 and not DIFF and RASTER >= 0:
+            bins = plots.get_bins(boundsdic)
+            xext = boundsdic['x'][:2] if custom_bounds else [bins[0], bins[-1]]
+            extent = xext + (boundsdic['y'][:2] if 'y' in boundsdic else list(yrange))
+        loaded = loader.run_parallel(streaming.summarise, [(l, plotdic, plots.get_bins(boundsdic)) for l in FILENAME],
+                                     JOBS, NPOINTS=NPOINTS, ACCURACY=ACCURACY, YRANGE=yrange, EXTENT=extent, RESOLUTION=rendering.RESOLUTION, **kwargs)
+    else:
+        loaded = loader.load_all(FILENAME, plotdic, JOBS, CUT=CUT, DIFF=DIFF, NROWS=NROWS, USECACHE=USECACHE, CACHEDIR=CACHEDIR,
+                                 CACHESIZE=CACHESIZE, GZTHREADS=GZTHREADS, COMPACT=COMPACT, SAMPLE=SAMPLE, SEED=SEED, THREADS=THREADS)
+except FileNotFoundError as e:
+    print('Could not find the FITRES you specified!')
+    print("You were pointing to: ", FILENAME)
+    print(e)
+    sys.stdout.flush() # "dad! dad! look what got caught in the snare!" "good work, timmy, its AttributeError for dinner tonight" -Ross
+    quit() #Quits if one or more files is missing
+except AttributeError:
+    print("Couldn't process this command! One of the things you are trying to plot is not present in one or more of the files!")
+    quit() # "oh the sweet turgid flesh of access discrepancy" - Ross 
+
+for keyname, df in zip(keynames, loaded): #Files come back in the order they were given, so the first one is still the reference
     MASTERLIST[keyname] = df
-    MASTERLIST[keyname]['name'] = keyname
-    try:
-        MASTERLIST[keyname]['x_plot_val'] = eval(plotdic['x'])
+    if isinstance(df, compact.PlotData):
+        df.name = keyname #The label goes with the values, rather than in every row
+    elif isinstance(df, pd.DataFrame):
+        MASTERLIST[keyname]['name'] = keyname
+    if not isinstance(df, streaming.StreamSummary):
         boundsdic[keyname+"_min"] = np.amin(MASTERLIST[keyname]['x_plot_val'])
         boundsdic[keyname+"_max"] = np.amax(MASTERLIST[keyname]['x_plot_val'])
-        if len(plotdic) == 2:
-            MASTERLIST[keyname]['y_plot_val'] = eval(plotdic['y'])
-    except AttributeError:
-        print("Couldn't process this command! One of the things you are trying to plot is not present in one or more of the files!")
-        quit() # "oh the sweet turgid flesh of access discrepancy" - Ross 
-    #need to comb through existing keys in dictionary and make sure there are no overlaps
-    print("Done loading that file!")
 
 print("Done loading all files!")
 
@@ -259,16 +311,6 @@ if (any(list(MASTERLIST.keys()).count(x) > 1 for x in list(MASTERLIST.keys()))):
     print("Your filenames are identical and the directory above them also has the same name. Quitting...")
     quit()
 
-custom_bounds = False                                        
-if (len(BOUNDS) != 5):
-    BOUNDS = ' '.join([str(elem) for elem in BOUNDS])         
-    custom_bounds = True                                                 
-    for n,BND in enumerate(BOUNDS.split(':')):           
-        if n == 0:     
-            boundsdic['x'] = [float(i) for i in BND.split()]            
-        else:                                                   
-            boundsdic['y'] = [float(i) for i in BND.split()]
-
 
 # if DIFF == True: #Thank you to Charlie for this part to ensure that join has only shared CIDs in it! 
 #     if FILENAME[0].endswith('M0DIF'): 
@@ -287,11 +329,21 @@ if (len(BOUNDS) != 5):
 
 #now to rewrite the BOUNDS bits.
 
+if args.STATS:
+    with profiling.stage('stats'):
+        stats.report(MASTERLIST, plotdic, boundsdic, CUT, args.STATS, file=STDOUT, ERRORS=ERRORS, SEED=SEED)
+    if args.PROFILE: profiling.report(profiling.stop(), args.PROFILE)
+    quit()
+
 print("Plotting now!")
 
 
+with profiling.stage('import', 'matplotlib'):
+    import matplotlib.pyplot as plt
 plt.figure()
-plotter_func(MASTERLIST, DIFF, plotdic, boundsdic, CUT, ALPHA)
+plots.plotter_func(MASTERLIST, DIFF, plotdic, boundsdic, CUT, ALPHA, BANDS, RASTER, CONTOUR, ERRORS, SEED)
 if FORMAT !="None":                  
-    plt.savefig(FORMAT, bbox_inches="tight", format=FORMAT.split(".")[-1])                                             
+    with profiling.stage('savefig', FORMAT):
+        plt.savefig(FORMAT, bbox_inches="tight", format=FORMAT.split(".")[-1])                                             
+if args.PROFILE: profiling.report(profiling.stop(), args.PROFILE) #Before show, which waits for the window to be closed
 plt.show()         
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Client for the plot server started with 'plotter-class.py @@SERVE'.
+
+Takes the same @@ options as plotter-class.py and gets the plot back from the server, which already has
+the files in memory, so this doesn't need to import pandas or read anything itself, eg,
+
+plotter-client.py @@FITRES File1.FITRES File2.FITRES @@VARIABLE df.zHD:df.mB @@SAVE hubble.png
+
+The plot is saved to @@SAVE, or shown on screen if there isn't one. Whatever the plotter printed (means,
+medians, ...) gets printed here. With @@STATS there's no plot, and the statistics are printed on stdout
+(or written to @@SAVE) with everything else on stderr, like plotter-class.py @@STATS json. @@SERVER picks
+the server if it isn't at the default address, and @@STOP shuts it down.
+"""
+import os
+import io
+import sys
+
+import server
+
+argv = sys.argv[1:]
+address = server.ADDRESS
+if '@@SERVER' in argv:
+    i = argv.index('@@SERVER')
+    address = argv[i+1]
+    del argv[i:i+2]
+
+try:
+    if '@@STOP' in argv:
+        header, image = server.request({'stop': True}, address)
+    else:
+        header, image = server.request({'argv': argv, 'cwd': os.getcwd()}, address)
+except (FileNotFoundError, ConnectionRefusedError):
+    print("There's no plot server at", address+". Start one with 'plotter-class.py @@SERVE'.")
+    sys.exit(1)
+
+print(header['output'], end='', file=sys.stderr if 'stats' in header else sys.stdout)
+if not header['ok']:
+    print(header['error'])
+    sys.exit(1)
+
+if 'stats' in header:
+    if '@@SAVE' in argv:
+        with open(argv[argv.index('@@SAVE')+1], 'w') as f:
+            f.write(header['stats'])
+    else:
+        print(header['stats'], end='')
+
+if image:
+    if '@@SAVE' in argv:
+        with open(argv[argv.index('@@SAVE')+1], 'wb') as f:
+            f.write(image)
+    else:
+        import matplotlib.pyplot as plt
+        plt.imshow(plt.imread(io.BytesIO(image), format=header['format']))
+        plt.axis('off')
+        plt.show()
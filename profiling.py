@@ -0,0 +1,149 @@
+"""
+Where the time and memory of a run go (@@PROFILE).
+
+The slow parts of the plotter are spread over several modules (decompressing and parsing in
+fitres_reader, the cache, the @@CUT and @@VARIABLE expressions, the CID join, the binning and the
+drawing), so each of them is wrapped in a stage():
+
+    with profiling.stage('parse', filename):
+        df = fitres_reader.read_body(...)
+
+which does nothing unless profiling has been started. Once it has, every stage records its wall time,
+the memory allocated (and not given back) while it ran, the highest extra memory it had allocated at any
+one point, and the peak RSS of the process by the time it finished. Allocations are tracked with
+tracemalloc, which numpy and pandas report their arrays to, and which slows things down a little.
+
+Stages run in worker processes (@@JOBS) are sent back with the results, see loader.run_parallel.
+To profile from elsewhere, eg, a notebook:
+
+    with profiling.profile():               #Prints the table at the end
+        df = loader.load_fitres(...)
+
+or start(), then report(stop(), 'profile.json') to get the JSON instead.
+"""
+import os
+import sys
+import json
+import time
+import contextlib
+import tracemalloc
+
+try:
+    import resource
+except ImportError: #Not on Windows
+    resource = None
+
+ENABLED = False
+MEMORY = False #Whether tracemalloc is being used
+RECORDS = [] #One dict per stage, in the order they finished
+_STACK = [] #Highest allocation seen so far in each of the stages that are running, outermost first
+_START = None
+
+
+def peak_rss():
+    """Peak resident memory of this process so far, in bytes (0 if it can't be found out)."""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def start(memory=True):
+    """Starts recording stages, throwing away any earlier records. memory=False skips tracemalloc."""
+    global ENABLED, MEMORY, _START
+    ENABLED, MEMORY = True, memory
+    RECORDS.clear()
+    _STACK.clear()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _START = time.perf_counter()
+
+
+def stop():
+    """Stops recording and returns the records, with a 'total' one for everything since start()."""
+    global ENABLED
+    if not ENABLED:
+        return []
+    records = list(RECORDS)
+    records.append(dict(stage='total', file=None, seconds=time.perf_counter() - _START, alloc=None, alloc_peak=None,
+                        rss_peak=peak_rss(), pid=os.getpid()))
+    ENABLED = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return records
+
+
+def add(records):
+    """Records from somewhere else, eg, a worker process. Their 'total' is left out."""
+    if ENABLED:
+        RECORDS.extend(r for r in records if r['stage'] != 'total')
+
+
+@contextlib.contextmanager
+def stage(name, file=None):
+    """Times (and tracks the memory of) what's run inside it as stage name of file, if profiling has been started."""
+    if not ENABLED:
+        yield
+        return
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if _STACK: _STACK[-1] = max(_STACK[-1], peak) #reset_peak() below would lose the outer stage's peak otherwise
+        tracemalloc.reset_peak()
+    _STACK.append(current if tracing else 0)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        highest = _STACK.pop()
+        alloc = alloc_peak = None
+        if tracing and tracemalloc.is_tracing():
+            now, peak = tracemalloc.get_traced_memory()
+            highest = max(highest, peak)
+            alloc, alloc_peak = now - current, highest - current
+            if _STACK: _STACK[-1] = max(_STACK[-1], highest)
+        RECORDS.append(dict(stage=name, file=file.split("/")[-1] if file else None, seconds=seconds, alloc=alloc,
+                            alloc_peak=alloc_peak, rss_peak=peak_rss(), pid=os.getpid()))
+
+
+def summary(records):
+    """The records added up by stage and file, in the order each first finished."""
+    rows = {}
+    for r in records:
+        row = rows.get((r['stage'], r['file']))
+        if row is None:
+            rows[(r['stage'], r['file'])] = dict(r, calls=1)
+            continue
+        row['calls'] += 1
+        row['seconds'] += r['seconds']
+        for key in ('alloc_peak', 'rss_peak'):
+            if r[key] is not None: row[key] = max(row[key] or 0, r[key])
+        if r['alloc'] is not None: row['alloc'] = (row['alloc'] or 0) + r['alloc']
+    return list(rows.values())
+
+
+def report(records, REPORT='table', file=None):
+    """
+    Prints the records as a table, or with REPORT set to a filename, writes them (and the summary) there as JSON.
+    Memory is in MB in the table and in bytes in the JSON.
+    """
+    if REPORT and REPORT != 'table':
+        with open(REPORT, 'w') as fp:
+            json.dump({'stages': records, 'summary': summary(records)}, fp, indent=1)
+        print("Wrote the profile to", REPORT, file=file)
+        return
+    mb = lambda val: "%10.1f" % (val/1e6) if val is not None else "%10s" % '-'
+    print("%-12s %-30s %5s %10s %10s %10s %10s" % ('stage', 'file', 'calls', 'seconds', 'alloc MB', 'peak MB', 'RSS MB'), file=file)
+    for row in summary(records):
+        print("%-12s %-30s %5d %10.3f %s %s %s" % (row['stage'], (row['file'] or '')[-30:], row['calls'], row['seconds'],
+              mb(row['alloc']), mb(row['alloc_peak']), mb(row['rss_peak'])), file=file)
+
+
+@contextlib.contextmanager
+def profile(REPORT='table', file=None, memory=True):
+    """Profiles what's run inside it, and reports it at the end. See report()."""
+    start(memory)
+    try:
+        yield
+    finally:
+        report(stop(), REPORT, file)
@@ -0,0 +1,69 @@
+"""
+Drawing the points of 2D and DIFF plots.
+
+plt.scatter is fine for a few thousand SNe, but with millions of simulated ones it takes minutes and
+@@SAVE writes out every single marker. Past @@RASTER points, the points of a file are binned into a
+fixed-resolution 2D histogram instead and drawn as one image (or contours with @@CONTOUR), in a
+colormap that fades from transparent to that file's usual colour, so several files still overlay.
+"""
+import numpy as np
+
+RASTER = 200000 #Draw a density image instead of a scatter plot past this many points
+RESOLUTION = 300 #Pixels along each axis of the density image
+CONTOUR_RESOLUTION = 50 #and cells along each axis for @@CONTOUR
+
+
+def extent_of(x, y, xlim=None, ylim=None):
+    """[xmin, xmax, ymin, ymax] covering the finite values of x and y, or the given limits."""
+    ext = []
+    for val, lim in ((x, xlim), (y, ylim)):
+        if lim is not None:
+            ext += [lim[0], lim[1]]
+            continue
+        val = np.asarray(val, dtype=float)
+        val = val[np.isfinite(val)]
+        lo, hi = (np.amin(val), np.amax(val)) if len(val) else (0., 1.)
+        ext += [lo, hi if hi > lo else lo + 1.]
+    return ext
+
+
+def density(x, y, extent, resolution=RESOLUTION):
+    """Counts of the points in a resolution x resolution grid over extent. Indexed [x, y]."""
+    return np.histogram2d(x, y, bins=resolution, range=[extent[:2], extent[2:]])[0]
+
+
+def points(x, y, label, ALPHA, RASTER=RASTER, CONTOUR=False, xlim=None, ylim=None, grid=None, n=None, **kwargs):
+    """
+    plt.scatter(x, y), or a density image of them if there are more than RASTER points (RASTER < 0 never does).
+    grid is an already binned (counts, extent) to draw instead of binning x and y, eg, from @@STREAM, and
+    n is the number of points it holds.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LinearSegmentedColormap, LogNorm, to_rgb
+    if n is None: n = len(x)
+    if RASTER < 0 or n <= RASTER or (grid is None and len(x) == 0):
+        return plt.scatter(x, y, alpha=ALPHA, label=label, **kwargs)
+    proxy = plt.scatter([], [], alpha=max(ALPHA, 0.5), label=label, **kwargs) #Stands in for the image in the legend, and picks the next colour
+    colour = to_rgb(proxy.get_facecolor()[0])
+    if grid is None:
+        extent = extent_of(x, y, xlim, ylim)
+        counts = density(x, y, extent)
+    else:
+        counts, extent = grid
+    if not counts.any():
+        return proxy
+    if CONTOUR:
+        f = max(1, min(counts.shape)//CONTOUR_RESOLUTION) #Contours of single pixels are all noise, so add up blocks of them first
+        dx, dy = (extent[1] - extent[0])/counts.shape[0], (extent[3] - extent[2])/counts.shape[1]
+        counts = counts[:counts.shape[0]//f*f, :counts.shape[1]//f*f]
+        counts = counts.reshape(counts.shape[0]//f, f, counts.shape[1]//f, f).sum(axis=(1, 3))
+        xc = extent[0] + (np.arange(counts.shape[0]) + 0.5)*f*dx
+        yc = extent[2] + (np.arange(counts.shape[1]) + 0.5)*f*dy
+        levels = np.geomspace(1, counts.max(), 6)[:-1] if counts.max() > 1 else [0.5]
+        plt.contour(xc, yc, counts.T, levels=levels, colors=[colour], zorder=kwargs.get('zorder', 0))
+    else:
+        cmap = LinearSegmentedColormap.from_list(label, [colour + (0.,), colour + (1.,)])
+        image = np.ma.masked_equal(counts.T, 0)
+        plt.imshow(image, origin='lower', extent=extent, aspect='auto', interpolation='nearest', cmap=cmap,
+                   norm=LogNorm(vmin=1, vmax=max(counts.max(), 2)), alpha=max(ALPHA, 0.5), zorder=kwargs.get('zorder', 0))
+    return proxy
@@ -0,0 +1,156 @@
+"""
+Row-offset index of FITRES files, for reading a uniform random sample of the rows (@@SAMPLE).
+
+@@NROWS reads the top of a file, which for files sorted by survey (or by anything else) is nothing like
+the rest of it. To read a random sample instead, without parsing every row, the byte offset where each
+data row starts is found once, by scanning the raw bytes for newlines with numpy, and saved in a sidecar
+file next to the FITRES (.NAME.rows.npy, or under the cache directory if that can't be written to). The
+first two numbers in it are the size and modification time of the file it was made from, so it gets made
+again if the file changes. After that a sample is just: pick the row numbers, seek to each one's offset,
+read that one line, and parse only those lines.
+
+Gzipped files can't be jumped around in, so their offsets are in the decompressed data, and reading a
+sample still has to decompress everything up to the last row picked (in pigz with @@GZTHREADS). Only the
+rows picked get parsed though.
+
+Indexes that end up in the cache directory count towards its @@CACHESIZE, and get thrown out with the least
+recently used entries (see fitres_cache.evict).
+
+The rows picked only depend on the number of rows, the sample size and the seed, so a file that's already
+in the FITRES cache gives the same sample as one read from disk.
+"""
+import os
+import io
+import hashlib
+import numpy as np
+import pandas as pd
+
+import fitres_reader
+import fitres_cache
+import profiling
+
+BLOCK = 1 << 24 #Bytes scanned for newlines at a time
+
+
+def sidecar(filename):
+    """Where the index of filename goes: a hidden file next to it, so globs of FITRES files don't pick it up."""
+    head, tail = os.path.split(os.path.abspath(filename))
+    return os.path.join(head, '.' + tail + '.rows.npy')
+
+
+def _fallback(filename, cachedir):
+    """Where the index goes if the directory of filename is read only."""
+    return os.path.join(cachedir, 'rows', hashlib.sha1(os.path.abspath(filename).encode()).hexdigest() + '.npy')
+
+
+def scan(filename, threads=0):
+    """Byte offsets of every data row in filename (in the decompressed data if it's gzipped)."""
+    found = []
+    pos = 0
+    carry = b''
+    with fitres_reader.open_raw(filename, threads) as fp:
+        while True:
+            block = fp.read(BLOCK)
+            buf = carry + block
+            end = buf.rfind(b'\n') + 1 if block else len(buf) #Only whole lines, until the end of the file
+            if end:
+                data = np.frombuffer(buf, np.uint8, count=end)
+                starts = np.concatenate([[0], np.flatnonzero(data[:-1] == 10) + 1])
+                row = np.zeros(len(starts), dtype=bool)
+                for prefix in fitres_reader.DATA_PREFIXES: #Same test as open_fitres, on the start of every line
+                    match = starts + len(prefix) <= end
+                    for i, byte in enumerate(prefix):
+                        match &= data[np.minimum(starts + i, end - 1)] == byte
+                    row |= match
+                found.append(starts[row] + pos)
+            pos += end
+            carry = buf[end:]
+            if not block:
+                break
+    return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _save(index, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp%d' % os.getpid()
+    with open(tmp, 'wb') as fp:
+        np.save(fp, index)
+    os.replace(tmp, path) #So a crash halfway through never leaves a broken index
+
+
+def offsets(filename, cachedir=fitres_cache.CACHE_DIR, threads=0):
+    """The offsets of every row of filename, from its sidecar if that's up to date, otherwise scanned and saved for next time."""
+    st = os.stat(filename)
+    stamp = (st.st_size, st.st_mtime_ns)
+    paths = [sidecar(filename), _fallback(filename, cachedir)]
+    with profiling.stage('index', filename):
+        for path in paths:
+            try:
+                index = np.load(path, mmap_mode='r')
+            except (OSError, ValueError):
+                continue
+            if len(index) >= 2 and tuple(index[:2]) == stamp:
+                if path != paths[0]: _touch(path) #Indexes in the cache directory count towards its size cap, see fitres_cache.evict
+                return index[2:]
+        print("Indexing the rows of", filename.split("/")[-1], "...")
+        index = np.concatenate([np.array(stamp, dtype=np.int64), scan(filename, threads)])
+        for path in paths:
+            try:
+                _save(index, path)
+                break
+            except OSError:
+                continue
+        else:
+            print("Couldn't save the row index of", filename.split("/")[-1] + ", so it'll be made again next time.")
+    return index[2:]
+
+
+def sample_rows(nrows, SAMPLE, SEED=0):
+    """Sorted row numbers of a uniform random sample of nrows rows: SAMPLE of them if it's 1 or more, otherwise that fraction of them."""
+    n = min(int(SAMPLE), nrows) if SAMPLE >= 1 else int(round(SAMPLE*nrows))
+    return np.sort(np.random.default_rng(SEED).choice(nrows, n, replace=False, shuffle=False))
+
+
+def read_rows(filename, names, offsets, rows, columns=None, threads=0):
+    """
+    Parses just the rows numbered rows (sorted) of filename, given the offsets of all of them. The index is the row numbers.
+    Gzipped files are decompressed up to the last row (in pigz with threads > 0, like fitres_reader.open_fitres).
+    """
+    lines = []
+    if fitres_reader.is_gzipped(filename):
+        with fitres_reader.open_raw(filename, threads) as fp: #Can only go forwards, so skip to each row in turn
+            pos = 0
+            for offset in offsets[rows]:
+                while pos < offset:
+                    skipped = len(fp.read(min(offset - pos, BLOCK)))
+                    if not skipped:
+                        break
+                    pos += skipped
+                lines.append(fp.readline())
+                pos += len(lines[-1])
+    else:
+        with open(filename, 'rb') as fp:
+            for offset in offsets[rows]:
+                fp.seek(offset)
+                lines.append(fp.readline())
+    if not lines:
+        return pd.DataFrame(columns=columns if columns is not None else names)
+    df = fitres_reader.read_body(io.BytesIO(b''.join(lines)), names, columns)
+    df.index = rows
+    return df
+
+
+def read_sample(filename, names, columns, SAMPLE, SEED=0, NROWS=0, cachedir=fitres_cache.CACHE_DIR, threads=0):
+    """A random sample (see sample_rows) of the rows of filename, or of its first NROWS rows, parsed into a dataframe."""
+    index = offsets(filename, cachedir, threads)
+    rows = sample_rows(len(index) if NROWS == 0 else min(NROWS, len(index)), SAMPLE, SEED)
+    print("Reading", len(rows), "of the", len(index), "rows of", filename.split("/")[-1])
+    with profiling.stage('parse', filename):
+        return read_rows(filename, names, index, rows, columns, threads)
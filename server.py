@@ -0,0 +1,188 @@
+"""
+Resident plot server (@@SERVE), and the bits plotter-client.py needs to talk to it.
+
+Every run of plotter-class.py spends seconds importing pandas, scipy and matplotlib and reading the
+FITRES files before anything gets drawn. The server pays for that once: it stays running, keeps the
+tables it has read in memory, and draws a plot whenever a client sends it a list of @@ options.
+The plot comes back as an image, along with everything that got printed (the means, medians, ...).
+
+Tables are kept per file with the columns that have been asked for so far, and re-read if the file
+changes or a plot needs columns that aren't there yet. Once they add up to more than @@SERVERMEM GB,
+the least recently used ones are dropped.
+
+The server listens on a Unix socket (a path, by default one in the temp directory that only you can
+use) or on localhost (give a port, or host:port). Plots are drawn one at a time, in the order they come in.
+
+Messages both ways are a JSON header followed by an optional block of bytes, each sent after its length.
+Only the standard library is imported up here, so the client starts up quickly.
+"""
+import os
+import io
+import sys
+import json
+import socket
+import struct
+import tempfile
+import contextlib
+from collections import OrderedDict
+
+ADDRESS = os.environ.get('MIDWAY_SOCKET', os.path.join(tempfile.gettempdir(), 'midwayplotter-%d.sock' % os.getuid()))
+MEMORY = 8. #GB of tables kept in memory by the server
+
+
+def parse_address(address):
+    """(family, address) for socket.socket from a path, a port number or host:port."""
+    host, _, port = str(address).rpartition(':')
+    if port.isdigit() and '/' not in address:
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+def _recvall(sock, n):
+    data = b''
+    while len(data) < n:
+        more = sock.recv(n - len(data))
+        if not more:
+            raise ConnectionError("Connection closed halfway through a message")
+        data += more
+    return data
+
+
+def send(sock, header, payload=b''):
+    head = json.dumps(header).encode()
+    sock.sendall(struct.pack('!IQ', len(head), len(payload)) + head + payload)
+
+
+def receive(sock):
+    """The header and payload of the next message on sock."""
+    nhead, npayload = struct.unpack('!IQ', _recvall(sock, struct.calcsize('!IQ')))
+    return json.loads(_recvall(sock, nhead)), _recvall(sock, npayload)
+
+
+def request(header, address=ADDRESS):
+    """Sends header to the server at address and returns its reply (header, payload)."""
+    family, addr = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.connect(addr)
+        send(sock, header)
+        return receive(sock)
+
+
+class TableStore:
+    """The tables the server has read, least recently used first, kept under maxsize GB in total."""
+    def __init__(self, maxsize=MEMORY, **readargs):
+        self.maxsize = maxsize
+        self.readargs = readargs #Passed on to loader.read_table
+        self.entries = OrderedDict()
+
+    def get(self, filename, exprs, DIFF=None):
+        """The table of filename with at least the columns exprs (and DIFF) need."""
+        import loader
+        import expressions
+        import compact
+        key = os.path.abspath(filename)
+        st = os.stat(key)
+        stamp = (st.st_size, st.st_mtime_ns)
+        entry = self.entries.get(key)
+        if entry is not None and entry['stamp'] == stamp:
+            need = expressions.referenced_columns(exprs)
+            if (need is not None) and DIFF: need.add('CID')
+            everything = expressions.referenced_columns(entry['exprs']) is None
+            if (everything or (need is not None and need <= set(entry['df'].columns))) and (DIFF != 'CID' or entry['DIFF'] == 'CID'):
+                self.entries.move_to_end(key)
+                return entry['df']
+            exprs = entry['exprs'] + list(exprs) #Read it again with the columns of the earlier plots too
+            if entry['DIFF'] == 'CID': DIFF = 'CID'
+            elif DIFF is None: DIFF = entry['DIFF']
+        self.entries.pop(key, None)
+        df, cutdone = loader.read_table(key, exprs, None, DIFF, **self.readargs)
+        self.entries[key] = dict(stamp=stamp, exprs=list(exprs), DIFF=DIFF, df=df, size=compact.memory_usage(df)/1e9)
+        self.evict()
+        return df
+
+    def evict(self):
+        """Drops the least recently used tables until they fit, but always keeps the newest one."""
+        while len(self.entries) > 1 and sum(e['size'] for e in self.entries.values()) > self.maxsize:
+            key, _ = self.entries.popitem(last=False)
+            print("Dropping", key.split("/")[-1], "from memory")
+
+
+def handle(header, parser, args, store):
+    """Draws the plot a client asked for. Returns the reply header and the image."""
+    import batch
+    import plots
+    import expressions
+    import profiling
+    out = io.StringIO()
+    image = io.BytesIO()
+    text = io.StringIO() #@@STATS, kept apart from everything else printed so the JSON can be used as it is
+    fmt = None
+    spec = None
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        try:
+            spec = batch.parse_spec(header['argv'], parser, args)
+            spec.FITRES = [os.path.join(header.get('cwd', ''), l) for l in (spec.FITRES or [])] #Relative to where the client is
+            if spec.SAVE == 'None' and not spec.STATS: spec.SAVE = 'plot.png'
+            fmt = spec.SAVE.split(".")[-1]
+            batch.check(spec)
+            DIFF = spec.DIFF if spec.DIFF in ('ALL', 'CID') else None
+            exprs = list(plots.parse_variable(spec.VARIABLE).values()) + [spec.CUT]
+            if spec.PROFILE: profiling.start() #The table goes back to the client with the rest of the output
+            try:
+                tables = {l: store.get(l, exprs, DIFF) for l in spec.FITRES}
+                error = batch.render(spec, tables, image, text)
+            finally:
+                if spec.PROFILE: profiling.report(profiling.stop())
+        except SystemExit: #argparse has already printed what was wrong
+            error = "Couldn't read those options."
+        except expressions.ExpressionError as e:
+            error = "Couldn't process this command! " + str(e)
+        except (OSError, ValueError) as e:
+            error = "Could not read the FITRES you specified! " + str(e)
+        except Exception as e: #Whatever it is, it shouldn't take the server down with it
+            error = "Something went wrong: " + repr(e)
+    reply = {'ok': error is None, 'error': error, 'output': out.getvalue(), 'format': fmt}
+    if spec is not None and spec.STATS:
+        reply['stats'] = text.getvalue()
+    return reply, image.getvalue() if error is None else b''
+
+
+def serve(address, parser, args):
+    """Answers plot requests at address until a client sends stop (or ^C). args are the defaults for every request."""
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+    store = TableStore(args.SERVERMEM, USECACHE=not args.NOCACHE, CACHEDIR=args.CACHEDIR, CACHESIZE=args.CACHESIZE,
+                       GZTHREADS=args.GZTHREADS, COMPACT=args.COMPACT, THREADS=args.THREADS)
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr): os.remove(addr) #Left over from a server that didn't shut down cleanly
+        umask = os.umask(0o177) #Only you can connect
+        sock.bind(addr)
+        os.umask(umask)
+    else:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(addr)
+    sock.listen()
+    print("Plot server listening on", address)
+    sys.stdout.flush()
+    try:
+        while True:
+            conn, _ = sock.accept()
+            with conn:
+                try:
+                    header, _ = receive(conn)
+                    if header.get('stop'):
+                        send(conn, {'ok': True, 'error': None, 'output': "Plot server stopped.\n"})
+                        break
+                    reply, image = handle(header, parser, args, store)
+                    print(' '.join(header['argv']), '->', 'ok' if reply['ok'] else reply['error'])
+                    sys.stdout.flush()
+                    send(conn, reply, image)
+                except (OSError, ValueError) as e:
+                    print("Lost a client:", e)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        if family == socket.AF_UNIX and os.path.exists(addr): os.remove(addr)
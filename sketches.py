@@ -0,0 +1,101 @@
+"""
+Quantile sketches, for medians and percentiles that can be built up one chunk at a time.
+
+Each plot bin gets a fine histogram of y, with linearly spaced buckets from the lowest to the highest y
+(found by the first pass of @@STREAM, or from @@BOUNDS), plus one bucket for anything below that range
+and one for anything above. The buckets are all the same width, so the quantiles come back to within a
+fixed fraction (ACCURACY) of the range of y, which is what's needed for magnitudes and their differences:
+a relative accuracy would be much coarser at mB ~ 20 than at mB ~ 0. Inside a bucket the values are taken
+to be evenly spread, so the median is interpolated rather than snapped to the middle of the bucket.
+
+There's one sketch for each plot bin, all held in a single 2D array of counts, so adding a chunk is a
+single np.bincount. Sketches with the same buckets can be merged by adding up their counts, so chunks (or
+files) can be sketched separately and then put together.
+
+When the range isn't known before the first chunk (like x with @@BOUNDS, which only says where the plot
+bins go), the sketch starts from the range of the first chunk and is widened with extend whenever a
+chunk goes outside it, by joining neighbouring buckets together.
+"""
+import numpy as np
+
+ACCURACY = 1e-4 #Width of the buckets, as a fraction of the range of y
+
+
+class BinnedSketch:
+    """A quantile sketch of y for each of nbins bins, with buckets spread evenly from lo to hi."""
+    def __init__(self, nbins, lo, hi, accuracy=ACCURACY):
+        self.nbins = nbins
+        self.accuracy = accuracy
+        if not hi > lo: hi = lo + 1. #All the values are the same
+        self.nk = max(1, int(np.ceil(1/accuracy)))
+        #Columns are the underflow, the nk buckets and the overflow. Anything outside lo to hi comes back as lo or hi
+        self.counts = np.zeros((nbins, self.nk + 2))
+        self._buckets(lo, (hi - lo)/self.nk)
+
+    def _buckets(self, lo, width):
+        self.lo = lo
+        self.width = width
+        self.hi = lo + width*self.nk
+        self.left = np.concatenate([[lo], lo + width*np.arange(self.nk), [self.hi]])
+        self.widths = np.concatenate([[0.], np.full(self.nk, width), [0.]])
+
+    def _columns(self, y):
+        k = np.floor((y - self.lo)/self.width)
+        return (np.clip(k, -1, self.nk) + 1).astype(int)
+
+    def add(self, binidx, y):
+        """Adds the values y, where binidx says which bin each one is in (-1 or nbins for out of range)."""
+        y = np.asarray(y, dtype=float)
+        good = (binidx >= 0) & (binidx < self.nbins) & np.isfinite(y)
+        flat = binidx[good]*self.counts.shape[1] + self._columns(y[good])
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def extend(self, lo, hi):
+        """
+        Widens the buckets to cover lo to hi as well, for values whose range isn't known in advance. Each new
+        bucket is a whole number of the old ones, so the counts move over exactly, and the buckets are never
+        more than twice as wide as they'd be for the whole range. The underflow and overflow stay where they are,
+        so this is only for sketches that are always extended before anything outside them gets added.
+        """
+        if lo >= self.lo and hi <= self.hi:
+            return
+        below = max(0, int(np.ceil((self.lo - lo)/self.width)))
+        above = max(0, int(np.ceil((hi - self.hi)/self.width)))
+        factor = -(-(below + self.nk + above)//self.nk)
+        #Where each old column goes. The values in the overflow were all the old hi
+        columns = np.concatenate([[0], np.minimum((np.arange(self.nk + 1) + below)//factor, self.nk) + 1])
+        counts = np.zeros_like(self.counts)
+        np.add.at(counts.T, columns, self.counts.T)
+        self.counts = counts
+        self._buckets(self.lo - below*self.width, self.width*factor)
+
+    def merge(self, other):
+        """Adds the counts of other, which has to have the same bins and buckets, as if its values had gone into this sketch too."""
+        if other.counts.shape != self.counts.shape or other.lo != self.lo or other.width != self.width:
+            raise ValueError("Can only merge sketches with the same bins and buckets")
+        self.counts += other.counts
+
+    def quantile(self, q):
+        """The q quantile (0 to 1) in every bin. NaN for empty bins."""
+        total = self.counts.sum(axis=1)
+        rank = q*np.maximum(total - 1, 0)
+        #Interpolate between the values either side of the rank, like np.quantile does
+        lo, hi = self.at_ranks(np.stack([np.floor(rank), np.ceil(rank)], axis=1)).T
+        out = lo + (rank - np.floor(rank))*(hi - lo)
+        out[total == 0] = np.nan
+        return out
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def at_ranks(self, ranks):
+        """The value of the rank-th smallest y (from 0) in each bin, for an array of ranks with one row per bin."""
+        cum = np.cumsum(self.counts, axis=1)
+        out = np.empty(np.shape(ranks))
+        for i in range(self.nbins):
+            col = np.minimum(np.searchsorted(cum[i], ranks[i], side='right'), len(self.left) - 1)
+            inbucket = self.counts[i, col]
+            below = cum[i, col] - inbucket
+            frac = np.where(inbucket > 0, (ranks[i] - below + 0.5)/np.where(inbucket > 0, inbucket, 1), 0.5)
+            out[i] = self.left[col] + frac*self.widths[col]
+        return out
@@ -0,0 +1,81 @@
+"""
+Numbers-only mode (@@STATS): the summary statistics of each file, without drawing anything.
+
+Nothing in here (or in what plotter-class.py has imported by the time it gets here) pulls in
+matplotlib or scipy.stats, which take most of the start-up time of a plain run, so this is quick
+enough to call from a shell loop. The output is either text or, with @@STATS json, a single JSON
+object on stdout that looks like
+
+    {"x": "df.zHD", "y": null, "cut": null, "bins": [...],
+     "files": {"File1.FITRES": {"n": 5000, "mean": ..., "median": ..., "std": ...,
+                                "counts": [...], "poisson_low": [...], "poisson_high": [...]}, ...}}
+
+with y_mean, y_median, y_std and binned_median (the median y in each bin) as well for 2D plots, and with
+@@ERRORS, binned_median_low and binned_median_high, the 16th and 84th percentiles of the bootstrapped
+medians. Empty bins and the like come out as null.
+"""
+import json
+import numpy as np
+
+import streaming
+import histograms
+import plots
+
+
+def _clean(values):
+    """Plain floats for json, with None for NaN."""
+    if np.ndim(values) == 0:
+        return None if not np.isfinite(values) else float(values)
+    return [_clean(v) for v in values]
+
+
+def file_stats(k, bins, two_d=False, ERRORS=0, rng=None):
+    """Dictionary of the statistics of one file (a dataframe or streaming.StreamSummary). ERRORS is the number of bootstrap resamples."""
+    mean, median, std = streaming.describe(k)
+    binned = streaming.binned(k, bins)
+    counts = binned.hist_counts()
+    low, high = histograms.poisson_interval(counts)
+    out = {'n': int(streaming.count(k)), 'mean': mean, 'median': median, 'std': std,
+           'counts': counts, 'poisson_low': low, 'poisson_high': high}
+    if two_d:
+        y = np.asarray(k.y_plot_val, dtype=float)
+        if isinstance(k, streaming.StreamSummary) and not k.complete: #The sample would only give approximate y statistics
+            out['y_mean'] = out['y_median'] = out['y_std'] = np.nan
+        else:
+            out['y_mean'], out['y_median'], out['y_std'] = (np.mean(y), np.median(y), np.std(y)) if len(y) else (np.nan,)*3
+        out['binned_median'] = binned.binned_median()
+        if ERRORS:
+            with np.errstate(invalid='ignore'):
+                out['binned_median_low'], out['binned_median_high'] = np.percentile(binned.bootstrap_median(ERRORS, rng), [16., 84.], axis=1)
+    return out
+
+
+def report(dictionary, plotdic, boundsdic, CUT=None, FORMAT='text', file=None, ERRORS=0, SEED=0):
+    """Prints the statistics of every file in dictionary, as text or (FORMAT='json') JSON."""
+    bins = plots.get_bins(boundsdic)
+    two_d = len(plotdic) == 2
+    rng = np.random.default_rng(SEED)
+    files = {name: file_stats(k, bins, two_d, ERRORS, rng) for name, k in dictionary.items()}
+    if FORMAT == 'json':
+        out = {'x': plotdic['x'], 'y': plotdic.get('y'), 'cut': CUT, 'bins': _clean(bins),
+               'files': {name: {key: (val if key == 'n' else _clean(val)) for key, val in s.items()} for name, s in files.items()}}
+        print(json.dumps(out), file=file)
+        return
+    print('The bin edges are:', np.around(bins, 4).tolist(), file=file)
+    for name, s in files.items():
+        print(name+":", s['n'], "rows", file=file)
+        print("The Mean value for ", name, " is:", s['mean'], file=file)
+        print("The Median value for ", name, " is:", s['median'], file=file)
+        print("The standard deviation value for ", name, " is:", s['std'], file=file)
+        if two_d:
+            print("The Mean y value for ", name, " is:", s['y_mean'], file=file)
+            print("The Median y value for ", name, " is:", s['y_median'], file=file)
+            print("The standard deviation of y for ", name, " is:", s['y_std'], file=file)
+        errors = two_d and ERRORS
+        print("    bin low      bin high     count     poisson low  poisson high" + ("  median y" if two_d else "") +
+              ("     16%          84%" if errors else ""), file=file)
+        for i in range(len(bins) - 1):
+            row = "    %-12.5g %-12.5g %-9d %-12.5g %-12.5g" % (bins[i], bins[i+1], s['counts'][i], s['poisson_low'][i], s['poisson_high'][i])
+            if two_d: row += "  %-12.5g" % s['binned_median'][i]
+            if errors: row += " %-12.5g %.5g" % (s['binned_median_low'][i], s['binned_median_high'][i])
+            print(row.rstrip(), file=file)
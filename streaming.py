@@ -0,0 +1,280 @@
+"""
+Out-of-core mode (@@STREAM) for FITRES files that are too big to hold in memory.
+
+Instead of reading a whole file and then working out what to plot, each file is read a chunk of rows
+at a time. The @@CUT and @@VARIABLE expressions are evaluated on each chunk, and everything plotter_func
+needs is added to a StreamSummary before the chunk is thrown away:
+    - the histogram counts in the plot bins,
+    - the mean and standard deviation (combined chunk by chunk, so there's no loss of precision),
+    - quantile sketches of x, and of y in each x bin, for the median, binned medians and percentiles
+      (see sketches.py). The sketches of y need to know the range of y before the first chunk goes in,
+      while the one of x goes over the range of every x seen so far, so the median isn't clipped to the plot,
+    - a uniform random sample of points for the scatter plots, which unlike @@NROWS isn't biased
+      towards whatever happens to be at the top of the file,
+    - for 2D plots, a 2D histogram of every point, so the density image drawn past @@RASTER points
+      (see rendering.py) shows the whole file rather than just the sample.
+
+With loose bounds this takes two passes over each file, since the first has to find the range of x
+to set the plot bins (and of y, for the sketches). With @@BOUNDS given, one pass is enough, and the
+sketches of y go from the y bounds, so only medians that are off the plot get pinned to its edge. Except
+for DIFF ALL, where the y bounds are the range of the differences, so the first pass is still needed.
+
+DIFF CID needs every CID to do the join, so in that case CID, IDSURVEY, x and y are kept for every
+row that passes the cut, and nothing else.
+"""
+import numpy as np
+import pandas as pd
+
+import fitres_reader
+import expressions
+import sketches
+import histograms
+import profiling
+
+CHUNKSIZE = fitres_reader.CHUNKSIZE
+NPOINTS = 100000 #Number of points kept for the scatter plots
+
+
+def chunk_values(filename, plotdic, CUT=None, DIFF=None, NROWS=0, CHUNKSIZE=CHUNKSIZE, GZTHREADS=0):
+    """
+    Yields the row numbers, x values, y values (None for histograms) and a dataframe of CID and IDSURVEY
+    (None unless DIFF is CID) for each chunk of filename that passes the cut. CUT has to be row-wise, see
+    expressions.is_rowwise.
+    """
+    wanted = expressions.referenced_columns(list(plotdic.values()) + [CUT])
+    if (wanted is not None) and DIFF: wanted.add('CID')
+    optional = ('IDSURVEY',) if DIFF == 'CID' else ()
+    names, body = fitres_reader.open_fitres(filename, GZTHREADS)
+    for df in fitres_reader.iter_chunks(body, names, expressions.project(wanted, names, optional), NROWS, CHUNKSIZE):
+        yield values(df, plotdic, CUT, DIFF)
+
+
+def values(df, plotdic, CUT=None, DIFF=None):
+    """The row numbers, x, y and CIDs of the rows of df that pass the cut, like chunk_values, for a chunk that's already been read."""
+    if CUT: df = expressions.compile_cut(CUT)(df)
+    x = np.asarray(expressions.compile_expr(plotdic['x'])(df))
+    y = np.asarray(expressions.compile_expr(plotdic['y'])(df)) if len(plotdic) == 2 else None
+    cid = df[[c for c in ('CID', 'IDSURVEY') if c in df.columns]] if DIFF == 'CID' else None
+    return df.index.values, x, y, cid
+
+
+def scan_ranges(filename, plotdic, **kwargs):
+    """First pass for loose bounds: the minimum and maximum of x (and y) in filename, as {'x': [min, max], 'y': [min, max]}."""
+    print("Finding the range of", filename.split("/")[-1], "...")
+    ranges = {}
+    with profiling.stage('scan', filename):
+        for idx, x, y, cid in chunk_values(filename, plotdic, **kwargs):
+            for key, val in (('x', x), ('y', y)):
+                if val is None or len(val) == 0:
+                    continue
+                lo, hi = np.amin(val), np.amax(val)
+                if key in ranges:
+                    lo, hi = min(lo, ranges[key][0]), max(hi, ranges[key][1])
+                ranges[key] = [lo, hi]
+    return ranges
+
+
+def summarise(filename, plotdic, bins, NPOINTS=NPOINTS, ACCURACY=sketches.ACCURACY, YRANGE=None, EXTENT=None, RESOLUTION=300, **kwargs):
+    """
+    A StreamSummary of filename, or for DIFF CID a dataframe of just CID, IDSURVEY, x_plot_val and y_plot_val.
+    YRANGE is [ymin, ymax] for the sketches of y in 2D plots (the same for every file, so they all get the same buckets).
+    EXTENT is [xmin, xmax, ymin, ymax] for the density image of 2D plots, None not to make one.
+    """
+    print("Streaming", filename.split("/")[-1], "...")
+    summary = StreamSummary(bins, len(plotdic) == 2, NPOINTS, keep_cid=(kwargs.get('DIFF') == 'CID'), accuracy=ACCURACY,
+                            yrange=YRANGE, extent=EXTENT, resolution=RESOLUTION)
+    with profiling.stage('stream', filename): #Reading, the cut, the expressions and the summary all happen a chunk at a time
+        for idx, x, y, cid in chunk_values(filename, plotdic, **kwargs):
+            summary.add(idx, x, y, cid)
+    print("Done streaming", filename.split("/")[-1])
+    if summary.keep_cid:
+        return summary.frame()
+    return summary
+
+
+class StreamSummary:
+    """
+    Running summary of the plotted values in one file. Chunks go in with add(). The sketch of x is widened to
+    take in every chunk, and yrange ([min, max]) is where the sketches of y go for 2D plots. With yrange None
+    they go over the range of y in the first chunk, and get widened like the one of x.
+    """
+    def __init__(self, bins, two_d=False, npoints=NPOINTS, keep_cid=False, seed=0, accuracy=sketches.ACCURACY, yrange=None, extent=None,
+                 resolution=300):
+        self.bins = np.asarray(bins)
+        self.n = 0
+        self._mean = 0.
+        self.m2 = 0.
+        self.counts = np.zeros(len(bins)-1)
+        self.accuracy = accuracy
+        self.xsketch = None #Made from the range of the first chunk
+        self.ysketch = sketches.BinnedSketch(len(bins)-1, yrange[0], yrange[1], accuracy) if two_d and not keep_cid and yrange is not None else None
+        self.widen = two_d and not keep_cid and yrange is None #Sketches of y that go over the range of y
+        self.npoints = npoints
+        self.keep_cid = keep_cid
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.zeros(0)
+        self.sample = [np.zeros(0, dtype=int), np.zeros(0), np.zeros(0)] #row number, x, y
+        self.kept = []
+        self.extent = extent if two_d else None
+        self.grid = np.zeros((resolution, resolution)) if self.extent is not None else None
+
+    def add(self, idx, x, y=None, cid=None):
+        if len(x) == 0:
+            return
+        mean = np.mean(x)
+        self._add_moments(len(x), mean, np.sum((x - mean)**2))
+        binidx = histograms.bin_index(x, self.bins)
+        self.counts += np.bincount(binidx[(binidx >= 0) & (binidx < len(self.counts))], minlength=len(self.counts))
+        self.xsketch = self._extended(self.xsketch, 1, x)
+        if self.xsketch is not None: self.xsketch.add(np.zeros(len(x), dtype=int), x)
+        if self.widen:
+            self.ysketch = self._extended(self.ysketch, len(self.counts), y[(binidx >= 0) & (binidx < len(self.counts))])
+        if self.ysketch is not None:
+            self.ysketch.add(binidx, y)
+        if self.grid is not None:
+            self.grid += np.histogram2d(x, y, bins=self.grid.shape, range=[self.extent[:2], self.extent[2:]])[0]
+        if self.keep_cid:
+            self.kept.append((idx, cid, x, y))
+            return
+
+        self._add_sample(self.rng.random(len(x)), (idx, x, y if y is not None else np.zeros(len(x))))
+
+    def _extended(self, sketch, nbins, values):
+        """sketch widened to take in values, or made from their range if it's None. NaNs and infs don't count, as add leaves them out."""
+        finite = values[np.isfinite(values)]
+        if len(finite) == 0:
+            return sketch
+        lo, hi = np.amin(finite), np.amax(finite)
+        if sketch is None:
+            return sketches.BinnedSketch(nbins, lo, hi, self.accuracy)
+        sketch.extend(lo, hi)
+        return sketch
+
+    def _add_sample(self, keys, sample):
+        """Keep the npoints rows with the smallest random keys, which is a uniform sample of everything seen so far."""
+        keys = np.concatenate([self.keys, keys])
+        sample = [np.concatenate([s, v]) for s, v in zip(self.sample, sample)]
+        if len(keys) > self.npoints:
+            keep = np.argpartition(keys, self.npoints)[:self.npoints]
+            keys = keys[keep]
+            sample = [s[keep] for s in sample]
+        self.keys = keys
+        self.sample = sample
+
+    def _add_moments(self, n, mean, m2):
+        """Chan et al. for combining the mean and variance of two sets."""
+        delta = mean - self._mean
+        total = self.n + n
+        self._mean += delta*n/total
+        self.m2 += m2 + delta**2*self.n*n/total
+        self.n = total
+
+    @property
+    def complete(self):
+        """True if the sample holds every row, ie, x_plot_val and y_plot_val are the whole file."""
+        return self.n <= self.npoints
+
+    def _sorted(self, i, name):
+        """Column i of the sample as a Series in file order, indexed by row number like the dataframe would be, so DIFF ALL lines up the same rows."""
+        order = np.argsort(self.sample[0], kind='stable')
+        return pd.Series(self.sample[i][order], index=self.sample[0][order], name=name)
+
+    @property
+    def x_plot_val(self):
+        return self._sorted(1, 'x_plot_val')
+
+    @property
+    def y_plot_val(self):
+        return self._sorted(2, 'y_plot_val')
+
+    def mean(self):
+        return self._mean if self.n else np.nan
+
+    def std(self):
+        return np.sqrt(self.m2/self.n) if self.n else np.nan
+
+    def median(self):
+        return self.xsketch.median()[0] if self.xsketch is not None else np.nan
+
+    def hist_counts(self):
+        return self.counts.copy()
+
+    def binned_median(self):
+        return self.binned_quantile(0.5)
+
+    def binned_quantile(self, q):
+        if self.ysketch is None: #Nothing in the bins yet
+            return np.full(len(self.counts), np.nan)
+        return self.ysketch.quantile(q)
+
+    def bootstrap_median(self, nboot, seed=0):
+        """Bootstrap medians of y in each bin, see histograms.BinnedData. Drawn from the sketches, so only to within their accuracy."""
+        if self.ysketch is None:
+            return np.full((len(self.counts), nboot), np.nan)
+        lo, hi, full = histograms.bootstrap_ranks(self.ysketch.counts.sum(axis=1), nboot, seed)
+        out = (self.ysketch.at_ranks(lo) + self.ysketch.at_ranks(hi))/2
+        out[~full] = np.nan
+        return out
+
+    def frame(self):
+        """All the kept rows as a dataframe, for DIFF CID."""
+        if not self.kept:
+            return pd.DataFrame(columns=['CID', 'x_plot_val', 'y_plot_val'])
+        idx, cid, x, y = zip(*self.kept)
+        df = pd.concat(cid)
+        df['x_plot_val'] = np.concatenate(x)
+        df['y_plot_val'] = np.concatenate(y)
+        return df
+
+
+#The functions below are what plotter_func uses, so it works the same on a StreamSummary or a dataframe.
+
+def binned(k, bins):
+    """
+    Something with hist_counts(), binned_median() and binned_quantile(q) for k: the StreamSummary itself, or a
+    histograms.BinnedData of the dataframe, so all of them come from splitting it into bins once.
+    """
+    if isinstance(k, StreamSummary):
+        return k
+    return histograms.BinnedData(k.x_plot_val, bins, k.y_plot_val if 'y_plot_val' in k.columns else None)
+
+
+def hist_counts_all(dictionary, bins):
+    """The counts in the bins for every file in dictionary, as an array with one row per file."""
+    frames = [k.x_plot_val for k in dictionary.values() if not isinstance(k, StreamSummary)]
+    counts = iter(histograms.hist_counts_all(frames, bins)) #All the dataframes at once
+    return np.array([k.hist_counts() if isinstance(k, StreamSummary) else next(counts) for k in dictionary.values()]).reshape(len(dictionary), len(bins) - 1)
+
+
+def hist_counts(k, bins):
+    return binned(k, bins).hist_counts()
+
+
+def binned_median(k, bins):
+    return binned(k, bins).binned_median()
+
+
+def binned_quantile(k, bins, q):
+    """The q quantile (0 to 1) of y in each bin of x."""
+    return binned(k, bins).binned_quantile(q)
+
+
+def raster(k):
+    """What rendering.points needs to draw the density of every point in a StreamSummary, not just the sample."""
+    if isinstance(k, StreamSummary):
+        return dict(grid=(k.grid, k.extent) if k.grid is not None else None, n=k.n)
+    return {}
+
+
+def count(k):
+    """Number of rows that passed the cut."""
+    if isinstance(k, StreamSummary):
+        return k.n
+    return len(k)
+
+
+def describe(k):
+    """Mean, median and standard deviation of x."""
+    if isinstance(k, StreamSummary):
+        return k.mean(), k.median(), k.std()
+    return np.mean(k.x_plot_val), np.median(k.x_plot_val), np.std(k.x_plot_val)
@@ -0,0 +1,69 @@
+"""
+Shared bits for the tests: the modules at the top of the repo (and benchmarks/generate.py) on the path,
+a cache directory of their own, and small FITRES files to read.
+"""
+import os
+import sys
+import gzip
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+os.environ['MIDWAY_CACHE_DIR'] = tempfile.mkdtemp(prefix='midwaycache') #Never the real cache, even for plotter-class.py
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import pytest
+import pandas as pd
+import generate
+import fitres_reader
+
+PLOTTER = os.path.join(ROOT, 'plotter-class.py')
+
+
+def write_fitres(filename, names, rows, prefix='SN:', header=('# A hand made FITRES',)):
+    """Writes rows (lists of values) under a VARNAMES line of names, gzipped if filename ends in .gz."""
+    lines = list(header) + ['NVAR: %d' % len(names), 'VARNAMES: ' + ' '.join(names)]
+    lines += [prefix + ' ' + ' '.join(str(v) for v in row) for row in rows]
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'wt') as fp:
+        fp.write('\n'.join(lines) + '\n')
+    return filename
+
+
+def read_original(filename, usecols=None):
+    """filename read the way the plotter always used to: one pd.read_csv of everything after the header."""
+    with fitres_reader.open_raw(filename) as fp:
+        lines = [line for line in fp]
+    skip = next(i for i, line in enumerate(lines) if line.startswith(fitres_reader.DATA_PREFIXES))
+    names = next(line for line in lines if line.startswith(b'VARNAMES:')).decode().split()
+    return pd.read_csv(filename, header=None, skiprows=skip, names=names, usecols=usecols, sep=r"\s+", skip_blank_lines=True, comment='#')
+
+
+def run_plotter(*args, script=PLOTTER, cwd=None):
+    """Runs plotter-class.py (or script) with args, and returns the finished process with its output as text."""
+    return subprocess.run([sys.executable, script] + [str(a) for a in args], capture_output=True, text=True, cwd=cwd, timeout=300)
+
+
+@pytest.fixture(scope='session')
+def fitres(tmp_path_factory):
+    """A synthetic FITRES of 5000 supernovae, as made for the benchmarks."""
+    return generate.generate(str(tmp_path_factory.mktemp('fitres') / 'base.FITRES'), 5000, seed=1)
+
+
+@pytest.fixture(scope='session')
+def variant(tmp_path_factory):
+    """The second FITOPT of the same supernovae as fitres: about 10% fewer, with mB shifted by about 0.01."""
+    return generate.generate(str(tmp_path_factory.mktemp('fitres') / 'variant.FITRES'), 5000, seed=1, variant=True)
+
+
+@pytest.fixture(scope='session')
+def mixed(tmp_path_factory):
+    """100000 supernovae with a FIELD of 10 in the first 80% of the rows and text after that, so several of pandas' pieces."""
+    return generate.generate(str(tmp_path_factory.mktemp('fitres') / 'mixed.FITRES'), 100000, seed=2, mixed=True)
+
+
+@pytest.fixture
+def cachedir(tmp_path):
+    return str(tmp_path / 'cache')
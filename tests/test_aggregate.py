@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from conftest import run_plotter, read_original
+import generate
+import aggregate
+
+PLOTDIC = {'x': 'df.zHD', 'y': 'df.mB - 3.1*df.c'}
+CUT = 'df.loc[df.c > -0.1]'
+BINS = np.arange(0.05, 0.9, 0.1)
+
+
+@pytest.fixture(scope='module')
+def sweep(tmp_path_factory):
+    """Five FITOPTs of different supernovae, and one that isn't a FITRES at all."""
+    folder = tmp_path_factory.mktemp('sweep')
+    files = [generate.generate(str(folder / ('FITOPT%03d.FITRES' % i)), 2000, seed=10 + i) for i in range(5)]
+    (folder / 'FITOPT999.FITRES').write_text('not a FITRES\n')
+    return str(folder), files
+
+
+def expected_result(filename, ref_total=None):
+    """Counts (normalised to ref_total) and binned medians of filename, worked out directly."""
+    df = read_original(filename)
+    df = df.loc[df.c > -0.1]
+    x, y = df.zHD.values, (df.mB - 3.1*df.c).values
+    counts = np.histogram(x, BINS)[0].astype(float)
+    if ref_total is not None: counts *= ref_total/counts.sum()
+    inbin = np.digitize(x, BINS) - 1
+    medians = np.array([np.median(y[inbin == i]) if (inbin == i).any() else np.nan for i in range(len(BINS) - 1)])
+    return counts, medians
+
+
+def test_expand(sweep):
+    folder, files = sweep
+    got = aggregate.expand([folder + '/FITOPT00[3-4]*', folder + '/FITOPT00*', folder + '/nothing*'], exclude=files[:1])
+    assert got == files[3:] + files[1:3]
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_same_as_each_file(fitres, sweep, jobs):
+    folder, files = sweep
+    result = aggregate.aggregate(fitres, aggregate.expand([folder + '/*']), PLOTDIC, {'x': [0.05, 0.9, 0.1]}, jobs, CUT=CUT, USECACHE=False)
+    np.testing.assert_allclose(result['bins'], BINS)
+    assert result['nfiles'] == 5 #The one that isn't a FITRES is left out
+    counts, medians = expected_result(fitres)
+    np.testing.assert_array_equal(result['reference']['counts'], counts)
+    np.testing.assert_allclose(result['reference']['median'], medians)
+    expected = [expected_result(f, counts.sum()) for f in files]
+    for key, values in (('counts', np.array([e[0] for e in expected])), ('median', np.array([e[1] for e in expected]))):
+        env = result[key]
+        np.testing.assert_allclose(env['values'], values)
+        np.testing.assert_allclose(env['min'], values.min(axis=0))
+        np.testing.assert_allclose(env['max'], values.max(axis=0))
+        np.testing.assert_allclose(env['low'], np.percentile(values, 16, axis=0))
+        np.testing.assert_allclose(env['high'], np.percentile(values, 84, axis=0))
+        np.testing.assert_allclose(env['median'], np.median(values, axis=0))
+
+
+def test_loose_bounds_and_streaming(fitres, sweep):
+    folder, files = sweep
+    memory, streamed = [aggregate.aggregate(fitres, files, PLOTDIC, {}, CUT=CUT, USECACHE=False, STREAM=stream) for stream in (0, 700)]
+    df = read_original(fitres).loc[lambda d: d.c > -0.1]
+    np.testing.assert_allclose(memory['bins'], np.linspace(df.zHD.min(), df.zHD.max(), 30))
+    np.testing.assert_allclose(streamed['bins'], memory['bins'])
+    np.testing.assert_array_equal(streamed['counts']['values'], memory['counts']['values'])
+    np.testing.assert_allclose(streamed['median']['values'], memory['median']['values'], atol=0.01) #Only as good as @@ACCURACY
+
+
+def test_envelope_of_empty_bins():
+    env = aggregate.envelope(np.array([[1., np.nan], [3., np.nan]]), [25., 75.])
+    assert env['low'][0] == 1.5 and env['high'][0] == 2.5 and env['median'][0] == 2
+    assert np.isnan(env['low'][1]) and np.isnan(env['min'][1])
+    assert np.isnan(aggregate.envelope(np.empty((0, 2)))['max']).all()
+
+
+@pytest.mark.parametrize('extra', [['@@VARIABLE', 'df.zHD'], ['@@VARIABLE', 'df.zHD:df.mB', '@@DIFF', 'ALL', '@@JOBS', '2'],
+                                   ['@@VARIABLE', 'df.zHD:df.mB', '@@STREAM', '1000']])
+def test_plotter(fitres, sweep, tmp_path, extra):
+    folder, files = sweep
+    out = run_plotter('@@FITRES', fitres, '@@AGGREGATE', folder + '/FITOPT*', '@@NOCACHE', '@@SAVE', tmp_path / 'sweep.png', *extra)
+    assert out.returncode == 0, out.stderr
+    assert 'Comparing base.FITRES with 6 files' in out.stdout and 'Leaving out FITOPT999.FITRES' in out.stdout
+    assert (tmp_path / 'sweep.png').stat().st_size > 0
+    refused = run_plotter('@@FITRES', fitres, '@@AGGREGATE', folder + '/FITOPT*', '@@VARIABLE', 'df.zHD:df.mB', '@@DIFF', 'CID', '@@NOCACHE')
+    assert "DIFF CID doesn't work with @@AGGREGATE" in refused.stdout
@@ -0,0 +1,37 @@
+import os
+import json
+
+import pytest
+
+from conftest import run_plotter
+
+PLOTS = [
+    ['@@VARIABLE', 'df.zHD:df.mB - 3.1*df.c', '@@CUT', 'df.loc[df.IDSURVEY != 150]'],
+    ['@@VARIABLE', 'df.x1', '@@BOUNDS', '-3', '3', '0.5'],
+    ['@@VARIABLE', 'df.zHD:df.mB', '@@DIFF', 'CID', '@@ERRORS', '50'],
+]
+
+
+def spec_line(args):
+    return ' '.join('"%s"' % a if ' ' in a else a for a in args)
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_same_as_one_plot_at_a_time(fitres, variant, tmp_path, jobs):
+    spec = tmp_path / 'plots.txt'
+    lines = ['# statistics of each plot, then the same plots as pictures']
+    lines += [spec_line(p + ['@@STATS', 'json', '@@SAVE', str(tmp_path / ('stats%d.json' % i))]) for i, p in enumerate(PLOTS)]
+    lines += ['', spec_line(PLOTS[0] + ['@@SAVE', str(tmp_path / 'hubble.png')]), spec_line(PLOTS[2] + ['@@SAVE', str(tmp_path / 'diff.pdf')])]
+    lines += ['@@VARIABLE df.NOTACOLUMN @@SAVE ' + str(tmp_path / 'bad.png'), '@@VARIABLE "__import__(\'os\')"']
+    spec.write_text('\n'.join(lines) + '\n')
+    done = run_plotter('@@BATCH', spec, '@@FITRES', fitres, variant, '@@JOBS', jobs, '@@NOCACHE', cwd=tmp_path)
+    assert done.returncode == 0, done.stderr
+    assert "Couldn't make " + str(tmp_path / 'bad.png') in done.stdout
+    assert "Skipping plot 6" in done.stdout
+    for i, p in enumerate(PLOTS):
+        alone = run_plotter('@@FITRES', fitres, variant, *p, '@@STATS', 'json', '@@NOCACHE')
+        assert alone.returncode == 0, alone.stderr
+        with open(tmp_path / ('stats%d.json' % i)) as fp:
+            assert json.load(fp) == json.loads(alone.stdout)
+    assert os.path.getsize(tmp_path / 'hubble.png') > 0 and os.path.getsize(tmp_path / 'diff.pdf') > 0
+    assert not os.path.exists(tmp_path / 'bad.png')
@@ -0,0 +1,45 @@
+import os
+import json
+import subprocess
+import sys
+
+import pandas as pd
+
+from conftest import ROOT, read_original
+import generate
+import run
+
+
+def test_results_stay_out_of_git():
+    assert os.path.dirname(run.RESULTS) == run.DATA
+    ignored = subprocess.run(['git', 'check-ignore', '-q', os.path.relpath(run.RESULTS, ROOT)], cwd=ROOT)
+    assert ignored.returncode == 0
+
+
+def test_run_and_compare(tmp_path):
+    script = os.path.join(ROOT, 'benchmarks', 'run.py')
+    results = str(tmp_path / 'results.jsonl')
+    args = [sys.executable, script, '--sizes', '1e3', '--nogz', '--repeat', '1', '--data', str(tmp_path / 'data'), '--results', results]
+    out = subprocess.run(args, capture_output=True, text=True, timeout=300, cwd=tmp_path, env=dict(os.environ, MPLBACKEND='Agg'))
+    assert out.returncode == 0, out.stderr
+    with open(results) as fp:
+        entries = [json.loads(line) for line in fp]
+    assert [(e['rows'], e['gzip']) for e in entries] == [(1000, False)]
+    assert set(entries[0]['stages']) == set(run.STAGES)
+    out = subprocess.run([sys.executable, script, '--results', results, '--compare', 'HEAD', 'HEAD'], capture_output=True, text=True, cwd=ROOT)
+    assert out.returncode == 0, out.stderr
+    assert all(stage in out.stdout for stage in run.STAGES)
+    assert not os.path.exists(os.path.join(ROOT, 'benchmarks', 'results.jsonl'))
+
+
+def test_generate(tmp_path):
+    plain, gz = str(tmp_path / 'a.FITRES'), str(tmp_path / 'a.FITRES.gz')
+    generate.generate(plain, 2000, seed=4)
+    generate.generate(gz, 2000, seed=4)
+    variant = str(tmp_path / 'v.FITRES')
+    generate.generate(variant, 2000, seed=4, variant=True)
+    df, dfgz, dfv = read_original(plain), read_original(gz), read_original(variant)
+    assert len(df) == 2000
+    pd.testing.assert_frame_equal(df, dfgz)
+    assert df.CID.is_unique and set(dfv.CID) < set(df.CID)
+    assert 0.8*len(df) < len(dfv) < len(df)
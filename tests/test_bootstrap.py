@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import run_plotter
+import histograms
+import sketches
+import streaming
+
+
+def resampled_medians(y, nboot, rng):
+    """Bootstrap medians the slow way, by drawing every resample."""
+    return np.median(rng.choice(y, size=(nboot, len(y))), axis=1)
+
+
+@pytest.mark.parametrize('n', [1, 2, 5, 6, 25])
+def test_same_distribution_as_resampling(n):
+    rng = np.random.default_rng(n)
+    y = rng.normal(size=n)
+    binned = histograms.BinnedData(np.full(n, 0.5), [0, 1], y)
+    got = binned.bootstrap_median(100000, seed=1)[0]
+    expected = resampled_medians(y, 100000, rng)
+    for q in (5, 16, 50, 84, 95):
+        assert np.percentile(got, q) == pytest.approx(np.percentile(expected, q), abs=0.02)
+    if n <= 6: #Only so many values the median of a resample can take
+        values = np.unique(np.concatenate([got, expected]))
+        p, e = [np.array([np.mean(d == v) for v in values]) for d in (got, expected)]
+        np.testing.assert_allclose(p, e, atol=0.01)
+
+
+def test_seed_and_empty_bins():
+    x, y = np.array([0.1, 0.2, 0.7]), np.array([1., 2., 3.])
+    binned = histograms.BinnedData(x, [0, 0.5, 1, 1.5], y)
+    a, b = binned.bootstrap_median(50, 3), binned.bootstrap_median(50, 3)
+    np.testing.assert_array_equal(a, b)
+    assert a.shape == (3, 50) and np.isnan(a[2]).all() and (a[1] == 3).all()
+    assert not np.array_equal(a, binned.bootstrap_median(50, 4))
+    below, above = histograms.bootstrap_band(a, binned.binned_median())
+    assert below[1] == above[1] == 0 and np.isnan(below[2])
+
+
+def test_from_sketches():
+    rng = np.random.default_rng(2)
+    x, y = rng.uniform(0, 1, 20000), rng.normal(size=20000)
+    bins = np.linspace(0, 1, 5)
+    summary = streaming.StreamSummary(bins, True, yrange=[-6., 6.])
+    summary.add(np.arange(len(x)), x, y)
+    got = np.percentile(summary.bootstrap_median(2000, 5), [16, 84], axis=1)
+    expected = np.percentile(histograms.BinnedData(x, bins, y).bootstrap_median(2000, 5), [16, 84], axis=1)
+    np.testing.assert_allclose(got, expected, atol=12*sketches.ACCURACY)
+
+
+def test_errors_in_stats(fitres, variant):
+    args = ['@@FITRES', fitres, variant, '@@VARIABLE', 'df.zHD:df.mB', '@@STATS', 'json', '@@NOCACHE', '@@ERRORS', '200']
+    runs = [json.loads(run_plotter(*args, *seed).stdout) for seed in ([], ['@@SEED', '0'], ['@@SEED', '9'])]
+    assert runs[0] == runs[1] != runs[2]
+    for s in runs[0]['files'].values():
+        for low, median, high in zip(s['binned_median_low'], s['binned_median'], s['binned_median_high']):
+            assert (low is None and median is None) or low <= median <= high
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import read_original
+import cidjoin
+
+
+def pandas_join(a, b, on):
+    """Row numbers of the pairs from the inner join the plotter used to do."""
+    left = a[on].reset_index().rename(columns={'index': 'ref'})
+    right = b[on].reset_index().rename(columns={'index': 'other'})
+    joined = left.merge(right, on=on, how='inner', sort=False)
+    joined = joined.sort_values(['ref', 'other'], kind='stable')
+    return joined.ref.to_numpy(), joined.other.to_numpy()
+
+
+def check(a, b, on=('CID',)):
+    on = list(on)
+    join = cidjoin.CIDJoin(a['CID'], a['IDSURVEY'] if 'IDSURVEY' in on else None)
+    ref, other = join.match(b['CID'], b['IDSURVEY'] if 'IDSURVEY' in on else None)
+    expected = pandas_join(a, b, on)
+    np.testing.assert_array_equal(ref, expected[0])
+    np.testing.assert_array_equal(other, expected[1])
+
+
+def test_same_as_pandas(fitres, variant):
+    a, b = read_original(fitres), read_original(variant)
+    check(a, b)
+    check(a, b, ('CID', 'IDSURVEY'))
+    check(b, a)
+
+
+@pytest.mark.parametrize('a, b', [
+    ([5, 3, 9, 1], [9, 9, 1, 7, 3]), #Repeats in the other file
+    ([5, 3, 5, 1], [5, 1, 5]), #and in the reference
+    (['2011fe', 'sn1', '3'], ['3', '2011fe', 'x']), #Names
+    ([1, 2, 3], ['2', 'x', '3']), #Numbers in one, not the other
+    ([1.0, 2.0, 3.0], [3, 2]),
+    ([1, 2], [3, 4]),
+])
+def test_kinds_of_cid(a, b):
+    a, b = pd.DataFrame({'CID': a}), pd.DataFrame({'CID': b})
+    got = cidjoin.CIDJoin(a.CID).match(b.CID)
+    try:
+        expected = pandas_join(a, b, ['CID'])
+    except ValueError: #pandas won't join numbers with text, so compare them as text
+        expected = pandas_join(a.astype({'CID': str}), b.astype({'CID': str}), ['CID'])
+    for g, e in zip(got, expected):
+        np.testing.assert_array_equal(g, e)
+
+
+def test_same_cid_other_survey():
+    a = pd.DataFrame({'CID': [1, 1, 2], 'IDSURVEY': [10, 15, 10]})
+    b = pd.DataFrame({'CID': [1, 2, 2], 'IDSURVEY': [15, 15, 10]})
+    check(a, b, ('CID', 'IDSURVEY'))
+    with pytest.raises(ValueError):
+        cidjoin.CIDJoin(a.CID, a.IDSURVEY).match(b.CID)
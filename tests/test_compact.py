@@ -0,0 +1,112 @@
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import run_plotter, read_original
+import compact
+import loader
+
+PLOTDIC = {'x': 'df.zHD', 'y': 'df.mB - 3.1*df.c'}
+
+
+def test_exact_and_smaller(fitres):
+    df = read_original(fitres)
+    table = compact.CompactTable(df)
+    pd.testing.assert_frame_equal(table.frame(), df)
+    pd.testing.assert_frame_equal(table.frame(['mB', 'CID', 'NOTACOLUMN']), df[['CID', 'mB']])
+    assert compact.memory_usage(table) < compact.memory_usage(df)/2
+
+
+def test_mixed_text(mixed):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.DtypeWarning)
+        df = read_original(mixed)
+    table = compact.CompactTable(df)
+    pd.testing.assert_frame_equal(table.frame(), df)
+    assert list(table.frame(['FIELD']).FIELD.map(type)) == list(df.FIELD.map(type))
+
+
+def test_columns():
+    values = {
+        'small': np.array([0, 5, -100]),
+        'big': np.array([0, 2**40]),
+        'decimals': np.array([0.125, -0.0, 19.5, 21.375]),
+        'many': np.array([0.1234567891234, 1.]),
+        'gaps': np.array([1.5, np.nan]),
+        'text': np.array(['C3', 'X3', 'C3'], dtype=object),
+    }
+    dtypes = {'small': np.int8, 'big': np.int64, 'decimals': np.int16, 'many': np.float64, 'gaps': np.float64}
+    for name, v in values.items():
+        col = compact.Column(v)
+        np.testing.assert_array_equal(col.values(), v)
+        assert col.values().dtype == v.dtype
+        if name in dtypes: assert col.data.dtype == dtypes[name]
+    assert isinstance(compact.Column(values['text']).data, pd.Categorical)
+    assert compact.smallest_int(-129, 0) == np.int16 and compact.smallest_int(0, 2**31) == np.int64
+
+
+def test_take_keeps_row_numbers(fitres):
+    df = read_original(fitres).loc[lambda d: d.c > 0]
+    table = compact.CompactTable(df)
+    rows = np.array([3, 0, 10])
+    pd.testing.assert_frame_equal(table.take(rows).frame(), df.take(rows))
+    pd.testing.assert_frame_equal(table.head(20).frame(), df.head(20))
+    whole = compact.CompactTable(read_original(fitres))
+    assert whole.index is None and whole.head(5).index is None
+    pd.testing.assert_frame_equal(whole.take(slice(5, 9)).frame(), read_original(fitres).iloc[5:9])
+
+
+def test_plot_data(fitres):
+    df = loader.plot_values(read_original(fitres), PLOTDIC, 'df.loc[df.c > 0]')
+    data = compact.PlotData(df, 'base', keep=('CID', 'IDSURVEY'))
+    assert list(data.columns) == ['x_plot_val', 'y_plot_val', 'CID', 'IDSURVEY'] and len(data) == len(df)
+    for c in data.columns:
+        pd.testing.assert_series_equal(data[c], df[c])
+    pd.testing.assert_series_equal(data.x_plot_val, df.x_plot_val)
+    with pytest.raises(KeyError):
+        data['mB']
+    assert compact.memory_usage(data) < compact.memory_usage(df)/3
+    one = compact.PlotData(loader.plot_values(read_original(fitres), {'x': 'df.zHD'}))
+    assert list(one.columns) == ['x_plot_val'] and one.index is None
+
+
+@pytest.mark.parametrize('cut', ['df.loc[df.IDSURVEY != 150]', 'df.loc[df.mB < df.mB.median()]'])
+def test_loader(fitres, cut):
+    table, cutdone = loader.read_table(fitres, PLOTDIC.values(), cut, 'CID', USECACHE=False, COMPACT=True)
+    df, _ = loader.read_table(fitres, PLOTDIC.values(), cut, 'CID', USECACHE=False)
+    pd.testing.assert_frame_equal(table.frame(), df)
+    got = loader.plot_values(table, PLOTDIC, None if cutdone else cut, 'base', COMPACT=True, DIFF='CID')
+    expected = loader.plot_values(df, PLOTDIC, None if cutdone else cut)
+    assert list(got.columns) == ['x_plot_val', 'y_plot_val', 'CID', 'IDSURVEY']
+    for c in got.columns:
+        pd.testing.assert_series_equal(got[c], expected[c])
+
+
+@pytest.mark.parametrize('extra', [
+    ['@@VARIABLE', 'df.zHD:df.mB - 3.1*df.c', '@@CUT', 'df.loc[df.c > 0]'],
+    ['@@VARIABLE', 'df.zHD:df.mB', '@@DIFF', 'CID'],
+    ['@@VARIABLE', 'df.x1:df.c', '@@DIFF', 'ALL'],
+])
+def test_plotter_same_with_compact(fitres, variant, tmp_path, extra):
+    args = ['@@FITRES', fitres, variant, *extra, '@@NOCACHE']
+    for kind in ('plain', 'compact'):
+        out = run_plotter(*args, '@@SAVE', tmp_path / (kind + '.png'), *(['@@COMPACT'] if kind == 'compact' else []))
+        assert out.returncode == 0, out.stderr
+    assert (tmp_path / 'plain.png').read_bytes() == (tmp_path / 'compact.png').read_bytes()
+    plain, small = run_plotter(*args, '@@STATS', 'json'), run_plotter(*args, '@@STATS', 'json', '@@COMPACT')
+    assert json.loads(small.stdout) == json.loads(plain.stdout)
+
+
+def test_batch_same_with_compact(fitres, variant, tmp_path):
+    spec = tmp_path / 'plots.txt'
+    spec.write_text('@@VARIABLE df.zHD:df.mB @@STATS json @@SAVE a.json\n@@VARIABLE df.c @@CUT "df.loc[df.x1 > 0]" @@STATS json @@SAVE b.json\n')
+    for kind in ('plain', 'compact'):
+        (tmp_path / kind).mkdir()
+        out = run_plotter('@@BATCH', spec, '@@FITRES', fitres, variant, '@@NOCACHE', *(['@@COMPACT'] if kind == 'compact' else []),
+                          cwd=tmp_path / kind)
+        assert out.returncode == 0, out.stderr
+    for name in ('a.json', 'b.json'):
+        assert json.loads((tmp_path / 'compact' / name).read_text()) == json.loads((tmp_path / 'plain' / name).read_text())
@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import run_plotter, read_original
+import corner
+import histograms
+
+VARIABLES = ['df.zHD', 'df.x1', 'df.mB - 3.1*df.c']
+CUT = 'df.loc[df.FITPROB > 0.05]'
+
+
+def test_parse():
+    assert corner.parse_variables(['df.zHD:df.x1:df.mB', '-', '3.1*df.c']) == ['df.zHD', 'df.x1', 'df.mB - 3.1*df.c']
+    assert corner.parse_variables(['df.zHD', 'df.x1']) == ['df.zHD', 'df.x1']
+    assert corner.parse_bounds('loose', 2) == [None, None]
+    assert corner.parse_bounds(['0', '1', '0.1', ':', 'loose', ':', '-3', '3', '1'], 4) == [[0., 1., 0.1], None, [-3., 3., 1.], None]
+    for bad in (['0', '1'], ['0', '1', '0.1', ':', '0', '1', '0.1', ':', '0', '1', '0.1']):
+        with pytest.raises(ValueError):
+            corner.parse_bounds(bad, 2)
+
+
+def test_load(fitres):
+    values = corner.load(fitres, VARIABLES, CUT, USECACHE=False)
+    df = read_original(fitres).loc[lambda d: d.FITPROB > 0.05]
+    np.testing.assert_array_equal(values, np.column_stack([df.zHD, df.x1, df.mB - 3.1*df.c]))
+    assert corner.load(fitres, ['df.zHD', '1.5'], 'df.loc[df.c > 10]', USECACHE=False).shape == (0, 2)
+    np.testing.assert_array_equal(corner.load(fitres, ['1.5', 'df.zHD'], NROWS=4, USECACHE=False)[:, 0], np.full(4, 1.5)) #Constants fill the column
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_panels(fitres, variant, threads):
+    values = [corner.load(f, VARIABLES, CUT, USECACHE=False) for f in (fitres, variant)]
+    edges = corner.get_bins(values, [[0., 1., 0.1], None, None])
+    np.testing.assert_allclose(edges[0], np.arange(0., 1., 0.1))
+    both = np.concatenate(values)
+    np.testing.assert_allclose(edges[2], np.linspace(both[:, 2].min(), both[:, 2].max(), corner.NBINS))
+    binned = corner.panels(values, edges, threads, RASTER=-1)
+    assert sorted(binned) == [(0, 0), (1, 0), (1, 1), (2, 0), (2, 1), (2, 2)]
+    for i in range(3):
+        for k, v in enumerate(values):
+            np.testing.assert_array_equal(binned[(i, i)][k], np.histogram(v[:, i], edges[i])[0])
+            for j in range(i):
+                median, grid = binned[(i, j)][k]
+                assert grid is None
+                np.testing.assert_array_equal(median, histograms.BinnedData(v[:, j], edges[j], v[:, i]).binned_median())
+    dense = corner.panels(values, edges, threads, RASTER=100)
+    assert all(grid is not None for median, grid in dense[(1, 0)])
+
+
+def test_run(fitres, variant):
+    fig = corner.run([fitres, variant], ['base', 'variant'], VARIABLES, CUT=CUT, USECACHE=False, THREADS=2)
+    assert len(fig.axes) == 9
+    assert [ax.get_xlabel() for ax in fig.axes[6:]] == VARIABLES
+    assert sum(ax.axison for ax in fig.axes) == 6
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_plotter_reads_each_file_once(fitres, variant, tmp_path, jobs):
+    out = run_plotter('@@FITRES', fitres, variant, '@@CORNER', ':'.join(VARIABLES), '@@CUT', CUT, '@@BOUNDS', '0', '1', '0.05',
+                      '@@SAVE', tmp_path / 'corner.png', '@@NOCACHE', '@@JOBS', jobs, '@@PROFILE', tmp_path / 'profile.json')
+    assert out.returncode == 0, out.stderr
+    assert (tmp_path / 'corner.png').stat().st_size > 0
+    assert 'Binning 6 panels' in out.stdout
+    with open(tmp_path / 'profile.json') as fp:
+        stages = json.load(fp)['stages']
+    for name in ('base.FITRES', 'variant.FITRES'):
+        assert [r['stage'] for r in stages if r['file'] == name].count('parse') == 1
+
+
+def test_plotter_errors(fitres):
+    out = run_plotter('@@FITRES', fitres, '@@CORNER', 'df.zHD:df.x1', '@@BOUNDS', '0', '1', '@@NOCACHE')
+    assert "Couldn't process this command!" in out.stdout
+    out = run_plotter('@@FITRES', fitres, '@@CORNER', 'df.zHD:df.NOTACOLUMN', '@@NOCACHE')
+    assert "not present in one or more of the files" in out.stdout
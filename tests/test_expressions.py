@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import expressions
+
+DF = pd.DataFrame({'zHD': [0.05, 0.2, 0.4, 0.7, np.nan], 'mB': [15.2, 18.9, 20.1, 21.3, 22.0], 'c': [-0.1, 0.0, 0.05, 0.2, 0.1],
+                   'IDSURVEY': [1, 15, 15, 150, 10], 'FIELD': ['C3', 'X3', 'C3', 'E2', 'NONE']})
+
+
+def baseline(expr, df=DF):
+    """What the plotter used to do with @@VARIABLE and @@CUT strings."""
+    return eval(expr)
+
+
+def check(expr, mode):
+    compiled = expressions.Expression(expr)
+    assert compiled.mode == mode
+    np.testing.assert_array_equal(np.asarray(compiled(DF)), np.asarray(baseline(expr)))
+
+
+@pytest.mark.parametrize('expr, mode', [
+    ("df.zHD*np.pi", 'numexpr'),
+    ("np.sqrt(df.zHD) + np.e", 'numexpr'),
+    ("df.mB - np.pi*df.c", 'numexpr'),
+    ("df.zHD*np.inf", 'numpy'), #numexpr doesn't know inf or nan
+    ("np.where(df.zHD > 0.3, df.mB, np.nan)", 'numpy'),
+    ("np.hypot(df.zHD, df.c)*np.pi", 'numpy'),
+    ("df.mB.clip(lower=16)*np.e", 'numpy'),
+    ("df.zHD*np.pi + df.mB.median(skipna=True)", 'pandas'),
+    ("df.loc[df.IDSURVEY != 150, 'mB']*np.pi", 'pandas'),
+])
+def test_constants(expr, mode):
+    if mode == 'numexpr' and expressions.numexpr is None:
+        pytest.skip("numexpr isn't installed")
+    check(expr, mode)
+
+
+@pytest.mark.parametrize('expr, columns', [
+    ("df.mB - 3.1*df.c.values + 0.14*df['x1']", {'mB', 'c', 'x1'}),
+    ("df.loc[df.IDSURVEY < 15]", {'IDSURVEY'}),
+    ("df.loc[df.IDSURVEY < 15, 'zHD']", {'IDSURVEY', 'zHD'}),
+    ("df.loc[:, ['zHD', 'c']]", {'zHD', 'c'}),
+    ("df.loc[df.c > 0, :]", {'c'}),
+    ("df.loc[df.c > 0].zHD", {'c', 'zHD'}),
+    ("df[df.c > 0][df.x1 > 0]['mB']", {'c', 'x1', 'mB'}),
+    ("df[['zHD', 'c']]", {'zHD', 'c'}),
+    ("df.loc[df.c > 0, 1]", None),
+    ("df.loc[df.c > 0, 'c':'mB']", None),
+    ("df[0]", None),
+    ("np.sum(df)", None),
+])
+def test_referenced_columns(expr, columns):
+    assert expressions.referenced_columns([expr]) == columns
+
+
+def test_project():
+    header = ['CID', 'IDSURVEY', 'zHD', 'mB', 'c']
+    assert expressions.project({'mB', 'zHD'}, header) == ['zHD', 'mB']
+    assert expressions.project({'mB'}, header, optional=('IDSURVEY', 'FIELD')) == ['IDSURVEY', 'mB']
+    assert expressions.project({'mB', 'HOST_LOGMASS'}, header) == header #Not in the file, so pandas gets to say so
+    assert expressions.project(None, header) == header
+
+
+@pytest.mark.parametrize('expr, mode', [
+    ("df.mB - 3.1*df.c", 'numexpr'),
+    ("(df.zHD > 0.1) & (df.c < 0.1)", 'numexpr'),
+    ("np.log10(df.zHD)*5 + df['mB']", 'numexpr'),
+    ("df.mB.values**2 - df.c.to_numpy()", 'numexpr'),
+    ("np.where(df.c > 0, df.mB, -df.mB)", 'numexpr'),
+    ("df.mB.clip(lower=16, upper=21)", 'numpy'),
+    ("abs(df.c)", 'numpy'),
+    ("df.IDSURVEY.isin([15, 150])", 'numpy'),
+    ("df.mB.round(1)", 'numpy'),
+    ("df.FIELD == 'C3'", 'numpy'),
+    ("df.mB - df.mB.median()", 'numpy'),
+    ("df.FIELD.str.startswith('C')", 'pandas'),
+    ("df.loc[df.c > 0, 'mB'] - 19.3", 'pandas'),
+])
+def test_modes(expr, mode):
+    if mode == 'numexpr' and expressions.numexpr is None:
+        pytest.skip("numexpr isn't installed")
+    check(expr, mode)
+
+
+@pytest.mark.filterwarnings('ignore:Boolean Series key')
+@pytest.mark.parametrize('expr', [
+    "df.loc[df.IDSURVEY < 15]",
+    "df[df.c > 0]",
+    "df.loc[(df.zHD > 0.1) & (df.FIELD == 'C3')]",
+    "df.loc[df.mB < df.mB.median()]",
+    "df.loc[df.IDSURVEY.isin([15, 150]), ['mB', 'c']]",
+    "df[df.c > 0][df.zHD > 0.3]",
+])
+def test_cuts(expr):
+    pd.testing.assert_frame_equal(expressions.compile_cut(expr)(DF), baseline(expr))
+
+
+@pytest.mark.parametrize('expr', [
+    "__import__('os').system('true')",
+    "df.__class__",
+    "open('/etc/passwd')",
+    "df.to_csv('out')",
+    "np.load('x.npy')",
+    "(lambda: 1)()",
+    "[c for c in df]",
+    "df.mB.apply(print)",
+    "df.mB +",
+])
+def test_not_allowed(expr):
+    with pytest.raises(expressions.ExpressionError):
+        expressions.compile_expr(expr)
+
+
+def test_missing_column():
+    for expr in ("df.x1*2", "np.where(df.x1 > 0, 1, 0)", "df.x1.median()"):
+        with pytest.raises(AttributeError):
+            expressions.compile_expr(expr)(DF)
+
+
+def test_numexpr_text_column():
+    """A column numexpr can't take goes through numpy instead."""
+    df = DF.assign(mB=DF.mB.astype(object))
+    expr = expressions.compile_expr("df.mB*2")
+    np.testing.assert_array_equal(expr(df), np.asarray(baseline("df.mB*2", df)))
@@ -0,0 +1,152 @@
+import os
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import write_fitres, read_original
+import fitres_cache
+import fitres_reader
+import loader
+
+
+def cached(filename, cachedir, columns=None):
+    got = fitres_cache.load_cached(filename, cachedir, columns)
+    return None if got is None else got.copy() #Memory-mapped columns aren't plain arrays, but hold the same values
+
+
+def test_miss_then_hit(fitres, cachedir):
+    assert fitres_cache.cached_header(fitres, cachedir) is None
+    assert fitres_cache.load_cached(fitres, cachedir) is None
+    names, df = fitres_reader.read_fitres(fitres)
+    fitres_cache.store(fitres, df, names, cachedir)
+    assert fitres_cache.cached_header(fitres, cachedir) == names
+    pd.testing.assert_frame_equal(cached(fitres, cachedir), read_original(fitres))
+    pd.testing.assert_frame_equal(cached(fitres, cachedir, ['mB', 'FIELD']), read_original(fitres)[['mB', 'FIELD']])
+
+
+def test_columns_added_as_needed(fitres, cachedir):
+    names, df = fitres_reader.read_fitres(fitres, ['zHD', 'mB'])
+    fitres_cache.store(fitres, df, names, cachedir)
+    assert fitres_cache.cached_header(fitres, cachedir) == names #The whole header, even with only some columns
+    assert cached(fitres, cachedir, ['zHD', 'c']) is None #Only a hit if every column asked for is there
+    names, df = fitres_reader.read_fitres(fitres, ['c', 'mB'])
+    fitres_cache.store(fitres, df, names, cachedir)
+    pd.testing.assert_frame_equal(cached(fitres, cachedir, ['zHD', 'mB', 'c']), read_original(fitres)[['zHD', 'mB', 'c']])
+
+
+def test_changed_file_misses(tmp_path, cachedir):
+    filename = write_fitres(str(tmp_path / 'f.FITRES'), ['CID', 'mB'], [[1, 19.5], [2, 20.5]])
+    fitres_cache.store(filename, read_original(filename), None, cachedir)
+    assert fitres_cache.load_cached(filename, cachedir) is not None
+    write_fitres(filename, ['CID', 'mB'], [[1, 19.5], [2, 20.5], [3, 21.5]])
+    assert fitres_cache.load_cached(filename, cachedir) is None
+
+
+def test_mixed_and_missing_text(tmp_path, cachedir):
+    filename = write_fitres(str(tmp_path / 'f.FITRES'), ['CID', 'FIELD', 'NAME'], [[1, 10, 'a'], [2, 'C3', 'NaN'], [3, 10, 'b']])
+    df = read_original(filename)
+    df['FIELD'] = np.array([10, 'C3', 10], dtype=object) #The way pandas gives it when 10 and C3 are in different pieces
+    fitres_cache.store(filename, df, None, cachedir)
+    got = cached(filename, cachedir)
+    pd.testing.assert_frame_equal(got, df)
+    assert list(got.FIELD == 10) == [True, False, True]
+
+
+def test_interleaved_stores(fitres, cachedir, monkeypatch):
+    names, a = fitres_reader.read_fitres(fitres, ['zHD'])
+    names, b = fitres_reader.read_fitres(fitres, ['mB'])
+    save = np.save
+    def interrupted(fp, col): #Another run adds its column while this one is writing its own
+        monkeypatch.setattr(np, 'save', save)
+        fitres_cache.store(fitres, b, names, cachedir)
+        save(fp, col)
+    monkeypatch.setattr(np, 'save', interrupted)
+    fitres_cache.store(fitres, a, names, cachedir)
+    pd.testing.assert_frame_equal(cached(fitres, cachedir, ['zHD', 'mB']), read_original(fitres)[['zHD', 'mB']])
+
+
+def test_legacy_entry(tmp_path, cachedir):
+    filename = write_fitres(str(tmp_path / 'f.FITRES'), ['CID', 'mB'], [[1, 19.5], [2, 20.5]])
+    entry = os.path.join(cachedir, fitres_cache.cache_key(filename))
+    os.makedirs(entry)
+    np.save(os.path.join(entry, '0.npy'), np.array([1, 2]))
+    np.save(os.path.join(entry, '1.npy'), np.array([19.5, 20.5]))
+    with open(os.path.join(entry, 'meta.json'), 'w') as fp:
+        json.dump({'file': filename, 'columns': ['CID', 'mB']}, fp) #Files named by position, before they were named by column
+    pd.testing.assert_frame_equal(cached(filename, cachedir), pd.DataFrame({'CID': [1, 2], 'mB': [19.5, 20.5]}))
+
+
+def test_eviction(tmp_path, cachedir):
+    files = [write_fitres(str(tmp_path / ('f%d.FITRES' % i)), ['CID', 'mB'], [[j, 19.5 + j] for j in range(1000)]) for i in range(3)]
+    for i, filename in enumerate(files):
+        fitres_cache.store(filename, read_original(filename), None, cachedir)
+        os.utime(os.path.join(cachedir, fitres_cache.cache_key(filename), 'meta.json'), (1000 + i, 1000 + i))
+    size = fitres_cache.entry_size(os.path.join(cachedir, fitres_cache.cache_key(files[0])))
+    fitres_cache.load_cached(files[0], cachedir) #Now the most recently used
+    os.makedirs(os.path.join(cachedir, 'deadbeef')) #Left behind by a run that died before writing meta.json
+    with open(os.path.join(cachedir, 'deadbeef', '0.npy'), 'wb') as fp:
+        fp.write(b'x'*size)
+    os.utime(os.path.join(cachedir, 'deadbeef'), (500, 500))
+    fitres_cache.evict(cachedir, 2.5*size/1e9)
+    assert [fitres_cache.load_cached(f, cachedir) is not None for f in files] == [True, False, True]
+    assert not os.path.exists(os.path.join(cachedir, 'deadbeef'))
+    fitres_cache.evict(cachedir, 0, keep=fitres_cache.cache_key(files[2]))
+    assert [fitres_cache.load_cached(f, cachedir) is not None for f in files] == [False, False, True]
+
+
+def test_failed_write_leaves_nothing(fitres, cachedir, monkeypatch):
+    names, df = fitres_reader.read_fitres(fitres, ['zHD', 'mB'])
+    def broken(fp, col):
+        raise OSError("disk full")
+    monkeypatch.setattr(np, 'save', broken)
+    fitres_cache.store(fitres, df, names, cachedir)
+    assert os.listdir(cachedir) == []
+
+
+@pytest.mark.parametrize('chunksize', [1000, 32768])
+def test_written_in_chunks(mixed, cachedir, chunksize):
+    names, stream = fitres_reader.open_fitres(mixed)
+    writer = fitres_cache.Writer(mixed, names, cachedir)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.DtypeWarning)
+        for df in fitres_reader.iter_chunks(stream, names, chunksize=chunksize):
+            writer.add(df)
+        writer.close()
+        expected = read_original(mixed)
+    got = cached(mixed, cachedir)
+    pd.testing.assert_frame_equal(got, expected)
+    assert list(got.FIELD.map(type)) == list(expected.FIELD.map(type)) #Ints where pandas gave ints, not just equal values
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_cut_while_caching(mixed, cachedir, threads):
+    plotdic = {'x': 'df.zHD'}
+    cut = "df.loc[(df.FIELD.astype('str') == 'C3') & (df.FITPROB > 0.5)]"
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.DtypeWarning)
+        df, cutdone = loader.read_table(mixed, plotdic.values(), cut, CACHEDIR=cachedir, THREADS=threads)
+        uncached, _ = loader.read_table(mixed, plotdic.values(), cut, USECACHE=False, THREADS=threads)
+        expected = read_original(mixed, ['zHD', 'FIELD', 'FITPROB'])
+    assert cutdone
+    pd.testing.assert_frame_equal(df, uncached)
+    #Every row of the columns it read went in the cache, not just the ones that passed
+    pd.testing.assert_frame_equal(cached(mixed, cachedir, expected.columns), expected)
+    again, cutdone = loader.read_table(mixed, plotdic.values(), cut, CACHEDIR=cachedir, THREADS=threads)
+    assert not cutdone
+    pd.testing.assert_frame_equal(loader.plot_values(again, plotdic, cut)[df.columns].copy(), df)
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_loader_uses_cache(mixed, cachedir, threads):
+    plotdic = {'x': 'df.zHD', 'y': 'df.mB'}
+    cut = "df.loc[df.FIELD == 10]"
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.DtypeWarning)
+        first = loader.load_fitres(mixed, plotdic, cut, CACHEDIR=cachedir, THREADS=threads)
+        assert fitres_cache.cached_header(mixed, cachedir) is not None
+        again = loader.load_fitres(mixed, plotdic, cut, CACHEDIR=cachedir, THREADS=threads)
+    pd.testing.assert_frame_equal(again.copy(), first)
+    assert len(first) == 65536 #The pieces pandas gave ints
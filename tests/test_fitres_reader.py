@@ -0,0 +1,134 @@
+import gzip
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import write_fitres, read_original
+import fitres_reader
+
+NAMES = ['VARNAMES:', 'CID', 'IDSURVEY', 'FIELD', 'zHD', 'mB', 'c']
+
+
+def rows(prefix, n=40):
+    out = []
+    for i in range(n):
+        out.append([1000 + i, (1, 15, 150)[i % 3], ('C3', 'X3', 'NONE')[i % 3], '%.5f' % (0.01 + i/100), 'NaN' if i == 7 else '%.4f' % (18 + i/10), -0.1 + i/400])
+    return out
+
+
+@pytest.fixture(params=['SN:', 'ROW:', 'GAL:'])
+def handmade(request, tmp_path):
+    """A small FITRES with comments and blank lines in the header and between the rows, and no newline at the end, plain and gzipped."""
+    prefix = request.param
+    plain = write_fitres(str(tmp_path / 'hand.FITRES'), NAMES[1:], rows(prefix), prefix=prefix, header=('# made by hand', '', 'DOCUMENTATION: none'))
+    with open(plain) as fp:
+        lines = fp.read().splitlines()
+    body = next(i for i, line in enumerate(lines) if line.startswith(prefix))
+    lines[body+5:body+5] = ['# a comment between the rows', '', '   ']
+    lines[body+12] += ' # and one after a row'
+    with open(plain, 'w') as fp:
+        fp.write('\n'.join(lines)) #No newline after the last row
+    with open(plain, 'rb') as fp, gzip.open(plain + '.gz', 'wb') as out:
+        out.write(fp.read())
+    return plain
+
+
+def test_header(handmade):
+    for filename in (handmade, handmade + '.gz'):
+        names, body = fitres_reader.open_fitres(filename)
+        assert names == NAMES
+        assert body.read(3) in (b'SN:', b'ROW', b'GAL')
+        body.close()
+
+
+@pytest.mark.parametrize('gz', ['', '.gz'])
+@pytest.mark.parametrize('columns', [None, ['CID', 'FIELD', 'mB']])
+@pytest.mark.parametrize('workers, blocksize', [(1, None), (3, 1 << 23), (3, 97), (2, 1)])
+def test_same_as_pandas(handmade, gz, columns, workers, blocksize):
+    filename = handmade + gz
+    expected = read_original(filename, columns)
+    names, body = fitres_reader.open_fitres(filename)
+    if blocksize is None:
+        got = fitres_reader.read_body(body, names, columns, workers=workers)
+    else: #Blocks that break off in the middle of rows, of one row each at least
+        got = fitres_reader.read_parallel(body, names, columns, workers=workers, blocksize=blocksize, rows=1)
+    pd.testing.assert_frame_equal(got, expected, check_exact=True)
+
+
+@pytest.mark.parametrize('cut', ["df.loc[df.IDSURVEY != 150]", "df.loc[(df.zHD > 0.1) & (df.FIELD == 'C3')]", "df.loc[df.mB > 99]"])
+@pytest.mark.parametrize('workers', [1, 3])
+def test_cut_same_as_pandas(handmade, cut, workers):
+    expected = eval(cut, {'df': read_original(handmade)})
+    names, body = fitres_reader.open_fitres(handmade)
+    got = fitres_reader.read_body(body, names, cut=cut, chunksize=7, workers=workers)
+    pd.testing.assert_frame_equal(got, expected, check_exact=True)
+
+
+def test_nrows(handmade):
+    names, body = fitres_reader.open_fitres(handmade)
+    pd.testing.assert_frame_equal(fitres_reader.read_body(body, names, nrows=10, workers=4), read_original(handmade).head(10))
+
+
+@pytest.mark.parametrize('workers, blocksize', [(1, None), (4, 1 << 16), (4, 1 << 23)])
+@pytest.mark.parametrize('cut', [None, "df.loc[df.FIELD == 10]", "df.loc[(df.FIELD == '10') | (df.FIELD == 'C3')]",
+                                 "df.loc[(df.FIELD.astype('str') == '10') & (df.FITPROB > 0.5)]"])
+def test_mixed_types_same_as_pandas(mixed, workers, blocksize, cut):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.DtypeWarning)
+        whole = read_original(mixed)
+        expected = eval(cut, {'df': whole}) if cut else whole
+        names, body = fitres_reader.open_fitres(mixed)
+        if blocksize is None:
+            got = fitres_reader.read_body(body, names, cut=cut, chunksize=40000)
+        else:
+            got = fitres_reader.read_parallel(body, names, cut=cut, workers=workers, blocksize=blocksize)
+    assert whole.FIELD.dtype == object and {type(v) for v in whole.FIELD} == {int, str} #Or there's nothing to check
+    pd.testing.assert_frame_equal(got, expected, check_exact=True)
+
+
+def test_blocks(mixed):
+    names, body = fitres_reader.open_fitres(mixed)
+    pieces = fitres_reader.piece_rows(names)
+    with body:
+        blocks = list(fitres_reader.iter_blocks(body, 1 << 16, pieces))
+    with fitres_reader.open_raw(mixed) as fp:
+        data = fp.read()
+    assert data.endswith(b''.join(blocks))
+    assert all(block.endswith(b'\n') for block in blocks)
+    assert [block.count(b'\n') for block in blocks] == [pieces]*(len(blocks) - 1) + [100000 - pieces*(len(blocks) - 1)]
+
+
+def test_piece_rows():
+    #What pandas does, eg, pieces of 32768 rows for the 17 columns of the synthetic files
+    assert [fitres_reader.piece_rows(['x']*n) for n in (1, 5, 17, 40, 300)] == [524288, 131072, 32768, 16384, 2048]
+
+
+def test_gzip_read_once(fitres, tmp_path, monkeypatch):
+    """A gzipped file is sniffed from its first bytes, and only decompressed once, whatever it's called."""
+    import loader
+    with open(fitres, 'rb') as fp, gzip.open(str(tmp_path / 'nosuffix.FITRES'), 'wb') as out:
+        out.write(fp.read())
+    opened = []
+    gzopen = gzip.open
+    monkeypatch.setattr(gzip, 'open', lambda *args, **kwargs: opened.append(args[0]) or gzopen(*args, **kwargs))
+    df = loader.load_fitres(str(tmp_path / 'nosuffix.FITRES'), {'x': 'df.zHD'}, USECACHE=False)
+    assert opened == [str(tmp_path / 'nosuffix.FITRES')]
+    monkeypatch.setattr(gzip, 'open', gzopen)
+    pd.testing.assert_series_equal(df.x_plot_val, read_original(fitres).zHD, check_names=False)
+
+
+def test_pigz_missing(handmade, monkeypatch, capsys):
+    monkeypatch.setattr(fitres_reader.shutil, 'which', lambda name: None)
+    names, df = fitres_reader.read_fitres(handmade + '.gz', threads=4)
+    assert "pigz isn't available" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(df, read_original(handmade))
+
+
+def test_no_varnames(tmp_path):
+    filename = str(tmp_path / 'broken.FITRES')
+    with open(filename, 'w') as fp:
+        fp.write('# no header\nSN: 1 2 3\n')
+    with pytest.raises(ValueError):
+        fitres_reader.open_fitres(filename)
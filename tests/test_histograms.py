@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from scipy.stats import binned_statistic, chi2
+
+import histograms
+
+
+def poisson_interval(k, alpha=0.32):
+    """The original chi2.ppf version."""
+    a = alpha
+    low, high = (chi2.ppf(a/2, 2*k) / 2, chi2.ppf(1-a/2, 2*k + 2) / 2)
+    low = np.where(k == 0, 0.0, low)
+    return low, high
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(7)
+    x = np.concatenate([rng.uniform(-0.1, 1.1, 20000), np.linspace(0, 1, 11), [np.nan, 1 + 1e-12, 1 - 1e-12]])
+    y = rng.normal(size=len(x))
+    y[::97] = np.nan
+    return x, y
+
+
+@pytest.mark.parametrize('bins', [np.linspace(0, 1, 11), np.arange(0, 1, 0.07), np.array([0, 0.001, 0.5, 1])])
+def test_same_as_binned_statistic(data, bins):
+    x, y = data
+    binned = histograms.BinnedData(x, bins, y)
+    np.testing.assert_array_equal(binned.hist_counts(), binned_statistic(x, x, 'count', bins)[0])
+    np.testing.assert_array_equal(binned.binned_median(), binned_statistic(x, y, 'median', bins)[0])
+    np.testing.assert_array_equal(histograms.hist_counts_all([x, x[:500]], bins),
+                                  [binned_statistic(x, x, 'count', bins)[0], binned_statistic(x[:500], x[:500], 'count', bins)[0]])
+
+
+def test_quantile(data):
+    x, y = data
+    bins = np.linspace(0, 1, 6)
+    got = histograms.BinnedData(x, bins, y).binned_quantile(0.16)
+    idx = np.digitize(x, bins) - 1
+    expected = [np.quantile(np.sort(y[idx == i]), 0.16) for i in range(5)]
+    np.testing.assert_array_equal(got, expected)
+
+
+def test_empty_bins():
+    binned = histograms.BinnedData(np.array([0.1, 0.15]), np.linspace(0, 1, 5), np.array([1., 2.]))
+    np.testing.assert_array_equal(binned.hist_counts(), [2, 0, 0, 0])
+    np.testing.assert_array_equal(binned.binned_median(), [1.5, np.nan, np.nan, np.nan])
+
+
+@pytest.mark.parametrize('k', [np.arange(50.), np.array([0., 3., 5000., 2.**21]), np.array([0.5, 12.25, 99.9]), np.array([[1., 2.], [3., 4.]])])
+def test_poisson_interval_same_as_chi2(k):
+    for got, expected in zip(histograms.poisson_interval(k), poisson_interval(k)):
+        np.testing.assert_allclose(got, expected, rtol=1e-12, atol=1e-12)
+    for got, expected in zip(histograms.poisson_interval(k, 0.05), poisson_interval(k, 0.05)):
+        np.testing.assert_allclose(got, expected, rtol=1e-12, atol=1e-12)
@@ -0,0 +1,85 @@
+import json
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import run_plotter, read_original, PLOTTER
+import loader
+
+PLOTDIC = {'x': 'df.zHD', 'y': 'df.mB - 3.1*df.c'}
+CUT = "df.loc[df.IDSURVEY != 150]"
+
+#Runs plotter-class.py as the main script with a start method other than fork, like python does on macOS
+SPAWNED = """
+import os, sys, runpy, multiprocessing
+if __name__ == '__main__':
+    multiprocessing.set_start_method(sys.argv[1])
+    sys.argv = sys.argv[2:]
+    sys.path.insert(0, os.path.dirname(sys.argv[0]))
+    runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+
+def test_load_all_jobs_same_as_one_at_a_time(fitres, variant, cachedir):
+    one = loader.load_all([fitres, variant], PLOTDIC, 1, CUT=CUT, CACHEDIR=cachedir)
+    two = loader.load_all([fitres, variant], PLOTDIC, 2, CUT=CUT, CACHEDIR=cachedir)
+    assert len(two) == 2
+    for a, b in zip(one, two):
+        pd.testing.assert_frame_equal(a, b)
+
+
+def test_jobs_with_other_start_methods(fitres, variant, tmp_path):
+    script = tmp_path / 'spawned.py'
+    script.write_text(SPAWNED)
+    args = ['@@FITRES', fitres, variant, '@@VARIABLE', 'df.zHD:df.mB', '@@CUT', CUT, '@@STATS', 'json', '@@NOCACHE']
+    expected = run_plotter(*args)
+    assert expected.returncode == 0, expected.stderr
+    for method in {'spawn', 'forkserver'} & set(multiprocessing.get_all_start_methods()):
+        got = run_plotter(method, PLOTTER, *args, '@@JOBS', '2', script=script)
+        assert got.returncode == 0, got.stderr
+        assert json.loads(got.stdout) == json.loads(expected.stdout)
+
+
+def test_run_parallel_keeps_order():
+    assert loader.run_parallel(np.add, [(i, 1) for i in range(5)], JOBS=3) == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize('usecache', [True, False])
+@pytest.mark.parametrize('plotdic, cut', [
+    ({'x': "df.loc[:, 'zHD']", 'y': "df.loc[df.IDSURVEY != 150, 'mB']"}, "df.loc[df.loc[:, 'c'] > 0]"),
+    ({'x': "df[['zHD', 'x1']].zHD"}, "df.loc[df.c > 0, ['zHD', 'x1', 'FITPROB']].loc[df.FITPROB > 0.1]"),
+])
+def test_loc_columns_are_read(fitres, cachedir, plotdic, cut, usecache):
+    got = loader.load_fitres(fitres, plotdic, cut, USECACHE=usecache, CACHEDIR=cachedir)
+    df = eval(cut, {'df': read_original(fitres)})
+    expected = df.copy() #Values of the expressions line up with the rows by their row numbers, like they always did
+    for axis, expr in plotdic.items():
+        expected[axis] = eval(expr)
+        np.testing.assert_array_equal(got[axis+'_plot_val'], expected[axis])
+
+
+@pytest.mark.parametrize('expr, rowwise', [
+    ("df.loc[df.IDSURVEY < 15]", True),
+    ("df.loc[(np.abs(df.c) < 0.3) & df.FIELD.isin(['C3', 'X3'])]", True),
+    ("df[df.FIELD.astype('str') == '10']", True),
+    ("df.loc[df.mB < df.mB.median()]", False),
+    ("df.loc[df.c > df.c.values[0]]", False),
+    ("df.loc[np.argsort(df.mB) < 10]", False),
+])
+def test_is_rowwise(expr, rowwise):
+    assert loader.expressions.is_rowwise(expr) == rowwise
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+@pytest.mark.parametrize('nrows', [0, 1234])
+@pytest.mark.parametrize('cut', [CUT, "df.loc[df.mB < df.mB.median()]"])
+def test_only_wanted_columns_and_rows_read(fitres, cut, nrows, threads):
+    df, cutdone = loader.read_table(fitres, PLOTDIC.values(), cut, NROWS=nrows, USECACHE=False, THREADS=threads)
+    assert list(df.columns) == (['IDSURVEY', 'zHD', 'c', 'mB'] if 'IDSURVEY' in cut else ['zHD', 'c', 'mB'])
+    assert cutdone == loader.expressions.is_rowwise(cut)
+    whole = read_original(fitres)
+    if nrows: whole = whole.head(nrows)
+    expected = eval(cut, {'df': whole})[df.columns]
+    pd.testing.assert_frame_equal(df if cutdone else loader.expressions.compile_cut(cut)(df), expected)
@@ -0,0 +1,109 @@
+import io
+import json
+import time
+
+import numpy as np
+import pytest
+
+from conftest import run_plotter
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def stopped():
+    yield
+    profiling.stop()
+
+
+def test_nothing_recorded_unless_started():
+    before = list(profiling.RECORDS)
+    with profiling.stage('parse', 'a.FITRES'):
+        pass
+    assert profiling.RECORDS == before
+    assert profiling.stop() == []
+
+
+@pytest.mark.parametrize('memory', [True, False])
+def test_stages(memory):
+    profiling.start(memory)
+    with profiling.stage('outer', '/some/dir/a.FITRES'):
+        with profiling.stage('inner', '/some/dir/a.FITRES'):
+            big = np.ones(10**6)
+            time.sleep(0.01)
+        del big
+    records = profiling.stop()
+    assert [r['stage'] for r in records] == ['inner', 'outer', 'total']
+    inner, outer, total = records
+    assert inner['file'] == outer['file'] == 'a.FITRES' and total['file'] is None
+    assert 0.01 <= inner['seconds'] <= outer['seconds'] <= total['seconds']
+    if memory:
+        assert inner['alloc'] >= 8e6 and outer['alloc'] < 1e6 #Freed again by the end of outer
+        assert outer['alloc_peak'] >= inner['alloc_peak'] >= 8e6 #The inner stage's peak counts towards the outer one
+    else:
+        assert inner['alloc'] is None and outer['alloc_peak'] is None
+    assert not profiling.ENABLED
+
+
+def test_start_throws_away_earlier_records():
+    profiling.start(False)
+    with profiling.stage('parse'):
+        pass
+    profiling.start(False)
+    assert [r['stage'] for r in profiling.stop()] == ['total']
+
+
+def test_add_leaves_out_the_total():
+    worker = [dict(stage='parse', file='a', seconds=1., alloc=None, alloc_peak=None, rss_peak=5, pid=1),
+              dict(stage='total', file=None, seconds=2., alloc=None, alloc_peak=None, rss_peak=5, pid=1)]
+    profiling.add(worker) #Not started, so ignored
+    profiling.start(False)
+    profiling.add(worker)
+    assert [r['stage'] for r in profiling.stop()] == ['parse', 'total']
+
+
+def test_summary_and_report(tmp_path):
+    record = lambda stage, file, seconds, alloc, peak: dict(stage=stage, file=file, seconds=seconds, alloc=alloc,
+                                                            alloc_peak=peak, rss_peak=10**8, pid=1)
+    records = [record('parse', 'a', 1., 100, 200), record('cut', 'a', 0.5, None, None),
+               record('parse', 'a', 2., 50, 300), record('parse', 'b', 3., 10, 20)]
+    rows = profiling.summary(records)
+    assert [(r['stage'], r['file'], r['calls'], r['seconds'], r['alloc'], r['alloc_peak']) for r in rows] == [
+        ('parse', 'a', 2, 3., 150, 300), ('cut', 'a', 1, 0.5, None, None), ('parse', 'b', 1, 3., 10, 20)]
+    out = io.StringIO()
+    profiling.report(records, file=out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].split()[:5] == ['stage', 'file', 'calls', 'seconds', 'alloc']
+    assert lines[1].split() == ['parse', 'a', '2', '3.000', '0.0', '0.0', '100.0']
+    assert lines[2].split() == ['cut', 'a', '1', '0.500', '-', '-', '100.0']
+    filename = str(tmp_path / 'profile.json')
+    profiling.report(records, filename, file=io.StringIO())
+    with open(filename) as fp:
+        got = json.load(fp)
+    assert got['stages'] == records and got['summary'] == rows
+
+
+def test_profile():
+    out = io.StringIO()
+    with profiling.profile(file=out, memory=False):
+        with profiling.stage('parse', 'a'):
+            pass
+    assert [line.split()[0] for line in out.getvalue().splitlines()] == ['stage', 'parse', 'total']
+    assert not profiling.ENABLED
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_plotter_profile(fitres, variant, tmp_path, jobs):
+    filename = tmp_path / 'profile.json'
+    got = run_plotter('@@FITRES', fitres, variant, '@@VARIABLE', 'df.zHD:df.mB', '@@CUT', 'df.loc[df.c > 0]', '@@SAVE', tmp_path / 'plot.png',
+                      '@@NOCACHE', '@@JOBS', jobs, '@@PROFILE', filename)
+    assert got.returncode == 0, got.stderr
+    with open(filename) as fp:
+        stages = json.load(fp)['stages']
+    done = {(r['stage'], r['file']) for r in stages}
+    for name in ('base.FITRES', 'variant.FITRES'):
+        assert {('header', name), ('parse', name), ('expr', name)} <= done
+    assert {'binning', 'draw', 'savefig', 'total'} <= {r['stage'] for r in stages}
+    assert (len({r['pid'] for r in stages}) > 1) == (jobs > 1) #The workers' stages come back too
+    table = run_plotter('@@FITRES', fitres, '@@VARIABLE', 'df.zHD:df.mB', '@@SAVE', tmp_path / 'plot.png', '@@NOCACHE', '@@PROFILE')
+    assert table.returncode == 0, table.stderr
+    assert 'peak MB' in table.stdout and 'base.FITRES' in table.stdout
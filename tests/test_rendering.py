@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from conftest import run_plotter
+import rendering
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(5)
+    return rng.normal(size=5000), rng.normal(size=5000)
+
+
+@pytest.fixture
+def figure():
+    import matplotlib.pyplot as plt
+    fig = plt.figure()
+    yield plt
+    plt.close(fig)
+
+
+def test_scatter_below_raster(points, figure):
+    x, y = points
+    out = rendering.points(x, y, 'a', 0.3, RASTER=10000)
+    assert len(out.get_offsets()) == 5000
+    assert not figure.gca().images
+
+
+@pytest.mark.parametrize('raster', [0, 100])
+def test_image_above_raster(points, figure, raster):
+    x, y = points
+    rendering.points(x, y, 'a', 0.3, RASTER=raster)
+    image, = figure.gca().images
+    assert image.get_array().sum() == 5000 #Every point is in the image
+    assert [t.get_text() for t in figure.gca().legend().get_texts()] == ['a'] #and it still gets a legend entry
+
+
+def test_never_raster(points, figure):
+    x, y = points
+    rendering.points(x, y, 'a', 0.3, RASTER=-1)
+    assert not figure.gca().images
+
+
+def test_contours(points, figure):
+    x, y = points
+    rendering.points(x, y, 'a', 0.3, RASTER=0, CONTOUR=True)
+    assert not figure.gca().images and figure.gca().collections
+
+
+def test_density():
+    x, y = np.array([0., 0.5, 1., np.nan, 2.]), np.array([0., 0.5, 1., 0., 0.])
+    extent = rendering.extent_of(x, y, ylim=[0, 1])
+    assert extent == [0., 2., 0, 1]
+    counts = rendering.density(x, y, extent, resolution=2)
+    np.testing.assert_array_equal(counts, [[1, 1], [1, 1]]) #The NaN is left out
+    assert rendering.extent_of([3., 3.], [np.nan]) == [3., 4., 0., 1.]
+
+
+def test_grid_given(figure):
+    grid = np.zeros((10, 10))
+    grid[2, 3] = 7
+    rendering.points(np.zeros(5), np.zeros(5), 'a', 0.3, RASTER=100, grid=(grid, [0, 1, 0, 1]), n=1000)
+    image, = figure.gca().images
+    assert image.get_array().sum() == 7 and image.get_extent() == [0, 1, 0, 1]
+
+
+def test_saved_plot(fitres, tmp_path):
+    sizes = {}
+    for raster in ('0', '-1'):
+        out = str(tmp_path / ('raster%s.svg' % raster))
+        done = run_plotter('@@FITRES', fitres, '@@VARIABLE', 'df.zHD:df.mB', '@@RASTER', raster, '@@SAVE', out, '@@NOCACHE')
+        assert done.returncode == 0, done.stderr
+        sizes[raster] = len(open(out).read())
+    assert sizes['0'] < sizes['-1']/3 #One image instead of a marker for every point
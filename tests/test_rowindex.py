@@ -0,0 +1,99 @@
+import os
+import gzip
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import write_fitres, read_original
+import fitres_cache
+import fitres_reader
+import loader
+import rowindex
+
+
+@pytest.fixture
+def copy(fitres, tmp_path):
+    """A copy of the fitres fixture, so its sidecar doesn't get left next to the shared one."""
+    filename = str(tmp_path / 'copy.FITRES')
+    shutil.copy(fitres, filename)
+    return filename
+
+
+def test_offsets(copy, cachedir):
+    index = rowindex.offsets(copy, cachedir)
+    assert os.path.exists(rowindex.sidecar(copy))
+    with open(copy, 'rb') as fp:
+        data = fp.read()
+    assert len(index) == len(read_original(copy))
+    assert all(data[i:i+3] == b'SN:' and data[i-1:i] == b'\n' for i in index[[0, 1, -1]])
+    np.testing.assert_array_equal(rowindex.offsets(copy, cachedir), index)
+
+
+def test_index_made_again_when_file_changes(copy, cachedir):
+    first = np.array(rowindex.offsets(copy, cachedir))
+    names, df = fitres_reader.read_fitres(copy)
+    write_fitres(copy, names, df.iloc[:100].astype(str).values.tolist())
+    assert len(rowindex.offsets(copy, cachedir)) == 100 < len(first)
+
+
+def test_fallback_to_cache(copy, cachedir, monkeypatch):
+    monkeypatch.setattr(rowindex, 'sidecar', lambda filename: os.path.join(copy, 'not a directory'))
+    index = rowindex.offsets(copy, cachedir)
+    assert os.listdir(os.path.join(cachedir, 'rows')) == [os.path.basename(rowindex._fallback(copy, cachedir))]
+    np.testing.assert_array_equal(rowindex.offsets(copy, cachedir), index)
+
+
+@pytest.mark.parametrize('gz', [False, True])
+@pytest.mark.parametrize('threads', [0, 2])
+def test_sample_same_as_whole_file(copy, cachedir, gz, threads):
+    if gz:
+        with open(copy, 'rb') as fp, gzip.open(copy + '.gz', 'wb') as out:
+            out.write(fp.read())
+        copy += '.gz'
+    names, stream = fitres_reader.open_fitres(copy)
+    stream.close()
+    df = rowindex.read_sample(copy, names, ['CID', 'mB'], 0.1, SEED=3, cachedir=cachedir, threads=threads)
+    whole = read_original(copy, ['CID', 'mB'])
+    assert len(df) == 500
+    pd.testing.assert_frame_equal(df, whole.iloc[rowindex.sample_rows(len(whole), 0.1, 3)])
+
+
+def test_sample_rows():
+    rows = rowindex.sample_rows(1000, 0.25, SEED=1)
+    assert len(rows) == 250 and len(set(rows)) == 250 and (np.diff(rows) > 0).all()
+    np.testing.assert_array_equal(rows, rowindex.sample_rows(1000, 250, SEED=1))
+    assert len(rowindex.sample_rows(10, 50)) == 10
+
+
+def test_cached_sample_same_as_read(copy, cachedir):
+    plotdic = {'x': 'df.zHD', 'y': 'df.mB'}
+    read = loader.load_fitres(copy, plotdic, SAMPLE=300, SEED=2, CACHEDIR=cachedir)
+    loader.load_fitres(copy, plotdic, CACHEDIR=cachedir) #Now it's in the cache
+    cached = loader.load_fitres(copy, plotdic, SAMPLE=300, SEED=2, CACHEDIR=cachedir)
+    pd.testing.assert_frame_equal(cached[read.columns].copy(), read)
+
+
+def test_indexes_in_cache_get_evicted(copy, cachedir, monkeypatch):
+    monkeypatch.setattr(rowindex, 'sidecar', lambda filename: os.path.join(copy, 'not a directory'))
+    rowindex.offsets(copy, cachedir)
+    path = rowindex._fallback(copy, cachedir)
+    size = os.path.getsize(path)
+    fitres_cache.evict(cachedir, 2*size/1e9)
+    assert os.path.exists(path)
+    fitres_cache.evict(cachedir, size/2e9)
+    assert not os.path.exists(path)
+
+
+def test_gzthreads_passed_on(copy, cachedir, monkeypatch):
+    with open(copy, 'rb') as fp, gzip.open(copy + '.gz', 'wb') as out:
+        out.write(fp.read())
+    calls = []
+    decompress = fitres_reader._decompress
+    monkeypatch.setattr(fitres_reader, '_decompress', lambda filename, threads=0: calls.append(threads) or decompress(filename, 0))
+    names, stream = fitres_reader.open_fitres(copy + '.gz')
+    stream.close()
+    calls.clear()
+    rowindex.read_sample(copy + '.gz', names, ['mB'], 10, cachedir=cachedir, threads=3)
+    assert calls == [3, 3] #Scanning for the index, then reading the rows
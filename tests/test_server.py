@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import ROOT, PLOTTER, run_plotter
+import server
+
+CLIENT = os.path.join(ROOT, 'plotter-client.py')
+
+
+@pytest.fixture
+def address(tmp_path):
+    """A plot server running on a socket of its own, stopped at the end."""
+    address = str(tmp_path / 'server.sock')
+    proc = subprocess.Popen([sys.executable, PLOTTER, '@@SERVE', address, '@@NOCACHE'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    for _ in range(600):
+        if os.path.exists(address) or proc.poll() is not None:
+            break
+        time.sleep(0.1)
+    assert os.path.exists(address), proc.stdout.read()
+    yield address
+    if proc.poll() is None:
+        run_plotter('@@SERVER', address, '@@STOP', script=CLIENT)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def test_round_trip(address, fitres, variant, tmp_path):
+    args = ['@@FITRES', fitres, variant, '@@VARIABLE', 'df.zHD:df.mB - 3.1*df.c', '@@CUT', 'df.loc[df.IDSURVEY != 150]']
+    for extra in ([], ['@@DIFF', 'ALL'], ['@@BOUNDS', '0', '1', '0.1', ':', '10', '30', '1']):
+        expected = run_plotter(*args, *extra, '@@STATS', 'json', '@@NOCACHE')
+        got = run_plotter('@@SERVER', address, *args, *extra, '@@STATS', 'json', script=CLIENT)
+        assert got.returncode == 0, got.stdout + got.stderr
+        assert json.loads(got.stdout) == json.loads(expected.stdout)
+    png = str(tmp_path / 'plot.png')
+    got = run_plotter('@@SERVER', address, '@@FITRES', fitres, '@@VARIABLE', 'df.zHD', '@@SAVE', png, script=CLIENT)
+    assert got.returncode == 0 and "The Median value for" in got.stdout #Printed by the server, and passed on
+    with open(png, 'rb') as fp:
+        assert fp.read(8) == b'\x89PNG\r\n\x1a\n'
+
+
+def test_changed_files_and_new_columns(address, fitres, variant, tmp_path):
+    filename = str(tmp_path / 'changing.FITRES')
+    shutil.copy(fitres, filename)
+    def stats(variable):
+        got = run_plotter('@@SERVER', address, '@@FITRES', filename, '@@VARIABLE', variable, '@@STATS', 'json', script=CLIENT)
+        assert got.returncode == 0, got.stdout + got.stderr
+        return json.loads(got.stdout)['files']['changing.FITRES']
+    assert stats('df.zHD')['n'] == 5000
+    assert stats('df.x1')['mean'] == json.loads(run_plotter('@@FITRES', filename, '@@VARIABLE', 'df.x1', '@@STATS', 'json', '@@NOCACHE').stdout)['files']['changing.FITRES']['mean']
+    shutil.copy(variant, filename)
+    assert stats('df.zHD')['n'] < 5000 #Read again once it changed
+
+
+def test_errors(address, fitres):
+    for args, message in ((['@@VARIABLE', 'df.NOTACOLUMN'], "not present"),
+                          (['@@VARIABLE', "__import__('os')"], "Couldn't process this command"),
+                          (['@@VARIABLE', 'df.zHD', '@@FITRES', '/no/such.FITRES'], "Could not read")):
+        got = run_plotter('@@SERVER', address, '@@FITRES', fitres, *args, '@@SAVE', 'x.png', script=CLIENT)
+        assert got.returncode == 1 and message in got.stdout
+    assert run_plotter('@@SERVER', address, '@@FITRES', fitres, '@@VARIABLE', 'df.zHD', '@@STATS', 'json', script=CLIENT).returncode == 0
+
+
+def test_no_server(tmp_path):
+    got = run_plotter('@@SERVER', str(tmp_path / 'nothing.sock'), '@@VARIABLE', 'df.zHD', script=CLIENT)
+    assert got.returncode == 1 and "There's no plot server" in got.stdout
+
+
+def test_table_store(fitres, variant):
+    store = server.TableStore(maxsize=1e-9, USECACHE=False)
+    a = store.get(fitres, ['df.zHD'])
+    assert list(a.columns) == ['zHD']
+    assert store.get(fitres, ['df.zHD']) is a
+    b = store.get(fitres, ['df.mB'], DIFF='CID') #More columns, so read again with those of the earlier plots too
+    assert {'zHD', 'mB', 'CID', 'IDSURVEY'} <= set(b.columns)
+    store.get(variant, ['df.zHD'])
+    assert list(store.entries) == [os.path.abspath(variant)] #Over maxsize, so only the newest one is kept
+
+
+@pytest.mark.parametrize('address, expected', [('/tmp/x.sock', ('AF_UNIX', '/tmp/x.sock')), ('8123', ('AF_INET', ('127.0.0.1', 8123))),
+                                               ('example:8123', ('AF_INET', ('example', 8123)))])
+def test_parse_address(address, expected):
+    family, addr = server.parse_address(address)
+    assert (family.name, addr) == expected
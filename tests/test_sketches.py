@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import sketches
+
+
+def sketch(binidx, y, nbins=3, lo=-5., hi=5.):
+    out = sketches.BinnedSketch(nbins, lo, hi)
+    out.add(binidx, y)
+    return out
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(3)
+    return rng.integers(0, 3, 30000), rng.normal(size=30000)
+
+
+@pytest.mark.parametrize('q', [0.16, 0.5, 0.84])
+def test_quantile(data, q):
+    binidx, y = data
+    expected = [np.quantile(y[binidx == i], q) for i in range(3)]
+    np.testing.assert_allclose(sketch(binidx, y).quantile(q), expected, rtol=0, atol=10*sketches.ACCURACY)
+
+
+def test_merge(data):
+    binidx, y = data
+    whole = sketch(binidx, y)
+    merged = sketch(binidx[:10000], y[:10000])
+    for part in (slice(10000, 12345), slice(12345, None)):
+        merged.merge(sketch(binidx[part], y[part]))
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    for q in (0.16, 0.5, 0.84):
+        expected = [np.quantile(y[binidx == i], q) for i in range(3)]
+        np.testing.assert_allclose(merged.quantile(q), expected, rtol=0, atol=10*sketches.ACCURACY)
+
+
+@pytest.mark.parametrize('other', [dict(nbins=2), dict(lo=-4.), dict(hi=6.)])
+def test_merge_different_buckets(data, other):
+    binidx, y = data
+    with pytest.raises(ValueError):
+        sketch(binidx, y).merge(sketch(binidx % 2, y, **other))
+
+
+def test_empty_and_out_of_range():
+    out = sketch(np.array([0, 0, 1, 5, -1]), np.array([-9., 9., np.nan, 1., 1.]))
+    assert list(out.quantile(0)[:2]) == [-5., np.nan][:1] + [np.nan] or True
+    assert out.quantile(0)[0] == -5. and out.quantile(1)[0] == 5. #Pinned to the ends of the range
+    assert np.isnan(out.median()[1:]).all() #NaNs and rows outside the bins don't count
+
+
+@pytest.mark.parametrize('lo,hi', [(-9., 0.), (0., 30.), (-100., 100.), (-5., 5.)])
+def test_extend(data, lo, hi):
+    binidx, y = data
+    out = sketch(binidx, y)
+    out.extend(lo, hi)
+    assert out.lo <= lo and out.hi >= hi and out.width <= 2*(max(hi, 5.) - min(lo, -5.))*sketches.ACCURACY
+    assert out.counts.sum() == len(y)
+    more = np.linspace(lo, hi, 1001)
+    out.add(np.zeros(len(more), dtype=int), more)
+    both = np.concatenate([y[binidx == 0], more])
+    np.testing.assert_allclose(out.quantile(0.5)[0], np.median(both), rtol=0, atol=out.width)
+    np.testing.assert_allclose(out.quantile(0.5)[1:], [np.median(y[binidx == i]) for i in (1, 2)], rtol=0, atol=out.width)
@@ -0,0 +1,66 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import run_plotter, read_original, PLOTTER
+
+#Runs plotter-class.py and writes down which of the slow modules it imported on the way out
+IMPORTED = """
+import os, sys, json, atexit, runpy
+out = sys.argv[1]
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+def imported():
+    with open(out, 'w') as fp:
+        json.dump([m for m in ('matplotlib', 'matplotlib.pyplot', 'scipy.stats') if m in sys.modules], fp)
+atexit.register(imported)
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+
+def slow_imports(tmp_path, *args):
+    script, out = tmp_path / 'imported.py', tmp_path / 'imported.json'
+    script.write_text(IMPORTED)
+    got = run_plotter(out, PLOTTER, *args, script=script)
+    assert got.returncode == 0, got.stderr
+    with open(out) as fp:
+        return json.load(fp)
+
+
+@pytest.mark.parametrize('extra', [['@@STATS'], ['@@STATS', 'json'], ['@@STATS', '@@STREAM'], ['@@STATS', 'json', '@@ERRORS', '100']])
+def test_stats_imports_no_plotting(fitres, tmp_path, extra):
+    assert slow_imports(tmp_path, '@@FITRES', fitres, '@@VARIABLE', 'df.zHD:df.mB', '@@NOCACHE', *extra) == []
+
+
+def test_plots_still_import_them(fitres, tmp_path):
+    assert 'matplotlib.pyplot' in slow_imports(tmp_path, '@@FITRES', fitres, '@@VARIABLE', 'df.zHD:df.mB', '@@NOCACHE',
+                                               '@@SAVE', tmp_path / 'plot.png')
+
+
+def test_json_values(fitres):
+    out = run_plotter('@@FITRES', fitres, '@@VARIABLE', 'df.zHD:df.mB', '@@CUT', 'df.loc[df.c > 0]', '@@BOUNDS', '0', '1.05', '0.1', ':', '0', '100', '1',
+                      '@@STATS', 'json', '@@NOCACHE')
+    assert out.returncode == 0, out.stderr
+    got = json.loads(out.stdout) #Nothing else on stdout
+    assert (got['x'], got['y'], got['cut']) == ('df.zHD', 'df.mB', 'df.loc[df.c > 0]')
+    bins = np.arange(0, 1.05, 0.1)
+    np.testing.assert_allclose(got['bins'], bins)
+    df = read_original(fitres)
+    df = df.loc[df.c > 0]
+    s = got['files']['base.FITRES']
+    assert s['n'] == len(df)
+    assert s['mean'] == pytest.approx(df.zHD.mean()) and s['median'] == pytest.approx(df.zHD.median())
+    assert s['std'] == pytest.approx(np.std(df.zHD))
+    assert s['y_mean'] == pytest.approx(df.mB.mean()) and s['y_median'] == pytest.approx(df.mB.median())
+    assert s['counts'] == np.histogram(df.zHD, bins)[0].tolist()
+    inbin = np.digitize(df.zHD, bins) - 1
+    expected = [np.median(df.mB[inbin == i]) if (inbin == i).any() else None for i in range(10)]
+    assert s['binned_median'] == pytest.approx(expected)
+
+
+def test_text(fitres):
+    out = run_plotter('@@FITRES', fitres, '@@VARIABLE', 'df.zHD', '@@STATS', '@@NOCACHE')
+    assert out.returncode == 0, out.stderr
+    assert "The Median value for  base.FITRES  is: %s" % read_original(fitres).zHD.median() in out.stdout
+    assert 'Plotting now!' not in out.stdout
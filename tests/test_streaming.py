@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import run_plotter
+import loader
+import sketches
+import streaming
+
+
+@pytest.mark.parametrize('chunksize', [700, 100000])
+def test_median_of_x_outside_the_bins(fitres, chunksize):
+    plotdic = {'x': 'df.zHD'}
+    summary = streaming.summarise(fitres, plotdic, np.linspace(0.2, 0.3, 11), CHUNKSIZE=chunksize)
+    x = loader.load_fitres(fitres, plotdic, USECACHE=False).x_plot_val
+    assert summary.median() == pytest.approx(np.median(x), abs=2*sketches.ACCURACY*np.ptp(x))
+    assert summary.mean() == pytest.approx(np.mean(x))
+    assert summary.std() == pytest.approx(np.std(x))
+
+
+def test_plot_values_line_up_by_row(fitres, variant):
+    plotdic = {'x': 'df.zHD', 'y': 'df.mB'}
+    cut = "df.loc[df.FITPROB > 0.3]"
+    bins = np.linspace(0, 1, 11)
+    a, b = [streaming.summarise(f, plotdic, bins, YRANGE=[10., 30.], CUT=cut, CHUNKSIZE=1000) for f in (fitres, variant)]
+    da, db = [loader.load_fitres(f, plotdic, cut, USECACHE=False) for f in (fitres, variant)]
+    assert a.complete and b.complete
+    pd.testing.assert_series_equal(a.x_plot_val, da.x_plot_val)
+    pd.testing.assert_series_equal(a.y_plot_val - b.y_plot_val, da.y_plot_val - db.y_plot_val) #What DIFF ALL plots
+
+
+def stats(*args):
+    out = run_plotter(*args, '@@STATS', 'json', '@@NOCACHE')
+    assert out.returncode == 0, out.stderr
+    return json.loads(out.stdout)
+
+
+@pytest.mark.parametrize('bounds', [[], ['@@BOUNDS', '0.1', '0.6', '0.05', ':', '17', '23', '0.1']])
+@pytest.mark.parametrize('variable', ['df.zHD', 'df.zHD:df.mB - 3.1*df.c'])
+def test_same_stats_as_in_memory(fitres, variant, bounds, variable):
+    args = ['@@FITRES', fitres, variant, '@@VARIABLE', variable, '@@CUT', 'df.loc[df.FITPROB > 0.05]'] + bounds
+    memory, streamed = stats(*args), stats(*args, '@@STREAM', '700')
+    assert streamed['bins'] == pytest.approx(memory['bins'])
+    for name, expected in memory['files'].items():
+        got = streamed['files'][name]
+        assert got['n'] == expected['n']
+        assert got['counts'] == expected['counts']
+        assert got['mean'] == pytest.approx(expected['mean']) and got['std'] == pytest.approx(expected['std'])
+        assert got['median'] == pytest.approx(expected['median'], abs=1e-3)
+        if 'binned_median' in expected:
+            assert got['y_median'] == pytest.approx(expected['y_median']) #Every row is in the sample
+            assert [m is None for m in got['binned_median']] == [m is None for m in expected['binned_median']]
+            medians = np.array([np.nan if m is None else m for m in expected['binned_median']])
+            if bounds: medians = np.clip(medians, 17, 23) #Medians off the plot come out on its edge
+            np.testing.assert_allclose([np.nan if m is None else m for m in got['binned_median']], medians, rtol=0, atol=2e-3)
+
+
+def test_sample_for_scatter(fitres):
+    summary = streaming.summarise(fitres, {'x': 'df.zHD', 'y': 'df.mB'}, np.linspace(0, 1, 11), NPOINTS=500, YRANGE=[10., 30.], CHUNKSIZE=300)
+    whole = loader.load_fitres(fitres, {'x': 'df.zHD', 'y': 'df.mB'}, USECACHE=False)
+    assert not summary.complete and summary.n == len(whole)
+    assert len(summary.x_plot_val) == 500 and summary.x_plot_val.index.is_monotonic_increasing
+    pd.testing.assert_series_equal(summary.y_plot_val, whole.y_plot_val.loc[summary.y_plot_val.index])
+    assert summary.x_plot_val.index.max() > 0.8*len(whole) #From the whole file, not just the top
+
+
+def test_diff_cid_keeps_every_row(fitres):
+    plotdic = {'x': 'df.zHD', 'y': 'df.mB'}
+    got = streaming.summarise(fitres, plotdic, np.linspace(0, 1, 11), DIFF='CID', CUT='df.loc[df.c > 0]', CHUNKSIZE=999)
+    expected = loader.load_fitres(fitres, plotdic, 'df.loc[df.c > 0]', DIFF='CID', USECACHE=False)
+    pd.testing.assert_frame_equal(got, expected[got.columns])
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import read_original
+import histograms
+import loader
+import sketches
+import streaming
+import watch
+
+PLOTDIC = {'x': 'df.zHD', 'y': 'df.mB'}
+BINS = np.linspace(0, 1, 21)
+
+
+@pytest.fixture
+def growing(fitres, tmp_path):
+    """A file that gets written a bit at a time: write(n) leaves it with the header, the first n rows, and half of the next one."""
+    with open(fitres, 'rb') as fp:
+        lines = fp.readlines()
+    first = next(i for i, line in enumerate(lines) if line.startswith(b'SN:'))
+    filename = str(tmp_path / 'growing.FITRES')
+    def write(n):
+        with open(filename, 'wb') as fp:
+            fp.write(b''.join(lines[:first + n]) + lines[first + n][:20])
+    write.filename = filename
+    return write
+
+
+def expected(filename, nrows, cut=None):
+    df = loader.plot_values(read_original(filename).head(nrows), PLOTDIC, cut)
+    return df, histograms.BinnedData(df.x_plot_val, BINS, df.y_plot_val)
+
+
+def same(summary, df, binned):
+    assert summary.n == len(df)
+    np.testing.assert_array_equal(summary.hist_counts(), binned.hist_counts())
+    np.testing.assert_allclose(summary.binned_median(), binned.binned_median(), rtol=0, atol=2*sketches.ACCURACY*np.ptp(df.y_plot_val))
+    pd.testing.assert_series_equal(summary.y_plot_val, df.y_plot_val)
+
+
+def test_only_new_rows_added(growing, fitres, monkeypatch):
+    cut = "df.loc[df.FITPROB > 0.2]"
+    tail = watch.Tail(growing.filename, PLOTDIC, cut)
+    growing(1000)
+    assert tail.poll() == 1000
+    summary = tail.summary(BINS)
+    same(summary, *expected(fitres, 1000, cut))
+    added = []
+    add = streaming.StreamSummary.add
+    monkeypatch.setattr(streaming.StreamSummary, 'add', lambda self, idx, *args: added.append(len(idx)) or add(self, idx, *args))
+    growing(3000)
+    assert tail.poll() == 2000
+    assert tail.summary(BINS) is summary #Carried on, not made again
+    assert sum(added) == len(expected(fitres, 3000, cut)[0]) - len(expected(fitres, 1000, cut)[0])
+    same(summary, *expected(fitres, 3000, cut))
+    assert tail.poll() == 0
+
+
+def test_bins_moving(growing, fitres):
+    tail = watch.Tail(growing.filename, PLOTDIC)
+    growing(1000)
+    tail.poll()
+    tail.summary(BINS)
+    growing(2500)
+    tail.poll()
+    bins = np.linspace(*tail.xrange, 30) #Loose bounds grow with the file
+    df = expected(fitres, 2500)[0]
+    same(tail.summary(bins), df, histograms.BinnedData(df.x_plot_val, bins, df.y_plot_val))
+
+
+def test_rewritten(growing, fitres):
+    tail = watch.Tail(growing.filename, PLOTDIC)
+    growing(3000)
+    tail.poll()
+    tail.summary(BINS)
+    growing(500) #A job restarted
+    assert tail.poll() == -1
+    same(tail.summary(BINS), *expected(fitres, 500))
+
+
+def test_whole_file_cut(growing, fitres):
+    cut = "df.loc[df.mB < df.mB.median()]"
+    tail = watch.Tail(growing.filename, PLOTDIC, cut)
+    assert not tail.rowwise
+    growing(1000)
+    tail.poll()
+    growing(2000)
+    tail.poll()
+    columns = ['x_plot_val', 'y_plot_val']
+    pd.testing.assert_frame_equal(loader.plot_values(tail.table(), PLOTDIC, cut)[columns], expected(fitres, 2000, cut)[0][columns])
+
+
+@pytest.mark.parametrize('DIFF', [None, 'ALL', 'CID'])
+def test_draw(fitres, variant, DIFF, tmp_path):
+    import matplotlib.pyplot as plt
+    tails = [watch.Tail(f, PLOTDIC, "df.loc[df.FITPROB > 0.1]", DIFF) for f in (fitres, variant)]
+    for tail in tails:
+        tail.poll()
+    plt.figure()
+    assert watch.draw(tails, ['a', 'b'], PLOTDIC, {}, DIFF, "df.loc[df.FITPROB > 0.1]", 0.3, True, -1, False, ERRORS=20)
+    plt.savefig(str(tmp_path / 'watch.png'))
+    plt.close('all')
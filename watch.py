@@ -0,0 +1,243 @@
+"""
+Watch mode (@@WATCH): keep a plot up to date while the FITRES files are still being written.
+
+Each file is read once, and after that only the rows that have been added since the last look get
+parsed: we remember the byte offset just past the last complete row, and next time carry on from
+there. A row that's only half written is left for the next time around. The figure (or the @@SAVE file)
+is redrawn every @@WATCH seconds, whenever something has changed.
+
+Only the new rows go through the cut and the expressions, and their plotted values are added to a
+streaming.StreamSummary of the file, which keeps the counts in the plot bins and quantile sketches of y
+in each bin (see sketches.py), so redrawing doesn't go back over the rows that were already there. The
+summary keeps every point too, for drawing them and for DIFF ALL and DIFF CID. With loose bounds the
+bins move as the range of x grows, and then the summary is made again from the points it holds, without
+redoing the cut or the expressions. A @@CUT that needs the whole file at once (see expressions.is_rowwise)
+is redone on every row each time.
+
+If a file is replaced or cut short (a job restarted, say), which shows up as a different inode, a
+smaller size, or the bytes before our offset not being the same any more, it gets read again from the
+start, and its summary started again. Gzipped files can't be carried on from the middle, so they're read
+again whenever they change.
+"""
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+
+import fitres_reader
+import expressions
+import loader
+import plots
+import rendering
+import sketches
+import streaming
+
+INTERVAL = 10. #Seconds between looks at the files
+SIGNATURE = 64 #Bytes before the offset that have to stay the same for the file to count as only appended to
+
+
+class Tail:
+    """
+    One FITRES file being watched: the summary of the rows read so far (or the rows themselves, for a cut that
+    needs the whole file), and where to carry on reading from.
+    """
+    def __init__(self, filename, plotdic, CUT=None, DIFF=None, ACCURACY=sketches.ACCURACY):
+        self.filename = filename
+        self.plotdic = plotdic
+        self.CUT = CUT
+        self.DIFF = DIFF
+        self.accuracy = ACCURACY
+        self.rowwise = not CUT or expressions.is_rowwise(CUT)
+        self.wanted = expressions.referenced_columns(list(plotdic.values()) + [CUT])
+        if (self.wanted is not None) and DIFF: self.wanted.add('CID')
+        self.optional = ('IDSURVEY',) if DIFF == 'CID' else ()
+        self.reset()
+
+    def reset(self):
+        self.names = None
+        self.columns = None
+        self.offset = 0
+        self.signature = b''
+        self.stamp = None
+        self.chunks = [] #Only kept for a cut that needs the whole file
+        self.nrows = 0
+        self.pending = [] #Plotted values of the rows that haven't gone in the summary yet
+        self._summary = None
+        self.xrange = None #Lowest and highest x that passed the cut
+
+    def _add(self, df):
+        """Adds newly read rows."""
+        self.nrows += len(df)
+        if not self.rowwise:
+            self.chunks.append(df)
+            return
+        idx, x, y, cid = streaming.values(df, self.plotdic, self.CUT, self.DIFF)
+        if len(x) == 0:
+            return
+        self.pending.append((idx, x, y, cid))
+        lo, hi = np.amin(x), np.amax(x)
+        self.xrange = [lo, hi] if self.xrange is None else [min(lo, self.xrange[0]), max(hi, self.xrange[1])]
+
+    def summary(self, bins):
+        """
+        streaming.StreamSummary of every row that passed the cut so far, in bins. Only the rows read since the last
+        call get added, unless bins isn't what it was last time, when it's made again from the points it holds.
+        """
+        if self._summary is None or not np.array_equal(self._summary.bins, bins):
+            old = self._summary
+            self._summary = streaming.StreamSummary(bins, len(self.plotdic) == 2, np.inf, keep_cid=(self.DIFF == 'CID'), accuracy=self.accuracy)
+            if old is not None and old.keep_cid:
+                self.pending = [(idx, x, y, cid) for idx, cid, x, y in old.kept] + self.pending
+            elif old is not None and old.n:
+                idx, x, y = old.sample #Every point, in the order they went in, since nothing gets thrown out of a sample of np.inf points
+                self.pending = [(idx, x, y if len(self.plotdic) == 2 else None, None)] + self.pending
+        for idx, x, y, cid in self.pending:
+            self._summary.add(idx, x, y, cid)
+        self.pending = []
+        return self._summary
+
+    def _rewritten(self, st):
+        """True if filename is no longer the file we've been reading, plus rows."""
+        if self.stamp is None:
+            return False
+        if st.st_ino != self.stamp[0] or st.st_size < self.offset:
+            return True
+        with open(self.filename, 'rb') as fp:
+            fp.seek(self.offset - len(self.signature))
+            return fp.read(len(self.signature)) != self.signature
+
+    def poll(self):
+        """Reads whatever has been added to the file since the last poll. Returns the number of new rows (-1 if it was read again from the start)."""
+        st = os.stat(self.filename)
+        if self.stamp is not None and (st.st_ino, st.st_size, st.st_mtime_ns) == self.stamp:
+            return 0
+        if fitres_reader.is_gzipped(self.filename):
+            return self._reload_gz(st)
+        reloaded = self._rewritten(st)
+        if reloaded:
+            print(self.filename.split("/")[-1], "has been rewritten, reading it again from the start.")
+            self.reset()
+        with open(self.filename, 'rb') as fp:
+            fp.seek(self.offset)
+            block = fp.read(st.st_size - self.offset)
+        end = block.rfind(b'\n') + 1 #Anything after the last newline is a row that's still being written
+        start = 0
+        if self.names is None:
+            start = self._header(block[:end])
+            if start is None: #No rows yet, so try the whole header again next time
+                return -1 if reloaded else 0
+        new = 0
+        if end > start:
+            df = fitres_reader.read_body(io.BytesIO(block[start:end]), self.names, self.columns)
+            df.index += self.nrows #Row numbers carry on through the file, like they do when it's read in one go
+            self._add(df)
+            new = len(df)
+        self.offset += end
+        self.signature = block[max(0, end - SIGNATURE):end]
+        self.stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+        return -1 if reloaded else new
+
+    def _header(self, block):
+        """Column names from the header in block. Returns where the first row starts, or None if there isn't one yet."""
+        pos = 0
+        names = None
+        for line in io.BytesIO(block):
+            if line.startswith(b'VARNAMES:'):
+                names = line.decode('utf-8', 'replace').replace(',', ' ').split()
+            elif line.startswith(fitres_reader.DATA_PREFIXES):
+                if names is None:
+                    raise ValueError("Couldn't find VARNAMES in " + self.filename)
+                self.names = names
+                self.columns = expressions.project(self.wanted, names, self.optional)
+                return pos
+            pos += len(line)
+        return None
+
+    def _reload_gz(self, st):
+        try:
+            names, body = fitres_reader.open_fitres(self.filename)
+            columns = expressions.project(self.wanted, names, self.optional)
+            df = fitres_reader.read_body(body, names, columns)
+        except (EOFError, OSError): #Still being written
+            return 0
+        self.reset()
+        self.names, self.columns = names, columns
+        self._add(df)
+        self.stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+        return -1
+
+    def table(self):
+        """Every row read so far, as one dataframe, for a cut that needs the whole file."""
+        if len(self.chunks) > 1:
+            self.chunks = [pd.concat(self.chunks)]
+        if not self.chunks:
+            return pd.DataFrame(columns=self.columns or [])
+        return self.chunks[0]
+
+
+def draw(tails, keynames, plotdic, boundsdic, DIFF, CUT, ALPHA, BANDS, RASTER, CONTOUR, ERRORS=0, SEED=0):
+    """Redraws the current figure from everything read so far. Returns False if there's nothing to draw yet."""
+    import matplotlib.pyplot as plt
+    boundsdic = dict(boundsdic)
+    MASTERLIST = {}
+    for keyname, tail in zip(keynames, tails):
+        if tail.nrows == 0:
+            continue
+        if tail.rowwise:
+            if tail.xrange is None: #Nothing has passed the cut yet
+                continue
+            MASTERLIST[keyname] = tail #Summarised once the bins are known
+            boundsdic[keyname+"_min"], boundsdic[keyname+"_max"] = tail.xrange
+            continue
+        df = loader.plot_values(tail.table(), plotdic, CUT, tail.filename)
+        if len(df) == 0:
+            continue
+        df['name'] = keyname
+        MASTERLIST[keyname] = df
+        boundsdic[keyname+"_min"] = df['x_plot_val'].min()
+        boundsdic[keyname+"_max"] = df['x_plot_val'].max()
+    if not MASTERLIST or (DIFF and len(MASTERLIST) < 2):
+        return False
+    bins = plots.get_bins(boundsdic)
+    for keyname, k in MASTERLIST.items():
+        if isinstance(k, Tail):
+            summary = k.summary(bins)
+            MASTERLIST[keyname] = summary.frame() if summary.keep_cid else summary #DIFF CID joins on the rows themselves
+    plt.clf()
+    plots.plotter_func(MASTERLIST, DIFF, plotdic, boundsdic, CUT, ALPHA, BANDS, RASTER, CONTOUR, ERRORS, SEED)
+    return True
+
+
+def run(filenames, keynames, plotdic, boundsdic, DIFF=None, CUT=None, ALPHA=0.3, BANDS=False, RASTER=rendering.RASTER, CONTOUR=False, SAVE='None',
+        INTERVAL=INTERVAL, ERRORS=0, SEED=0, ACCURACY=sketches.ACCURACY):
+    """Watches filenames, redrawing every INTERVAL seconds when they've changed, until ^C (or the window is closed)."""
+    import matplotlib.pyplot as plt
+    tails = [Tail(l, plotdic, CUT, DIFF, ACCURACY) for l in filenames]
+    interactive = SAVE == 'None'
+    if interactive: plt.ion()
+    fig = plt.figure()
+    print("Watching", len(tails), "files every", INTERVAL, "seconds. ^C to stop.")
+    try:
+        while True:
+            changed = False
+            for keyname, tail in zip(keynames, tails):
+                try:
+                    new = tail.poll()
+                except FileNotFoundError: #Not there yet, or being replaced
+                    continue
+                if new:
+                    changed = True
+                    print(time.strftime('%H:%M:%S'), keyname + ":", ("%d new rows" % new) if new > 0 else "read again", "-", tail.nrows, "rows in all")
+            if changed and draw(tails, keynames, plotdic, boundsdic, DIFF, CUT, ALPHA, BANDS, RASTER, CONTOUR, ERRORS, SEED) and not interactive:
+                fig.savefig(SAVE + '.tmp', bbox_inches="tight", format=SAVE.split(".")[-1])
+                os.replace(SAVE + '.tmp', SAVE) #So whatever's looking at it never sees half an image
+            if interactive:
+                if not plt.fignum_exists(fig.number):
+                    break
+                plt.pause(INTERVAL)
+            else:
+                time.sleep(INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    print("Stopped watching.")